@@ -0,0 +1,106 @@
+import os, argparse
+import pandas as pd
+from pathlib import Path
+from intervals import snap_to_interval
+from dataset_schema import FULL_DATASET, table_path, read_table
+from pairing import pair_readings
+
+DATA_FOLDER = Path(os.getcwd()) / "data"
+SUMMARY_FOLDER = Path(os.getcwd()) / "summaries"
+HOURLY_FILE = Path(os.getcwd()) / "hourly_data.csv"
+LOCATION_DETAILS_FILE = Path(os.getcwd()) / "location_details.csv"
+DAILY_FILE = Path(os.getcwd()) / "daily_data.csv"
+
+INTERVAL_HOURS = range(8, 21, 2) # 8:00 - 20:00, the hours readings are taken
+WEATHER_CONDITIONS = ["Clear Skies", "Partially Cloudy", "Overcast"]
+SOLAR_NOON = 12
+
+def load_hourly_data(hourly_file: Path = HOURLY_FILE, location_file: Path = LOCATION_DETAILS_FILE, daily_file: Path = DAILY_FILE) -> pd.DataFrame:
+    """Combine the manually recorded spreadsheets into a single table.
+
+    :param hourly_file: Angled & Flat readings per location (hourly_data.csv)
+    :param location_file: shade category of each location (location_details.csv)
+    :param daily_file: weather of each recording session (daily_data.csv)
+    :return: one row per reading with its interval, category, and weather
+    """
+    hourly = pd.read_csv(hourly_file)
+    hourly["Hour"] = snap_to_interval(pd.to_datetime(hourly["Date"] + " " + hourly["Time"], format="mixed"))
+
+    locations = pd.read_csv(location_file)[["Location", "Category"]]
+    combined = pd.merge(hourly, locations, on="Location", how="left")
+
+    if daily_file.exists():
+        daily = pd.read_csv(daily_file)
+        daily["Hour"] = snap_to_interval(pd.to_datetime(daily["Date"] + " " + daily["Time"], format="mixed"))
+        combined = pd.merge(combined, daily[["Hour", "Weather"]].drop_duplicates("Hour"), on="Hour", how="left")
+
+    return combined
+
+def load_enriched_data(dataset_file: Path = table_path("full_dataset", DATA_FOLDER), location_file: Path = LOCATION_DETAILS_FILE) -> pd.DataFrame:
+    """Prepare the dataset built by enrich_data.py for aggregation. Angled & flat readings are paired by recording order.
+
+    :param dataset_file: combined dataset
+    :param location_file: shade category of each location (location_details.csv)
+    :return: one row per angled/flat pair with its interval, category, and weather
+    """
+    dataset = read_table(dataset_file, FULL_DATASET, memory_map=True)
+    pairs, _ = pair_readings(dataset)
+    pairs = pairs.rename(columns={"location": "Location", "sky": "Weather"})
+    pairs["Hour"] = snap_to_interval(pairs["timestamp"])
+
+    locations = pd.read_csv(location_file)[["Location", "Category"]]
+    return pd.merge(pairs, locations, on="Location", how="left")
+
+def summarize(data: pd.DataFrame, by: list[str], value_columns: tuple[str, ...]) -> pd.DataFrame:
+    """Average, count, and variance of each value column for every group in a single grouped pass.
+
+    :param data: readings to aggregate
+    :param by: columns defining the groups
+    :param value_columns: columns to aggregate
+    :return: one row per group. means keep the column name, the others are suffixed with _count & _var
+    """
+    summary = data.groupby(by, observed=True, sort=True)[list(value_columns)].agg(["mean", "count", "var"])
+    summary.columns = [column if stat == "mean" else f"{column}_{stat}" for column, stat in summary.columns]
+    return summary.reset_index()
+
+def build_summaries(data: pd.DataFrame, value_columns: tuple[str, ...] = ("Flat", "Angled")) -> dict[str, pd.DataFrame]:
+    """Compute every table used by the graphs.
+
+    :param data: readings with Hour, Category, and Weather columns
+    :param value_columns: columns to aggregate
+    :return: summary tables by name
+    """
+    data = data[data["Hour"].dt.hour.isin(INTERVAL_HOURS)].copy()
+    data["Time"] = data["Hour"].dt.strftime("%H:%M:%S") # time of day, shared across dates
+
+    summaries = {
+        "interval_averages": summarize(data, ["Time"], value_columns).assign(Category="All"),
+        "category_interval_averages": summarize(data, ["Category", "Time"], value_columns),
+        "category_noon_averages": summarize(data[data["Hour"].dt.hour == SOLAR_NOON], ["Category", "Hour"], value_columns).rename(columns={"Hour": "Time"})
+    }
+    if "Weather" in data:
+        weather = summarize(data[data["Weather"].isin(WEATHER_CONDITIONS)], ["Weather", "Time"], value_columns)
+        if {"Angled", "Flat"}.issubset(value_columns):
+            weather["Ratio"] = weather["Angled"] / weather["Flat"]
+        summaries["weather_interval_averages"] = weather
+
+    return summaries
+
+def write_summaries(summaries: dict[str, pd.DataFrame], summary_folder: Path = SUMMARY_FOLDER) -> None:
+    """Store each summary as a CSV the R scripts can read.
+
+    :param summaries: summary tables by name
+    :param summary_folder: destination folder
+    """
+    summary_folder.mkdir(parents=True, exist_ok=True)
+    for name, summary in summaries.items():
+        summary.to_csv(summary_folder / f"{name}.csv", index=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the averages plotted by the scripts in graphs/.")
+    parser.add_argument("--source", choices=["hourly", "enriched"], default="hourly", help="manual spreadsheets or the dataset from enrich_data.py")
+    args = parser.parse_args()
+
+    data = load_hourly_data() if args.source == "hourly" else load_enriched_data()
+    write_summaries(build_summaries(data))
+    print("Summaries written to", SUMMARY_FOLDER)
@@ -0,0 +1,109 @@
+import sys, json, time, argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent)) # scripts live in the repository root
+
+from transcription_parser import TranscriptionParser, FIELDS
+
+CORPUS_FILE = Path(__file__).resolve().parent / "transcription_corpus.json"
+
+def load_corpus(corpus_path: Path = CORPUS_FILE) -> list[dict]:
+    with open(corpus_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def check_corpus(parser: TranscriptionParser, corpus: list[dict]) -> list[str]:
+    """Compare the parser's output against the expected values of every corpus entry.
+
+    :param parser: parser under test
+    :param corpus: recorded transcriptions with their expected values
+    :return: a description of each mismatch
+    """
+    mismatches = []
+    vectorized = parser.parse_many([str(i) for i in range(len(corpus))], [entry["detection"] for entry in corpus])
+    for i, entry in enumerate(corpus):
+        single = parser.parse(str(i), entry["detection"])
+        for field in FIELDS:
+            expected = entry["expected"][field]
+            if single[field] != expected:
+                mismatches.append(f"{entry['description']}: parse gave {field}={single[field]}, expected {expected}")
+            if vectorized.loc[i, field] != expected:
+                mismatches.append(f"{entry['description']}: parse_many gave {field}={vectorized.loc[i, field]}, expected {expected}")
+    return mismatches
+
+def record_from_cache(parser: TranscriptionParser, cache_folder: Path, corpus_path: Path = CORPUS_FILE) -> int:
+    """Add real detections from the OCR cache to the corpus, using the current parser output as the expected values.
+
+    :param parser: parser whose output is recorded. review the additions before committing them
+    :param cache_folder: disc location of the OCR cache
+    :param corpus_path: corpus file to extend
+    :return: number of entries added
+    """
+    corpus = load_corpus(corpus_path)
+    known = {entry["detection"] for entry in corpus}
+    added = 0
+    for entry_path in sorted(cache_folder.glob("*/*.json")):
+        with open(entry_path, encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry["detection"] in known:
+            continue
+        result = parser.parse(entry["filename"], entry["detection"])
+        corpus.append({
+            "description": entry["filename"],
+            "source": f"recorded ({entry.get('model', 'unknown model')})",
+            "detection": entry["detection"],
+            "expected": {field: result[field] for field in FIELDS}
+        })
+        known.add(entry["detection"])
+        added += 1
+
+    with open(corpus_path, "w", encoding="utf-8") as f:
+        json.dump(corpus, f, indent=2, ensure_ascii=False)
+    return added
+
+def benchmark(parser: TranscriptionParser, corpus: list[dict], n_screenshots: int) -> dict:
+    """Time the per-screenshot and vectorized parsers over the corpus repeated to the requested size.
+
+    :param parser: parser under test
+    :param corpus: recorded transcriptions
+    :param n_screenshots: number of screenshots to parse
+    :return: screenshots per second of each strategy
+    """
+    detections = [corpus[i % len(corpus)]["detection"] for i in range(n_screenshots)]
+    filenames = [str(i) for i in range(n_screenshots)]
+
+    start = time.perf_counter()
+    for filename, detection in zip(filenames, detections):
+        parser.parse(filename, detection)
+    single_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parser.parse_many(filenames, detections)
+    vectorized_elapsed = time.perf_counter() - start
+
+    return {
+        "screenshots": n_screenshots,
+        "parse_per_sec": n_screenshots / single_elapsed,
+        "parse_many_per_sec": n_screenshots / vectorized_elapsed
+    }
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Regression check and micro-benchmark for the transcription parser.")
+    arg_parser.add_argument("--screenshots", type=int, default=50_000, help="number of screenshots to parse in the benchmark")
+    arg_parser.add_argument("--record", type=Path, help="OCR cache folder to add real detections from")
+    args = arg_parser.parse_args()
+
+    parser = TranscriptionParser()
+    if args.record:
+        print(f"Added {record_from_cache(parser, args.record)} detections to the corpus.")
+
+    corpus = load_corpus()
+    recorded = sum(entry.get("source", "").startswith("recorded") for entry in corpus)
+    if recorded == 0:
+        print("The corpus holds hand-written transcriptions only. Add real detections with --record data/ocr_cache")
+    mismatches = check_corpus(parser, corpus)
+    for mismatch in mismatches:
+        print("MISMATCH", mismatch)
+    print(f"Corpus: {len(corpus) - len({m.split(':')[0] for m in mismatches})}/{len(corpus)} entries match ({recorded} recorded from real screenshots)")
+
+    print(json.dumps(benchmark(parser, corpus, args.screenshots)))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,174 @@
+import sys, json, time, platform, argparse, tempfile, statistics, subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent)) # scripts live in the repository root
+
+import pandas as pd
+from synthetic import generate_screenshots, generate_readings, generate_locations, generate_weather, generate_detections
+from bench_transcription_parser import load_corpus
+from transcription_parser import TranscriptionParser
+from metadata import extract_metadata_fast
+from visualcrossing import VisualCrossingClient
+from intervals import snap_to_interval
+from location_labels import add_location_labels
+from weather_archive import WeatherArchive
+
+RESULTS_FOLDER = Path(__file__).resolve().parent / "results"
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+DATA_TYPES = ["cloudcover", "solarradiation"]
+
+def time_call(function, repeat: int) -> list[float]:
+    """Run a function several times and record the seconds each run took."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def bench_parse(size: int, workdir: Path) -> tuple[callable, int]:
+    """OCR parse throughput over recorded corpus detections mixed with synthetic ones."""
+    parser = TranscriptionParser()
+    recorded = [entry["detection"] for entry in load_corpus()]
+    filenames, detections = generate_detections(size)
+    detections = [recorded[i % len(recorded)] if i % 10 == 0 else detection for i, detection in enumerate(detections)] # 1 in 10 is a recorded layout
+    return lambda: parser.parse_many(filenames, detections), size
+
+def bench_metadata(size: int, workdir: Path) -> tuple[callable, int]:
+    """XMP DateCreated extraction from synthetic PNGs. size is the number of screenshots."""
+    folder = workdir / f"screenshots_{size}"
+    if not folder.exists():
+        generate_screenshots(folder, size, width=390, height=844) # smaller images keep setup quick. chunks are skipped, not decoded
+    return lambda: extract_metadata_fast(folder), size
+
+def bench_snap(size: int, workdir: Path) -> tuple[callable, int]:
+    """Interval snapping of reading timestamps."""
+    timestamps = generate_readings(size)["timestamp"]
+    return lambda: snap_to_interval(timestamps), size
+
+def bench_merge(size: int, workdir: Path) -> tuple[callable, int]:
+    """Joining readings to an archive that already holds their weather. No request is ever made."""
+    readings = generate_readings(size)
+    archive_path = workdir / f"merge_{size}.sqlite"
+    client = VisualCrossingClient("no-key", "00000", DATA_TYPES, archive_path, base_address="http://127.0.0.1:9")
+    if len(client.archive) == 0:
+        client.update_archive(generate_weather(readings["timestamp"].min(), readings["timestamp"].max()))
+    return lambda: client.utilize_existing_cache(readings), size
+
+def bench_label(size: int, workdir: Path) -> tuple[callable, int]:
+    """Nearest location labeling."""
+    locations = generate_locations()
+    readings = generate_readings(size, locations)
+    return lambda: add_location_labels(readings, locations), size
+
+def bench_archive_write(size: int, workdir: Path) -> tuple[callable, int]:
+    """Upserting hourly weather rows into a fresh SQLite archive. size is the number of hours."""
+    weather = generate_weather(pd.Timestamp("2000-01-01"), pd.Timestamp("2000-01-01") + pd.Timedelta(hours=size - 1))
+    paths = iter(workdir / f"write_{size}_{i}.sqlite" for i in range(1_000))
+    def write():
+        archive = WeatherArchive(next(paths))
+        archive.append(weather)
+        archive.close()
+    return write, len(weather)
+
+def bench_archive_read(size: int, workdir: Path) -> tuple[callable, int]:
+    """Reading the archived hours of a season's readings by exact timestamp."""
+    readings = generate_readings(size)
+    intervals = snap_to_interval(readings["timestamp"])
+    archive = WeatherArchive(workdir / f"read_{size}.sqlite")
+    if len(archive) == 0:
+        archive.append(generate_weather(readings["timestamp"].min(), readings["timestamp"].max()))
+    return lambda: archive.read(DATA_TYPES, timestamps=intervals), size
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "metadata": bench_metadata,
+    "snap": bench_snap,
+    "merge": bench_merge,
+    "label": bench_label,
+    "archive_write": bench_archive_write,
+    "archive_read": bench_archive_read
+}
+MAX_SIZES = {"metadata": 10_000} # files on disc. larger runs mostly measure the filesystem
+
+def environment() -> dict:
+    """Details needed to judge whether two result files are comparable."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "pandas": pd.__version__, "machine": platform.platform()}
+
+def run(names: list[str], sizes: list[int], repeat: int, workdir: Path) -> list[dict]:
+    """Run every benchmark at every size.
+
+    :param names: benchmarks to run
+    :param sizes: rows (or screenshots) per benchmark
+    :param repeat: timed runs per benchmark & size. the fastest is reported as the result
+    :param workdir: folder for generated screenshots & archives
+    :return: one result per benchmark & size
+    """
+    results = []
+    for name in names:
+        for size in sizes:
+            if size > MAX_SIZES.get(name, size):
+                continue
+            function, items = BENCHMARKS[name](size, workdir)
+            function() # warm up caches & lazy imports
+            timings = time_call(function, repeat)
+            result = {
+                "benchmark": name,
+                "size": size,
+                "best_seconds": min(timings),
+                "median_seconds": statistics.median(timings),
+                "items_per_sec": items / min(timings)
+            }
+            print(json.dumps(result))
+            results.append(result)
+    return results
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Find benchmarks that became slower than the baseline by more than the tolerance.
+
+    :param results: current results
+    :param baseline: results of an earlier run
+    :param tolerance: allowed slowdown as a fraction (0.2 = 20% slower)
+    :return: a description of each regression
+    """
+    previous = {(result["benchmark"], result["size"]): result["best_seconds"] for result in baseline}
+    regressions = []
+    for result in results:
+        key = (result["benchmark"], result["size"])
+        if key in previous and result["best_seconds"] > previous[key] * (1 + tolerance):
+            regressions.append(f"{key[0]} @ {key[1]}: {previous[key]:.4f}s -> {result['best_seconds']:.4f}s")
+    return regressions
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark the hot paths on synthetic data. No network access is needed.")
+    arg_parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (defaults to all)")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="rows per benchmark (up to 10^7)")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark & size")
+    arg_parser.add_argument("--output", type=Path, help="results file (defaults to results/<commit>.json)")
+    arg_parser.add_argument("--baseline", type=Path, help="earlier results file to compare against")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = arg_parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        arg_parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    env = environment()
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run(args.benchmarks or list(BENCHMARKS), args.sizes, args.repeat, Path(workdir))
+
+    output = args.output or RESULTS_FOLDER / f"{env['commit'] or 'results'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"environment": env, "results": results}, f, indent=2)
+    print("Results written to", output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        sys.exit(1 if regressions else 0)
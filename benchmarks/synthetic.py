@@ -0,0 +1,139 @@
+import json, struct, zlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from study_site import SITE_LATITUDE, SITE_LONGITUDE
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+XMP_KEY = "XML:com.adobe.xmp"
+
+SEASON_START = pd.Timestamp("2024-06-01")
+SEASON_DAYS = 150
+READING_HOURS = np.arange(8, 21) # readings are taken between 8:00 and 20:00
+FAILURE_RATE = 0.02 # share of readings whose coordinates failed extraction (recorded as -1)
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+def xmp_packet(created: pd.Timestamp) -> str:
+    """XMP block in the layout SPARKvue screenshots carry, with the capture time as photoshop:DateCreated."""
+    return (
+        '<?xpacket begin="﻿" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description rdf:about="" xmlns:photoshop="http://ns.adobe.com/photoshop/1.0/" xmlns:exif="http://ns.adobe.com/exif/1.0/">'
+        f'<photoshop:DateCreated>{created.strftime("%Y-%m-%dT%H:%M:%S")}</photoshop:DateCreated>'
+        '<exif:UserComment>Screenshot</exif:UserComment>'
+        '</rdf:Description></rdf:RDF></x:xmpmeta><?xpacket end="w"?>'
+    )
+
+def write_png(path: Path, created: pd.Timestamp, width: int = 1170, height: int = 2532, xmp_after_image: bool = False, seed: int = 0) -> Path:
+    """Write a phone-sized grayscale PNG with an XMP iTXt chunk, built directly with struct & zlib.
+
+    :param path: destination
+    :param created: capture time stored as photoshop:DateCreated
+    :param width: image width in pixels (defaults to a phone screenshot)
+    :param height: image height in pixels
+    :param xmp_after_image: place the XMP chunk after the image data, so readers have to skip it
+    :param seed: seed of the pixel noise that keeps the image data from compressing to nothing
+    :return: the destination
+    """
+    rng = np.random.default_rng(seed)
+    pixels = np.full((height, width), 235, dtype=np.uint8)
+    pixels[:, ::37] = rng.integers(0, 255, size=(height, len(range(0, width, 37))), dtype=np.uint8)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels]).tobytes() # filter byte 0 before each row
+
+    header = _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+    xmp = _chunk(b"iTXt", XMP_KEY.encode("latin-1") + b"\x00\x00\x00\x00\x00" + xmp_packet(created).encode("utf-8"))
+    image = _chunk(b"IDAT", zlib.compress(raw, 6))
+    chunks = [header, image, xmp] if xmp_after_image else [header, xmp, image]
+
+    path.write_bytes(PNG_SIGNATURE + b"".join(chunks) + _chunk(b"IEND", b""))
+    return path
+
+def generate_screenshots(folder: Path, n: int, seed: int = 0, **png_options) -> list[Path]:
+    """Fill a folder with synthetic screenshots taken across the season.
+
+    :param folder: destination folder (created when missing)
+    :param n: number of screenshots
+    :param seed: seed of the capture times
+    :param png_options: passed to write_png
+    :return: locations of the screenshots
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    timestamps = generate_timestamps(n, seed)
+    return [write_png(folder / f"IMG_{i:07d}.png", timestamp, seed=i, **png_options) for i, timestamp in enumerate(timestamps)]
+
+def generate_timestamps(n: int, seed: int = 0) -> pd.Series:
+    """Capture times spread over the reading hours of every day in the season."""
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, SEASON_DAYS, n).astype("timedelta64[D]")
+    hours = rng.choice(READING_HOURS, n).astype("timedelta64[h]")
+    seconds = rng.integers(0, 3600, n).astype("timedelta64[s]")
+    return pd.Series(np.datetime64(SEASON_START, "s") + days + hours + seconds, name="timestamp").astype("datetime64[ns]")
+
+def generate_locations(n: int = 12, seed: int = 0) -> pd.DataFrame:
+    """Named locations scattered within about a kilometre of the study site."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "name": [f"Location {i}" for i in range(n)],
+        "latitude": SITE_LATITUDE + rng.uniform(-0.005, 0.005, n),
+        "longitude": SITE_LONGITUDE + rng.uniform(-0.007, 0.007, n)
+    })
+
+def generate_readings(n: int, locations: pd.DataFrame | None = None, seed: int = 0) -> pd.DataFrame:
+    """Reading table shaped like the output of vision_ai.py joined with metadata.py.
+
+    Coordinates are scattered a few metres around known locations and a small share are recorded as failed (-1).
+
+    :param n: number of rows (10^3 - 10^7 are practical)
+    :param locations: locations the readings are taken at (defaults to generate_locations)
+    :param seed: seed of every random column
+    :return: filename, measurement, longitude, latitude, and timestamp of each reading
+    """
+    rng = np.random.default_rng(seed)
+    locations = generate_locations(seed=seed) if locations is None else locations
+    site = rng.integers(0, len(locations), n)
+    latitude = locations["latitude"].to_numpy()[site] + rng.normal(0, 0.00005, n)
+    longitude = locations["longitude"].to_numpy()[site] + rng.normal(0, 0.00005, n)
+    failed = rng.random(n) < FAILURE_RATE
+    latitude[failed] = -1
+    longitude[failed] = -1
+
+    return pd.DataFrame({
+        "filename": pd.Series(np.arange(n)).map("IMG_{:07d}.png".format).astype("category"),
+        "measurement": rng.uniform(5, 1100, n).astype("float32"),
+        "longitude": longitude,
+        "latitude": latitude,
+        "timestamp": generate_timestamps(n, seed)
+    })
+
+def generate_weather(start: pd.Timestamp, end: pd.Timestamp, seed: int = 0) -> pd.DataFrame:
+    """Hourly Visual Crossing style data covering a time range, for filling an archive without the API."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start.floor("D"), end.ceil("D"), freq="h")
+    return pd.DataFrame({
+        "timestamp": timestamps,
+        "cloudcover": rng.uniform(0, 100, len(timestamps)).round(1),
+        "solarradiation": rng.uniform(0, 1000, len(timestamps)).round(1)
+    })
+
+def make_detection(filename: str, measurement: float, latitude: float, longitude: float) -> str:
+    """Raw OpenOCR output ("<filename>\\t<json>") for a screenshot showing the given values."""
+    box = [[10, 10], [400, 10], [400, 60], [10, 60]]
+    regions = ["SPARKvue", f"Solar Irradiance {measurement:.1f} W/m²", f"Latitude {latitude:.6f}°", f"Longitude {longitude:.6f}°", "Pause"]
+    return f"{filename}\t" + json.dumps([{"transcription": text, "points": box, "score": 0.97} for text in regions], ensure_ascii=False)
+
+def generate_detections(n: int, seed: int = 0) -> tuple[list[str], list[str]]:
+    """Filenames and raw OpenOCR detections for synthetic readings.
+
+    :param n: number of screenshots
+    :param seed: seed of the readings
+    :return: filenames and detections
+    """
+    readings = generate_readings(n, seed=seed)
+    filenames = readings["filename"].astype(str).tolist()
+    detections = [
+        make_detection(*row)
+        for row in zip(filenames, readings["measurement"].tolist(), readings["latitude"].tolist(), readings["longitude"].tolist())
+    ]
+    return filenames, detections
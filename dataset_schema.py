@@ -0,0 +1,257 @@
+import os
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+from pathlib import Path
+
+DATA_FOLDER = Path(os.getcwd()) / "data"
+TABLE_FORMAT = "parquet" # format of every table written by the scripts. feather is also supported
+UTC_OFFSET = r"(?:Z|[+-]\d{2}:?\d{2})$" # trailing offset of an ISO 8601 timestamp
+
+### Column Types ###
+# categories for repeated strings, float32 for measurements, float64 for coordinates (float32 loses ~0.5 m)
+READINGS = {
+    "filename": "category",
+    "measurement": "float32",
+    "longitude": "float64",
+    "latitude": "float64"
+}
+
+FAILURES = {**READINGS, "detection": "string"}
+
+METADATA = {
+    "filename": "category",
+    "timestamp": "datetime64[ns]",
+    "mtime": "int64"
+}
+
+SKY = {
+    "timestamp": "datetime64[ns]",
+    "sky": "category"
+}
+
+LOCATIONS = {
+    "name": "category",
+    "latitude": "float64",
+    "longitude": "float64"
+}
+
+FULL_DATASET = {
+    "timestamp": "datetime64[ns]",
+    "location": "category",
+    "measurement": "float32",
+    "cloudcover": "float32",
+    "solarradiation": "float32",
+    "solar_altitude": "float32",
+    "solar_azimuth": "float32",
+    "clearsky_flat": "float32",
+    "clearsky_tilted": "float32",
+    "sky": "category",
+    "filename": "category",
+    "latitude": "float64",
+    "longitude": "float64"
+}
+
+# one row per angled/flat pair. weather & sun position are those of the angled reading
+PAIRS = {
+    **{column: dtype for column, dtype in FULL_DATASET.items() if column not in ("measurement", "filename", "latitude", "longitude")},
+    "Angled": "float32",
+    "Flat": "float32",
+    "seconds_apart": "float32",
+    "angled_filename": "category",
+    "flat_filename": "category",
+    "angled_latitude": "float64",
+    "angled_longitude": "float64",
+    "flat_latitude": "float64",
+    "flat_longitude": "float64"
+}
+
+# quality control flags of every reading in the full dataset. qc_flags is a QCFlag bitmask
+QC_FLAGS = {
+    "filename": "category",
+    "timestamp": "datetime64[ns]",
+    "location": "category",
+    "qc_flags": "uint8",
+    "issues": "category"
+}
+
+def table_path(name: str, folder: Path = DATA_FOLDER) -> Path:
+    """Location of a table written by the scripts.
+
+    :param name: table name without extension (ex: September, full_dataset)
+    :param folder: folder holding the table
+    :return: path with the extension of the current table format
+    """
+    return folder / f"{name}.{TABLE_FORMAT}"
+
+def apply_schema(df: pd.DataFrame, schema: dict[str, str]) -> pd.DataFrame:
+    """Convert columns to their schema type. Columns missing from the schema are left untouched.
+
+    Timestamps carrying a UTC offset keep their wall clock time so they line up with the local time archive. The offset is
+    dropped from each value before parsing, so a season crossing a daylight saving change (-05:00 and -06:00) still parses.
+
+    :param df: table to convert
+    :param schema: type of each column
+    :return: converted table
+    """
+    df = df.copy()
+    for column, dtype in schema.items():
+        if column not in df:
+            continue
+        if dtype.startswith("datetime64"):
+            timestamps = df[column]
+            if isinstance(timestamps.dtype, pd.DatetimeTZDtype):
+                timestamps = timestamps.dt.tz_localize(None)
+            elif not pd.api.types.is_datetime64_any_dtype(timestamps):
+                timestamps = pd.to_datetime(timestamps.astype("string").str.replace(UTC_OFFSET, "", regex=True), format="ISO8601")
+            df[column] = timestamps.astype(dtype)
+        elif dtype == "int64" and df[column].isna().any():
+            df[column] = df[column].astype("Int64")
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+def write_table(df: pd.DataFrame, path: Path, schema: dict[str, str] | None = None) -> None:
+    """Write a table in the format given by its extension (.parquet, .feather, or .csv). No index is stored.
+
+    :param df: table to write
+    :param path: destination
+    :param schema: type of each column (no conversion when not given)
+    """
+    if schema:
+        df = apply_schema(df, schema)
+    df = df.reset_index(drop=True)
+
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    elif path.suffix == ".feather":
+        df.to_feather(path)
+    elif path.suffix == ".csv":
+        df.to_csv(path, index=False)
+    else:
+        raise ValueError(f"Unsupported table format: {path.suffix}")
+
+def read_file(path: Path, columns: list[str] | None = None, memory_map: bool = False) -> pd.DataFrame:
+    """Read a single table file or partition as stored, ignoring any partitions that continue it."""
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path, columns=columns, memory_map=memory_map)
+    elif path.suffix == ".feather":
+        return feather.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+    elif path.suffix == ".csv":
+        df = pd.read_csv(path).drop(columns="Unnamed: 0", errors="ignore") # earlier versions stored the index
+        return df[columns] if columns else df
+    else:
+        raise ValueError(f"Unsupported table format: {path.suffix}")
+
+def _source_path(path: Path) -> Path:
+    """File holding a table. A CSV with the same name stands in for a missing file, unless the table is only partitions
+    (a chunked build exported with --csv writes that CSV next to them)."""
+    if not path.exists() and not partitions(partition_folder(path)) and path.with_suffix(".csv").exists():
+        return path.with_suffix(".csv")
+    return path
+
+def read_table(path: Path, schema: dict[str, str] | None = None, columns: list[str] | None = None, memory_map: bool = False) -> pd.DataFrame:
+    """Read a table written by write_table or by earlier versions of the scripts.
+
+    When the requested file does not exist and has no partitions, a CSV with the same name is read instead. Partitions in the table's partition
+    folder (rows appended by ingest.py, or a whole chunked build) are read after the file, in write order.
+
+    :param path: table location
+    :param schema: type of each column. needed for CSV files, which do not store types
+    :param columns: columns to read (defaults to all)
+    :param memory_map: map the file into memory instead of reading it (parquet & feather only)
+    :return: the table
+    """
+    path = _source_path(path)
+
+    parts = partitions(partition_folder(path))
+    files = [path] + parts if path.exists() or not parts else parts
+    tables = [read_file(file, columns, memory_map) for file in files]
+    df = tables[0] if len(tables) == 1 else pd.concat(tables, ignore_index=True)
+
+    return apply_schema(df, schema) if schema else df
+
+def iter_table(path: Path, batch_rows: int, schema: dict[str, str] | None = None, columns: list[str] | None = None):
+    """Read a table, followed by its partitions, a batch of rows at a time. Only one batch is held in memory.
+
+    :param path: table location. falls back to a CSV with the same name, like read_table
+    :param batch_rows: most rows in a batch. parquet batches also end at row group boundaries, so some are smaller
+    :param schema: type of each column, applied to every batch
+    :param columns: columns to read (defaults to all)
+    :return: generator of batches in file order
+    """
+    path = _source_path(path)
+
+    for file in [path] * path.exists() + partitions(partition_folder(path)):
+        if file.suffix == ".csv":
+            batches = pd.read_csv(file, usecols=columns, chunksize=batch_rows)
+        elif file.suffix in (".parquet", ".feather"):
+            scanner = ds.dataset(file, format=file.suffix[1:]).scanner(columns=columns, batch_size=batch_rows)
+            batches = (batch.to_pandas() for batch in scanner.to_batches() if batch.num_rows > 0)
+        else:
+            raise ValueError(f"Unsupported table format: {file.suffix}")
+
+        for batch in batches:
+            batch = batch.drop(columns="Unnamed: 0", errors="ignore") # earlier versions stored the index
+            yield apply_schema(batch, schema) if schema else batch
+
+def partition_folder(path: Path) -> Path:
+    """Folder holding the partitions of a table (data/full_dataset/ for data/full_dataset.parquet)."""
+    return path.with_suffix("")
+
+def partition_path(folder: Path, index: int) -> Path:
+    """Location of one partition of a dataset written in chunks. Zero padding keeps name order equal to write order."""
+    return folder / f"part-{index:05d}.{TABLE_FORMAT}"
+
+def partitions(folder: Path) -> list[Path]:
+    """Partitions of a dataset in write order. A missing folder has none."""
+    return sorted(folder.glob("part-*.*")) if folder.is_dir() else []
+
+def next_partition(folder: Path) -> int:
+    """Index of the partition written after every existing one."""
+    parts = partitions(folder)
+    return int(parts[-1].stem.split("-")[1]) + 1 if parts else 0
+
+def clear_partitions(folder: Path) -> None:
+    """Remove the partitions of an earlier run so none of them outlive a smaller rewrite."""
+    for path in partitions(folder):
+        path.unlink()
+
+def write_partition(df: pd.DataFrame, folder: Path, index: int, schema: dict[str, str] | None = None) -> Path:
+    """Write one chunk of a partitioned dataset. Readers never see a partially written partition.
+
+    :param df: chunk to write
+    :param folder: dataset folder
+    :param index: position of the chunk within the dataset
+    :param schema: type of each column (no conversion when not given)
+    :return: location of the partition
+    """
+    path = partition_path(folder, index)
+    temp_path = folder / f".{path.name}" # hidden from partitions() until complete
+    folder.mkdir(parents=True, exist_ok=True)
+    write_table(df, temp_path, schema)
+    os.replace(temp_path, path)
+    return path
+
+def read_partitioned(folder: Path, schema: dict[str, str] | None = None, columns: list[str] | None = None) -> pd.DataFrame:
+    """Read every partition of a dataset, in write order, as a single table.
+
+    :param folder: dataset folder
+    :param schema: type of each column. categories are rebuilt over the whole dataset
+    :param columns: columns to read (defaults to all)
+    :return: the table
+    """
+    parts = [read_file(path, columns, memory_map=False) for path in partitions(folder)]
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns or list(schema or {}))
+    return apply_schema(df, schema) if schema else df
+
+def export_csv(path: Path, csv_path: Path | None = None) -> Path:
+    """Write a copy of a table as CSV.
+
+    :param path: table location
+    :param csv_path: destination (defaults to the table path with a .csv extension)
+    :return: location of the CSV
+    """
+    csv_path = csv_path or path.with_suffix(".csv")
+    read_table(path).to_csv(csv_path, index=False)
+    return csv_path
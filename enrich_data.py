@@ -1,100 +1,211 @@
-import os
+import os, sqlite3, tempfile
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from dotenv import load_dotenv
 from pathlib import Path
 from visualcrossing import VisualCrossingClient
 from location_labels import add_location_labels
+from solar_geometry import add_solar_geometry
+from dataset_schema import READINGS, METADATA, SKY, LOCATIONS, FULL_DATASET, apply_schema, table_path, read_table, write_table, write_partition, clear_partitions, partition_folder, iter_table, export_csv
+import argparse
 
 DATA_FOLDER = Path(os.getcwd()) / "data"
 ARCHIVE_FILE = DATA_FOLDER / "api_archive.csv"
 METADATA_FILE = DATA_FOLDER / "metadata.csv"
 LOCATION_DATA = DATA_FOLDER / "locations.csv"
 SKY_FILE = DATA_FOLDER / "sky_data.csv"
+FULL_DATASET_FILE = table_path("full_dataset", DATA_FOLDER)
+FULL_DATASET_FOLDER = partition_folder(FULL_DATASET_FILE) # chunked build output and rows appended by ingest.py
+SCREENSHOT_FOLDER = Path(os.getcwd()) / "screenshots"
 
-def add_location_labels(data: pd.DataFrame, location_labels: pd.DataFrame) -> pd.DataFrame:
-    """Match each data point to its closet label.
+DATA_TYPES = ["cloudcover" , "solarradiation"] #For additional types visit: https://www.visualcrossing.com/weather-query-builder/
+CORE_COLUMNS = ["timestamp", "location", "measurement", "cloudcover", "solarradiation", "solar_altitude", "solar_azimuth", "clearsky_flat", "clearsky_tilted",
+                "sky", "filename", "latitude", "longitude"]
 
-    :param data: data to be labeled
-    :param location_labels: labels to be used for matching
-    :return: data with added location labels
-    """
-    n_locations = location_labels.shape[0]
-
-    # add labels to the data that will be sorted
-    # this ensures the output of Kmeans is matched with the correct location name
-    amendment = []
-    for i, data_row in location_labels.iterrows():
-        formatted_row = {
-            "filename": data_row["name"],
-            "longitude": data_row["longitude"],
-            "latitude": data_row["latitude"]
-        }
-        amendment.append(formatted_row)
-    combined_data = pd.concat([data, pd.DataFrame(amendment)], ignore_index=True)
-
-    # remove rows with no location data
-    mask = (combined_data["latitude"] == 0) & (combined_data["longitude"] == 0)
-    blank_rows = combined_data[mask].index
-    clean_data = combined_data.drop(blank_rows)
-
-    # group coordinates
-    coordinate_data = clean_data[["latitude", "longitude"]]
-
-    print("Location clustering begun...")
-    kmeans = KMeans(n_clusters=n_locations).fit(coordinate_data)
-    group_map = kmeans.labels_
-    centroids = kmeans.cluster_centers_ #scikitlearn ends attributes derived from learned data in _
-    print("Complete.")
-
-    plt.scatter(coordinate_data["latitude"], coordinate_data["longitude"], c=group_map, cmap="viridis", s=50)
-    plt.show()
-
-    # match location name to coordinate data
-    combined_data["location"] = -1
-    combined_data.loc[~mask, "location"] = group_map
-
-    location_key = {}
-    location_key[-1] = "Missing"
-    for i, row in combined_data.iloc[-n_locations:].iterrows():
-        location_key[row["location"]] = row["filename"] #actually location name, filename as column header used for compatibility
-    
-
-    output = combined_data.iloc[:-n_locations]
-    output["location"] = output["location"].apply(lambda entry: location_key[entry])
-    return output
+def load_client(data_types: list[str] = DATA_TYPES) -> VisualCrossingClient:
+    """Create a Visual Crossing client from the API key and ZIP code stored in .env.
 
-if __name__ == "__main__":
-    ### Settings ###
+    :param data_types: weather elements to retrieve
+    :return: client backed by the archive in the data folder
+    """
     load_dotenv()
 
     api_key = os.environ.get("API_KEY")
     zipcode = os.environ.get("ZIPCODE")
-    data_types = ["cloudcover" , "solarradiation"] #For additional types visit: https://www.visualcrossing.com/weather-query-builder/
-
-    ### Retrieve Screenshot Data ###
-    months = os.listdir("Screenshots")
-    solar_data = pd.concat([pd.read_csv(DATA_FOLDER / f"{month}.csv") for month in months], ignore_index=True)
-    solar_data = solar_data.drop(columns="Unnamed: 0")
-
-    ### Retrieve Meta Data ###
-    metadata = pd.read_csv(METADATA_FILE).drop(columns="Unnamed: 0")
-    metadata["timestamp"] = pd.to_datetime(metadata["timestamp"])
-
+    return VisualCrossingClient(api_key, zipcode, data_types, ARCHIVE_FILE)
+
+def enrich_readings(solar_data: pd.DataFrame, metadata: pd.DataFrame | None, client: VisualCrossingClient,
+                    sky_data: pd.DataFrame | None = None, location_labels: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Add timestamps, weather, sky conditions, and location labels to screenshot readings.
+
+    :param solar_data: readings extracted from the screenshots
+    :param metadata: filename & timestamp of each screenshot. None when solar_data already has a timestamp column
+    :param client: Visual Crossing client used for weather data
+    :param sky_data: sky condition of each interval (read from the data folder when not given)
+    :param location_labels: known locations (read from the data folder when not given)
+    :return: readings with every column of the combined dataset
+    """
     ### Enrich Manual Data W/ VC Data ###
-    merged_df = pd.merge(solar_data, metadata, on="filename")
-    client = VisualCrossingClient(api_key, zipcode, data_types, ARCHIVE_FILE)
-    enriched_df = client.enrich(merged_df)
+    merged_df = solar_data if metadata is None else pd.merge(solar_data, metadata, on="filename")
+    enriched_df = client.enrich(merged_df, keep_interval=True) # only the archive rows between the first & last interval are read
 
     ### Match Sky Status With Enriched Data ###
-    sky_data = sky_data = pd.read_csv(SKY_FILE).drop(columns="Unnamed: 0")
-    sky_data["timestamp"] = pd.to_datetime(sky_data["timestamp"])
+    sky_data = read_table(SKY_FILE, SKY) if sky_data is None else sky_data
     sky_data = sky_data.rename(columns={"timestamp": "interval"})
-    enriched_df["interval"] = enriched_df["timestamp"].apply(client.nearest_interval)
+    sky_data = sky_data[sky_data["interval"].between(enriched_df["interval"].min(), enriched_df["interval"].max())]
     sky_enriched = pd.merge(enriched_df, sky_data, on="interval", how="left").drop(columns="interval")
 
     ### Add Location Data ###
-    location_labels = pd.read_csv(LOCATION_DATA)
+    location_labels = read_table(LOCATION_DATA, LOCATIONS) if location_labels is None else location_labels
     location_enriched = add_location_labels(sky_enriched, location_labels)
 
-    core_data = location_enriched[["timestamp", "location", "measurement", "cloudcover", "solarradiation", "sky", "filename", "latitude", "longitude"]]
-    core_data.to_csv("full_dataset.csv")
\ No newline at end of file
+    ### Add Sun Position & Clear Sky Irradiance ###
+    location_enriched = add_solar_geometry(location_enriched) # computed locally. no API calls
+
+    return location_enriched[CORE_COLUMNS]
+
+def build_dataset(months: list[str], client: VisualCrossingClient, output_file: Path = FULL_DATASET_FILE) -> pd.DataFrame:
+    """Combine screenshot data with metadata, weather, sky conditions, and location labels.
+
+    :param months: monthly screenshot folders whose results are included
+    :param client: Visual Crossing client used for weather data
+    :param output_file: disc location of the combined dataset. partitions left by a chunked build or ingest.py are removed
+    :return: the combined dataset
+    """
+    ### Retrieve Screenshot Data ###
+    solar_data = pd.concat([read_table(table_path(month, DATA_FOLDER), READINGS) for month in months], ignore_index=True)
+
+    ### Retrieve Meta Data ###
+    metadata = read_table(METADATA_FILE, METADATA, columns=["filename", "timestamp"])
+
+    core_data = enrich_readings(solar_data, metadata, client)
+    write_table(core_data, output_file, FULL_DATASET)
+    clear_partitions(partition_folder(output_file))
+    return core_data
+
+STAGING_SCHEMA = pa.schema([
+    ("filename", pa.string()),
+    ("measurement", pa.float32()),
+    ("longitude", pa.float64()),
+    ("latitude", pa.float64()),
+    ("timestamp", pa.timestamp("ns")),
+    ("day", pa.string())
+])
+
+def _index_timestamps(connection: sqlite3.Connection, chunk_rows: int) -> None:
+    """Copy the capture time of every screenshot into an indexed table, so readings look theirs up without loading the metadata."""
+    connection.execute("CREATE TABLE timestamps (filename TEXT, timestamp INTEGER)")
+    for batch in iter_table(METADATA_FILE, chunk_rows, METADATA, columns=["filename", "timestamp"]):
+        batch = batch.dropna(subset=["timestamp"]) # dropped by the weather join anyway
+        connection.executemany("INSERT INTO timestamps VALUES (?, ?)", zip(batch["filename"].astype(str), batch["timestamp"].astype("int64").tolist()))
+    connection.execute("CREATE INDEX timestamps_filename ON timestamps (filename)")
+    connection.execute("CREATE TEMP TABLE batch (filename TEXT PRIMARY KEY)")
+
+def _add_timestamps(readings: pd.DataFrame, connection: sqlite3.Connection) -> pd.DataFrame:
+    """Join a batch of readings with their capture times. Readings without one are dropped, as in build_dataset."""
+    connection.execute("DELETE FROM batch")
+    connection.executemany("INSERT INTO batch VALUES (?)", ((filename,) for filename in readings["filename"].astype(str).unique()))
+    found = connection.execute("SELECT filename, timestamp FROM timestamps JOIN batch USING (filename)").fetchall()
+    timestamps = pd.DataFrame(found, columns=["filename", "timestamp"])
+    timestamps["timestamp"] = pd.to_datetime(timestamps["timestamp"].astype("int64"), unit="ns")
+    return pd.merge(readings.astype({"filename": str}), timestamps, on="filename")
+
+def stage_readings_by_day(months: list[str], staging_folder: Path, chunk_rows: int) -> list[Path]:
+    """Join readings with their timestamps and split them into one folder per day, a batch of rows at a time.
+
+    Screenshot timestamps are first indexed in a SQLite file. Each batch of readings then looks up its timestamps and is
+    appended to the parquet file of its day, so there is one staged file per day however many batches there are.
+
+    :param months: monthly screenshot folders whose results are included
+    :param staging_folder: empty folder for the intermediate files
+    :param chunk_rows: readings held in memory at once
+    :return: day folders in time order
+    """
+    connection = sqlite3.connect(staging_folder / "timestamps.sqlite", check_same_thread=False) # batches are pulled by a pyarrow writer thread
+    try:
+        _index_timestamps(connection, chunk_rows)
+
+        def batches():
+            for month in months:
+                for batch in iter_table(table_path(month, DATA_FOLDER), chunk_rows, READINGS):
+                    joined = _add_timestamps(batch, connection)
+                    joined["day"] = joined["timestamp"].dt.strftime("%Y-%m-%d")
+                    yield pa.RecordBatch.from_pandas(joined[STAGING_SCHEMA.names], schema=STAGING_SCHEMA, preserve_index=False)
+
+        ds.write_dataset(batches(), staging_folder / "days", schema=STAGING_SCHEMA, format="parquet",
+                         partitioning=ds.partitioning(pa.schema([STAGING_SCHEMA.field("day")]), flavor="hive"),
+                         basename_template="part-{i}.parquet", existing_data_behavior="overwrite_or_ignore")
+    finally:
+        connection.close()
+
+    days_folder = staging_folder / "days"
+    return sorted(days_folder.iterdir()) if days_folder.is_dir() else [] # day=<ISO date> sorts in time order
+
+def build_dataset_chunked(months: list[str], client: VisualCrossingClient, output_file: Path = FULL_DATASET_FILE,
+                          chunk_rows: int = 100_000, csv_file: Path | None = None) -> int:
+    """Combine screenshot data with metadata, weather, sky conditions, and location labels one chunk at a time.
+
+    Readings are staged by day on disc (see stage_readings_by_day) and enriched in timestamp order, chunk_rows at a time.
+    A chunk only reads the archive and sky rows between its first and last interval, and is written as its own partition,
+    so memory is bounded by the chunk size (plus the sky & location tables) rather than by a month or the whole dataset.
+    The partitions hold the same rows as the table build_dataset writes, sorted by timestamp.
+
+    :param months: monthly screenshot folders whose results are included
+    :param client: Visual Crossing client used for weather data
+    :param output_file: disc location of the combined dataset. chunks are written as its partitions, replacing the file and earlier partitions
+    :param chunk_rows: readings enriched at once
+    :param csv_file: also write the dataset to this CSV, a chunk at a time
+    :return: number of rows written
+    """
+    output_folder = partition_folder(output_file)
+    clear_partitions(output_folder)
+    output_file.unlink(missing_ok=True) # read_table(output_file) reads the partitions alone
+    if csv_file:
+        csv_file.unlink(missing_ok=True)
+    sky_data = read_table(SKY_FILE, SKY) # one row per interval, small even over many years
+    location_labels = read_table(LOCATION_DATA, LOCATIONS)
+
+    part, rows = 0, 0
+    def write_chunk(readings: pd.DataFrame) -> None:
+        nonlocal part, rows
+        chunk = enrich_readings(readings, None, client, sky_data, location_labels)
+        if len(chunk) == 0:
+            return
+        write_partition(chunk, output_folder, part, FULL_DATASET)
+        if csv_file:
+            apply_schema(chunk, FULL_DATASET).to_csv(csv_file, mode="a", header=part == 0, index=False)
+        part += 1
+        rows += len(chunk)
+        print(f"{chunk['timestamp'].max():%Y-%m-%d}: {rows} readings enriched in {part} partitions so far")
+
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=".staging-", dir=output_file.parent) as staging_folder:
+        pending = pd.DataFrame()
+        for day in stage_readings_by_day(months, Path(staging_folder), chunk_rows):
+            readings = pd.read_parquet(day).sort_values("timestamp", kind="stable")
+            pending = pd.concat([pending, readings], ignore_index=True) if len(pending) else readings.reset_index(drop=True)
+            while len(pending) >= chunk_rows:
+                write_chunk(pending.iloc[:chunk_rows])
+                pending = pending.iloc[chunk_rows:].reset_index(drop=True)
+        if len(pending):
+            write_chunk(pending)
+
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combine screenshot data with weather, sky, and location data.")
+    parser.add_argument("--csv", action="store_true", help="also export the dataset as CSV (written a chunk at a time with --chunk-rows)")
+    parser.add_argument("--chunk-rows", type=int, help="enrich this many readings at a time and write a partitioned dataset to data/full_dataset/")
+    args = parser.parse_args()
+
+    months = [folder for folder in os.listdir(SCREENSHOT_FOLDER) if os.path.isdir(SCREENSHOT_FOLDER / folder)]
+    if args.chunk_rows:
+        csv_file = FULL_DATASET_FILE.with_suffix(".csv") if args.csv else None
+        build_dataset_chunked(months, load_client(), chunk_rows=args.chunk_rows, csv_file=csv_file)
+        if csv_file:
+            print("Exported", csv_file)
+    else:
+        build_dataset(months, load_client())
+        if args.csv:
+            print("Exported", export_csv(FULL_DATASET_FILE))
@@ -0,0 +1,400 @@
+import os, json, time, queue, argparse, threading, traceback
+import pandas as pd
+from pathlib import Path
+from metadata import extract_file_metadata, append_metadata
+from dataset_schema import READINGS, METADATA, FULL_DATASET, apply_schema, table_path, read_file, write_table, write_partition, partition_folder, partitions, next_partition
+
+try: # inotify/FSEvents based watching is optional. folders are polled without it
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+DATA_FOLDER = Path(os.getcwd()) / "data"
+SCREENSHOT_FOLDER = Path(os.getcwd()) / "screenshots"
+LEDGER_FILE = DATA_FOLDER / "ingest_ledger.jsonl"
+
+class Ledger:
+    """
+    Append-only record of every screenshot the daemon has finished with.
+
+    Each line holds the screenshot's path relative to the screenshot folder, its modification time, and the outcome.
+    A screenshot is only recorded once its rows are in the dataset, so a restart picks up exactly where the last run stopped.
+    Edited screenshots get a new modification time and are processed again.
+
+    Outcomes that may succeed later ("unmatched" while weather or metadata is not available yet, "error" after an unexpected
+    failure) are retried with exponential backoff up to a number of attempts. Screenshots the OCR could not read ("failed")
+    are only retried when requeued by hand, for example after a parser fix: pass requeue=True (ingest.py --requeue).
+    """
+    RETRY_STATUSES = ("unmatched", "error")
+
+    def __init__(self, ledger_file: Path = LEDGER_FILE, max_attempts: int = 5, retry_delay: float = 60.0, requeue: bool = False):
+        """Load the entries recorded by earlier runs.
+
+        :param ledger_file: disc location of the ledger
+        :param max_attempts: attempts made on a screenshot whose outcome may succeed later
+        :param retry_delay: seconds before the first retry. doubled after each further attempt
+        :param requeue: forget every outcome other than "appended", so those screenshots are processed again
+        """
+        self.ledger_file = ledger_file
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.entries = {} # path -> (mtime, status, time, attempts)
+        self.lock = threading.Lock()
+        if ledger_file.exists():
+            with open(ledger_file, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError: # a line cut short by a crash
+                        continue
+                    self._remember(entry["path"], entry["mtime"], entry.get("status", "appended"), entry.get("time", 0.0))
+        if requeue:
+            self.entries = {path: entry for path, entry in self.entries.items() if entry[1] == "appended"}
+
+    def _remember(self, path: str, mtime: int, status: str, recorded: float) -> None:
+        previous = self.entries.get(path)
+        attempts = previous[3] + 1 if previous and previous[0] == mtime else 1
+        self.entries[path] = (mtime, status, recorded, attempts)
+
+    def __contains__(self, item: tuple[str, int]) -> bool:
+        """Whether a screenshot needs no processing now: it is done, or waiting for its next retry."""
+        path, mtime = item
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != mtime:
+            return False
+        _, status, recorded, attempts = entry
+        if status not in self.RETRY_STATUSES or attempts >= self.max_attempts:
+            return True
+        return time.time() < recorded + self.retry_delay * 2 ** (attempts - 1)
+
+    def status(self, path: str) -> str | None:
+        """Latest outcome recorded for a screenshot."""
+        entry = self.entries.get(path)
+        return entry[1] if entry else None
+
+    def record(self, entries: list[tuple[str, int, str]]) -> None:
+        """Mark screenshots as processed.
+
+        :param entries: relative path, modification time (ns), and outcome of each screenshot
+        """
+        with self.lock:
+            self.ledger_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.ledger_file, "a", encoding="utf-8") as f:
+                for path, mtime, status in entries:
+                    recorded = time.time()
+                    f.write(json.dumps({"path": path, "mtime": mtime, "status": status, "time": recorded}) + "\n")
+                    self._remember(path, mtime, status, recorded)
+                f.flush()
+                os.fsync(f.fileno())
+
+class DatasetAppender:
+    """
+    Adds rows to a table (the combined dataset or a month's readings) as new partitions, so each batch costs the size of the
+    batch rather than the size of the table.
+
+    The filenames already in the table are loaded once. When a screenshot is processed again (it was edited), its earlier
+    row is removed by rewriting only the file or partition that holds it.
+    """
+
+    def __init__(self, dataset_file: Path, schema: dict[str, str] = FULL_DATASET):
+        """Index the rows already in the table.
+
+        :param dataset_file: disc location of the table. partitions are written to the folder of the same name
+        :param schema: type of each column of the table
+        """
+        self.dataset_file = dataset_file
+        self.schema = schema
+        self.folder = partition_folder(dataset_file)
+        self.next_index = next_partition(self.folder)
+        self.locations = {} # filename -> file holding its row
+        for path in ([dataset_file] if dataset_file.exists() else []) + partitions(self.folder):
+            self.locations.update(dict.fromkeys(read_file(path, columns=["filename"])["filename"].astype(str), path))
+
+    def _remove(self, filenames: set[str]) -> None:
+        """Drop the rows of screenshots about to be written again."""
+        stale = {}
+        for filename in filenames:
+            stale.setdefault(self.locations.pop(filename), set()).add(filename)
+
+        for path, names in stale.items():
+            rows = read_file(path)
+            rows = rows[~rows["filename"].isin(names)]
+            if path != self.dataset_file:
+                if len(rows) == 0:
+                    path.unlink()
+                else:
+                    write_partition(rows, self.folder, int(path.stem.split("-")[1]), self.schema)
+            else: # written beside the table then swapped in, so a crash never leaves a partial file
+                temp_file = path.with_name(f"{path.stem}.tmp{path.suffix}")
+                write_table(rows, temp_file, self.schema)
+                os.replace(temp_file, path)
+
+    def append(self, rows: pd.DataFrame) -> Path:
+        """Write rows as a new partition. Earlier rows of the same screenshots are replaced so reprocessing never duplicates them.
+
+        :param rows: new rows of the table
+        :return: location of the new partition
+        """
+        filenames = set(rows["filename"].astype(str))
+        self._remove(filenames & self.locations.keys())
+        path = write_partition(rows, self.folder, self.next_index, self.schema)
+        self.next_index += 1
+        self.locations.update(dict.fromkeys(filenames, path))
+        return path
+
+class _EventHandler(FileSystemEventHandler):
+    """Forwards new & moved screenshots from the observer to the daemon."""
+
+    def __init__(self, daemon: "IngestDaemon"):
+        self.daemon = daemon
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.daemon.submit(Path(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.daemon.submit(Path(event.dest_path))
+
+class IngestDaemon:
+    """
+    Processes screenshots as they land in the monthly screenshot folders.
+
+    A watcher places new files on a bounded queue. A single worker drains the queue in small batches and runs them through the
+    warm vision model, metadata extraction, weather enrichment, and location labeling, then appends the rows to the dataset.
+    When the queue is full the watcher waits, so a burst of files never builds up an unbounded backlog in memory.
+
+    The readings and metadata of each batch are also appended to the month's reading table and metadata.csv, the inputs of
+    enrich_data.py, so rebuilding the dataset keeps every ingested screenshot.
+    """
+
+    def __init__(self, client: "VisualCrossingClient", screenshot_folder: Path = SCREENSHOT_FOLDER, dataset_file: Path | None = None,
+                 data_folder: Path | None = None, ledger: Ledger | None = None, queue_size: int = 64, batch_size: int = 8, poll_interval: float = 5.0,
+                 rescan_interval: float = 60.0, settle_time: float = 0.5, use_watchdog: bool = True):
+        """Configure the daemon. Nothing is watched until start is called.
+
+        :param client: Visual Crossing client used for weather data
+        :param screenshot_folder: folder holding the monthly screenshot folders
+        :param dataset_file: combined dataset to append to (defaults to the one built by enrich_data.py). batches are written as its partitions
+        :param data_folder: folder holding the monthly reading tables and metadata.csv (defaults to enrich_data.py's)
+        :param ledger: record of processed screenshots (defaults to the ledger in the data folder)
+        :param queue_size: most screenshots waiting to be processed at once
+        :param batch_size: most screenshots processed together
+        :param poll_interval: seconds between folder scans when watchdog is not in use
+        :param rescan_interval: seconds between safety scans when watchdog is in use. picks up files due for a retry
+        :param settle_time: seconds a file's size must stay unchanged before it is considered fully written
+        :param use_watchdog: use filesystem events when the watchdog package is installed
+        """
+        import enrich_data, vision_ai # deferred so --help works without the vision model installed
+        self._enrich_data = enrich_data
+        self._vision_ai = vision_ai
+
+        self.client = client
+        self.screenshot_folder = screenshot_folder
+        self.dataset_file = dataset_file or enrich_data.FULL_DATASET_FILE
+        self.appender = DatasetAppender(self.dataset_file)
+        self.data_folder = data_folder or enrich_data.DATA_FOLDER
+        self.month_appenders = {} # month -> appender of its reading table. created on first use
+        self.metadata_file = self.data_folder / enrich_data.METADATA_FILE.name
+        self.recorded_metadata = None # filenames in metadata.csv. read on the first batch
+        self.ledger = ledger or Ledger()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.settle_time = settle_time
+        self.use_watchdog = use_watchdog and Observer is not None
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pending = set() # queued or in progress. keeps scans and events from queueing a file twice
+        self.pending_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.observer = None
+        self.runner = vision_ai.OCRRunner(workers=1) # in-process so the warm engine serves every batch
+
+    def _relative(self, img_path: Path) -> str:
+        return img_path.relative_to(self.screenshot_folder).as_posix()
+
+    def submit(self, img_path: Path) -> None:
+        """Queue a screenshot unless it was already processed or is waiting. Blocks while the queue is full.
+
+        :param img_path: location of the screenshot
+        """
+        if img_path.suffix.lower() != ".png" or not img_path.exists():
+            return
+        if (self._relative(img_path), img_path.stat().st_mtime_ns) in self.ledger:
+            return
+        with self.pending_lock:
+            if img_path in self.pending:
+                return
+            self.pending.add(img_path)
+
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(img_path, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def scan(self) -> None:
+        """Queue every screenshot that has not been processed yet."""
+        for img_path in sorted(self.screenshot_folder.glob("*/*.png")):
+            if self.stop_event.is_set():
+                return
+            self.submit(img_path)
+
+    def _watch(self) -> None:
+        """Scan the folders periodically. Between scans, filesystem events queue files as soon as they appear."""
+        interval = self.rescan_interval if self.use_watchdog else self.poll_interval
+        while not self.stop_event.is_set():
+            self.scan()
+            self.stop_event.wait(interval)
+
+    def _wait_until_written(self, img_path: Path) -> bool:
+        """Wait until a file stops growing. SPARKvue exports may still be copying when they are first seen.
+
+        :return: whether the file still exists
+        """
+        previous = None
+        while not self.stop_event.is_set():
+            if not img_path.exists():
+                return False
+            stat = img_path.stat()
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current == previous:
+                return True
+            previous = current
+            time.sleep(self.settle_time)
+        return False
+
+    def _next_batch(self) -> list[Path]:
+        """Wait for a screenshot, then take any others already waiting up to the batch size."""
+        try:
+            batch = [self.queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def process_batch(self, img_paths: list[Path]) -> pd.DataFrame:
+        """Turn screenshots into dataset rows and append them.
+
+        :param img_paths: locations of fully written screenshots
+        :return: the appended rows
+        """
+        start = time.perf_counter()
+        entries = [(self._relative(img_path), img_path.stat().st_mtime_ns) for img_path in img_paths]
+
+        detections = self._vision_ai.detect_screenshots(img_paths, self.runner)
+        readings, failures = self._vision_ai.split_results(detections)
+        raw_metadata = pd.DataFrame([extract_file_metadata(img_path) for img_path in img_paths])
+        raw_metadata = raw_metadata.rename(columns={"photoshop:DateCreated": "timestamp"})[["filename", "timestamp", "mtime"]]
+        metadata = apply_schema(raw_metadata[["filename", "timestamp"]], METADATA)
+
+        ### Record The Inputs Of enrich_data.py ###
+        months = {img_path.name: img_path.parent.name for img_path in img_paths}
+        for month, month_readings in readings.groupby(readings["filename"].map(months), sort=False):
+            if month not in self.month_appenders:
+                self.month_appenders[month] = DatasetAppender(table_path(month, self.data_folder), READINGS)
+            self.month_appenders[month].append(month_readings)
+        if self.recorded_metadata is None:
+            self.recorded_metadata = set(pd.read_csv(self.metadata_file, usecols=["filename"])["filename"]) if self.metadata_file.exists() else set()
+        append_metadata(raw_metadata, self.metadata_file, self.recorded_metadata)
+
+        rows = self._enrich_data.enrich_readings(readings, metadata, self.client)
+        if len(rows) > 0:
+            self.appender.append(rows)
+
+        appended = set(rows["filename"])
+        failed = set(failures["filename"])
+        self.ledger.record([
+            (path, mtime, "appended" if img_path.name in appended else "failed" if img_path.name in failed else "unmatched")
+            for img_path, (path, mtime) in zip(img_paths, entries)
+        ])
+
+        elapsed = time.perf_counter() - start
+        print(f"Ingested {len(img_paths)} screenshots in {elapsed:.2f}s ({len(rows)} rows appended, {len(failed)} unreadable)")
+        return rows
+
+    def _record_error(self, img_paths: list[Path]) -> None:
+        """Mark screenshots whose batch raised, so they are retried later instead of on every scan."""
+        entries = []
+        for img_path in img_paths:
+            try:
+                entries.append((self._relative(img_path), img_path.stat().st_mtime_ns, "error"))
+            except OSError: # removed since it was queued
+                continue
+        self.ledger.record(entries)
+
+    def _work(self) -> None:
+        """Process batches until stopped. A batch that raises is recorded as an error and retried later. The worker keeps going."""
+        while not self.stop_event.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                ready = [img_path for img_path in batch if self._wait_until_written(img_path)]
+                if ready:
+                    self.process_batch(ready)
+            except Exception as e:
+                print(f"Ingestion failed for {[img_path.name for img_path in batch]}: {e!r}. Retrying later.")
+                traceback.print_exc()
+                try:
+                    self._record_error(batch)
+                except Exception as ledger_error: # never let bookkeeping stop the only worker
+                    print(f"Could not record the failure in the ledger: {ledger_error!r}")
+            finally:
+                with self.pending_lock:
+                    self.pending.difference_update(batch)
+                for _ in batch:
+                    self.queue.task_done()
+
+    def start(self) -> None:
+        """Load the vision model and start watching."""
+        with self._vision_ai._engine_lock:
+            self._vision_ai._get_engine() # warm up before the first screenshot arrives
+
+        if self.use_watchdog:
+            self.observer = Observer()
+            self.observer.schedule(_EventHandler(self), str(self.screenshot_folder), recursive=True)
+            self.observer.start()
+        self.threads = [threading.Thread(target=target, daemon=True) for target in (self._watch, self._work)]
+        for thread in self.threads:
+            thread.start()
+        print(f"Watching {self.screenshot_folder} ({'filesystem events' if self.use_watchdog else f'polling every {self.poll_interval}s'})")
+
+    def stop(self) -> None:
+        """Stop watching. The batch in progress is finished first."""
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        for thread in self.threads:
+            thread.join()
+        self.runner.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process screenshots into the full dataset as they arrive.")
+    parser.add_argument("--poll", action="store_true", help="scan the folders periodically instead of using filesystem events")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between scans when polling")
+    parser.add_argument("--queue-size", type=int, default=64, help="most screenshots waiting to be processed at once")
+    parser.add_argument("--requeue", action="store_true", help="process screenshots recorded as failed, unmatched, or error again")
+    args = parser.parse_args()
+
+    import enrich_data
+    daemon = IngestDaemon(enrich_data.load_client(), ledger=Ledger(requeue=args.requeue), queue_size=args.queue_size,
+                          poll_interval=args.interval, use_watchdog=not args.poll)
+    daemon.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        daemon.stop()
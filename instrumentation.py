@@ -0,0 +1,189 @@
+import os, sys, csv, json, time, bisect, cProfile, pstats, threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try: # peak memory is read from the OS. not available on Windows
+    import resource
+except ImportError:
+    resource = None
+
+DATA_FOLDER = Path(os.getcwd()) / "data"
+REPORT_FILE = DATA_FOLDER / "run_report.json"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0) # upper bounds in seconds
+
+_lock = threading.Lock()
+_started = time.time()
+_stages = {} # name -> {"calls", "seconds", "items"}
+_latencies = {} # name -> sorted per item seconds
+_counters = {} # name -> count
+_profiles = [] # finished cProfile runs, merged when dumped
+_profiling = False
+
+def reset() -> None:
+    """Forget everything recorded so far and restart the run clock."""
+    global _started
+    with _lock:
+        _started = time.time()
+        _stages.clear()
+        _latencies.clear()
+        _counters.clear()
+        _profiles.clear()
+
+@contextmanager
+def stage(name: str, items: int | None = None):
+    """Time a block of work and add it to the run report.
+
+    :param name: stage name. repeated calls are combined
+    :param items: number of items handled by the block, for throughput
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            totals = _stages.setdefault(name, {"calls": 0, "seconds": 0.0, "items": 0})
+            totals["calls"] += 1
+            totals["seconds"] += elapsed
+            totals["items"] += items or 0
+
+def record_latency(name: str, seconds: float) -> None:
+    """Record the time spent on a single item (one screenshot, one API request, ...).
+
+    :param name: latency series
+    :param seconds: time spent
+    """
+    with _lock:
+        bisect.insort(_latencies.setdefault(name, []), seconds)
+
+def count(name: str, amount: int = 1) -> None:
+    """Increase a counter. Counters named <name>.hits & <name>.misses are reported as a hit rate.
+
+    :param name: counter name
+    :param amount: increase
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def peak_memory_mb(children: bool = False) -> float | None:
+    """Largest resident memory so far, or None when the OS does not report it.
+
+    :param children: report the largest child process (such as an OCR worker) instead of this one. only children that have exited are counted
+    :return: peak resident memory in MB
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10 # bytes on macOS, kilobytes elsewhere
+
+def _summarize_latency(values: list[float]) -> dict:
+    quantile = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    histogram = {f"<={bound}s": bisect.bisect_right(values, bound) for bound in LATENCY_BUCKETS}
+    histogram = {bucket: total - previous for (bucket, total), previous in zip(histogram.items(), [0, *histogram.values()])}
+    histogram[f">{LATENCY_BUCKETS[-1]}s"] = len(values) - bisect.bisect_right(values, LATENCY_BUCKETS[-1])
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": quantile(0.5),
+        "p90": quantile(0.9),
+        "p99": quantile(0.99),
+        "max": values[-1],
+        "histogram": histogram
+    }
+
+def report() -> dict:
+    """Everything recorded during the run.
+
+    :return: stage timings, latency distributions, counters, hit rates, and peak memory of this process & its largest child
+    """
+    with _lock:
+        stages = {
+            name: {**totals, "items_per_sec": totals["items"] / totals["seconds"] if totals["seconds"] > 0 else 0.0}
+            for name, totals in _stages.items()
+        }
+        latencies = {name: _summarize_latency(values) for name, values in _latencies.items() if values}
+        counters = dict(_counters)
+
+    hit_rates = {}
+    for name in counters:
+        if name.endswith(".hits"):
+            prefix = name[:-len(".hits")]
+            total = counters[name] + counters.get(f"{prefix}.misses", 0)
+            hit_rates[prefix] = counters[name] / total if total else 0.0
+
+    return {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_started)),
+        "seconds": time.time() - _started,
+        "peak_memory_mb": {"process": peak_memory_mb(), "largest_child": peak_memory_mb(children=True)}, # children are not summed
+        "stages": stages,
+        "latency": latencies,
+        "counters": counters,
+        "hit_rates": hit_rates
+    }
+
+def write_report(report_file: Path = REPORT_FILE) -> tuple[Path, Path]:
+    """Save the run report as JSON, with a flat CSV copy beside it (one metric per row).
+
+    :param report_file: disc location of the JSON report
+    :return: disc locations of the JSON & CSV reports
+    """
+    run = report()
+    report_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+
+    rows = [("run", "total", "seconds", run["seconds"])]
+    rows += [("memory", name, "peak_mb", value) for name, value in run["peak_memory_mb"].items()]
+    rows += [("stage", name, stat, value) for name, totals in run["stages"].items() for stat, value in totals.items()]
+    rows += [("latency", name, stat, value) for name, summary in run["latency"].items() for stat, value in summary.items() if stat != "histogram"]
+    rows += [("histogram", name, bucket, value) for name, summary in run["latency"].items() for bucket, value in summary["histogram"].items()]
+    rows += [("counter", name, "count", value) for name, value in run["counters"].items()]
+    rows += [("hit_rate", name, "rate", value) for name, value in run["hit_rates"].items()]
+
+    csv_file = report_file.with_suffix(".csv")
+    with open(csv_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["kind", "name", "stat", "value"])
+        writer.writerows(rows)
+    return report_file, csv_file
+
+def enable_profiling() -> None:
+    """Profile every block wrapped in profiled from now on."""
+    global _profiling
+    _profiling = True
+
+@contextmanager
+def profiled():
+    """Run a block under cProfile when profiling is enabled. Only the calling thread is profiled.
+
+    Blocks must not overlap (Python 3.12+ allows a single active profiler), so run them one at a time while profiling.
+    """
+    if not _profiling:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        with _lock:
+            _profiles.append(profile)
+
+def write_profile(profile_file: Path) -> Path | None:
+    """Merge every profiled block into a single cProfile dump (view with python -m pstats or snakeviz).
+
+    :param profile_file: disc location of the dump
+    :return: the dump location, or None when nothing was profiled
+    """
+    with _lock:
+        profiles = list(_profiles)
+    if not profiles:
+        return None
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(profile_file)
+    return profile_file
@@ -0,0 +1,13 @@
+import pandas as pd
+
+def snap_to_interval(timestamps: pd.Series, interval_hours: int = 2) -> pd.Series:
+    """Find the nearest interval mark for every timestamp at once.
+
+    Readings taken during an hour that falls on a mark are rounded down. All others are rounded up to the next mark.
+
+    :param timestamps: datetime64 series
+    :param interval_hours: hours between marks, counted from midnight
+    :return: the interval mark of each timestamp
+    """
+    hours = timestamps.dt.floor("h")
+    return hours + pd.to_timedelta((-hours.dt.hour) % interval_hours, unit="h")
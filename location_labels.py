@@ -1,62 +1,108 @@
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from sklearn.cluster import KMeans
+from matplotlib.figure import Figure
+from sklearn.neighbors import BallTree
 import os
+from dataset_schema import LOCATIONS, FULL_DATASET, table_path, read_table, write_table
+import instrumentation
 
 DATA_FOLDER = Path(os.getcwd()) / "data"
-SOURCE_DATA = DATA_FOLDER / "full_dataset.csv"
+SOURCE_DATA = table_path("full_dataset", DATA_FOLDER)
 LOCATION_DATA = DATA_FOLDER / "locations.csv"
-OUTPUT_FILE = DATA_FOLDER / "location_labeled.csv"
+OUTPUT_FILE = table_path("location_labeled", DATA_FOLDER)
+PLOT_FILE = DATA_FOLDER / "location_labels.png"
 
-# Labels can on occasion be incorrect. Double check the output. Run again if this happens.
+EARTH_RADIUS = 6_371_000 # meters
+MISSING_LABEL = "Missing"
+
+class LocationLabeler:
+    """
+    Labels coordinates with the nearest known location.
+
+    The reference coordinates are loaded into a haversine ball tree once. Labeling is a single vectorized query,
+    so the same input always produces the same labels. Points farther than the cutoff from every known location
+    are labeled Missing.
+    """
+
+    def __init__(self, locations: pd.DataFrame, max_distance: float = 50.0):
+        """Build the spatial index.
+
+        :param locations: known locations with name, latitude, and longitude columns
+        :param max_distance: largest distance in meters at which a point is still matched to a location
+        """
+        self.names = locations["name"].to_numpy(dtype=object)
+        self.max_distance = max_distance
+        self.tree = BallTree(np.radians(locations[["latitude", "longitude"]].to_numpy(dtype=float)), metric="haversine")
+
+    def label(self, latitude: np.ndarray, longitude: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Match coordinates to their nearest known location.
+
+        :param latitude: latitude of each point in degrees
+        :param longitude: longitude of each point in degrees
+        :return: location name and distance in meters to it for each point. unmatched points are Missing with a NaN distance
+        """
+        latitude = np.asarray(latitude, dtype=float)
+        longitude = np.asarray(longitude, dtype=float)
+
+        # failed extractions are recorded as 0 or -1
+        valid = np.isfinite(latitude) & np.isfinite(longitude) & ~((latitude == 0) & (longitude == 0)) & (latitude != -1) & (longitude != -1)
+
+        labels = np.full(latitude.shape, MISSING_LABEL, dtype=object)
+        distances = np.full(latitude.shape, np.nan)
+        if valid.any():
+            distance, index = self.tree.query(np.radians(np.column_stack([latitude[valid], longitude[valid]])), k=1)
+            distance = distance[:, 0] * EARTH_RADIUS
+            matched = distance <= self.max_distance
+
+            valid_labels = np.full(distance.shape, MISSING_LABEL, dtype=object)
+            valid_labels[matched] = self.names[index[matched, 0]]
+            labels[valid] = valid_labels
+            distances[valid] = np.where(matched, distance, np.nan)
+
+        return labels, distances
+
+def plot_locations(data: pd.DataFrame, output_file: Path) -> None:
+    """Save a scatter plot of the labeled coordinates. Nothing is displayed so labeling can run unattended.
+
+    :param data: labeled data with latitude, longitude, and location columns
+    :param output_file: disc location of the image
+    """
+    located = data[data["location"] != MISSING_LABEL]
+    fig = Figure()
+    ax = fig.subplots()
+    for name, group in located.groupby("location"):
+        ax.scatter(group["latitude"], group["longitude"], s=50, label=name)
+    ax.set_xlabel("Latitude")
+    ax.set_ylabel("Longitude")
+    ax.legend(fontsize="small")
+    fig.savefig(output_file)
+
+def add_location_labels(data: pd.DataFrame, location_labels: pd.DataFrame, max_distance: float = 50.0, plot_file: Path | None = None) -> pd.DataFrame:
+    """Match each data point to its closet label.
+
+    :param data: data to be labeled
+    :param location_labels: labels to be used for matching
+    :param max_distance: largest distance in meters at which a point is still matched to a location
+    :param plot_file: disc location to save a scatter plot of the result (no plot when not given)
+    :return: data with added location labels
+    """
+    with instrumentation.stage("add_location_labels", items=len(data)):
+        labeler = LocationLabeler(location_labels, max_distance)
+        output = data.copy()
+        output["location"], _ = labeler.label(output["latitude"], output["longitude"])
+
+    if plot_file:
+        plot_locations(output, plot_file)
+    return output
 
 if __name__ == "__main__":
     # retrieve records
-    all_data = pd.read_csv(SOURCE_DATA)
-    core_data = all_data.loc[:, ["filename", "longitude", "latitude"]]
+    core_data = read_table(SOURCE_DATA, FULL_DATASET, columns=["filename", "longitude", "latitude"], memory_map=True)
 
     # load labels
-    locations = pd.read_csv(LOCATION_DATA)
-    n_locations = locations.shape[0]
-    amendment = []
-    for i, data_row in locations.iterrows():
-        formatted_row = {
-            "filename": data_row["name"],
-            "longitude": data_row["longitude"],
-            "latitude": data_row["latitude"]
-        }
-        amendment.append(formatted_row)
-    combined_data = pd.concat([core_data, pd.DataFrame(amendment)], ignore_index=True)
-
-    # remove rows with no location data
-    mask = (combined_data["latitude"] == 0) & (combined_data["longitude"] == 0)
-    blank_rows = combined_data[mask].index
-    clean_data = combined_data.drop(blank_rows)
-
-    # group coordinates
-    coordinate_data = clean_data[["latitude", "longitude"]]
-
-    kmeans = KMeans(n_clusters=n_locations).fit(coordinate_data)
-    group_map = kmeans.labels_
-    centroids = kmeans.cluster_centers_ #scikitlearn ends attributes derived from learned data in _
-
-    plt.scatter(coordinate_data["latitude"], coordinate_data["longitude"], c=group_map, cmap="viridis", s=50)
-    plt.show()
-
-    # match location name to coordinate data
-    combined_data["location"] = -1
-    combined_data.loc[~mask, "location"] = group_map
-
-    location_key = {}
-    location_key[-1] = "Missing"
-    for i, row in combined_data.iloc[-n_locations:].iterrows():
-        location_key[row["location"]] = row["filename"] #actually location name, row name used to compatibility
-    
-
-    core_data = combined_data.iloc[:-n_locations]
-    core_data["location"] = core_data["location"].apply(lambda entry: location_key[entry])
-    ### stuff
-
-    #core_data.to_csv(SOURCE_DATA)
+    locations = read_table(LOCATION_DATA, LOCATIONS)
 
+    core_data = add_location_labels(core_data, locations, plot_file=PLOT_FILE)
+    print(core_data["location"].value_counts())
+    write_table(core_data, OUTPUT_FILE, FULL_DATASET)
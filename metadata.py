@@ -4,15 +4,24 @@ import pandas as pd
 from pathlib import Path
 from PIL import Image
 from lxml import etree
-import os
+from concurrent.futures import ThreadPoolExecutor
+import os, re, time, struct, zlib
+from dataset_schema import read_table
+import instrumentation
 
 DATA_FOLDER = Path(os.getcwd()) / "data"
 SCREENSHOT_FOLDER = Path(os.getcwd()) / "screenshots"
 OUTPUT_FILE = DATA_FOLDER / "metadata.csv"
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+XMP_KEY = "XML:com.adobe.xmp"
+DEFAULT_FIELDS = ("photoshop:DateCreated",)
+
+@instrumentation.stage("extract_metadata")
 def extract_metadata(folder_path:Path) -> pd.DataFrame:
     all_metadata = []
     for img_path in folder_path.glob("*.png"): #look through each file in the image directory
+        start = time.perf_counter()
         img_metadata = {
             "filename": img_path.name,
         }
@@ -38,17 +47,163 @@ def extract_metadata(folder_path:Path) -> pd.DataFrame:
                     img_metadata[key] = value
 
         all_metadata.append(img_metadata)
+        instrumentation.record_latency("metadata", time.perf_counter() - start)
 
     return pd.DataFrame(all_metadata)
 
-if __name__ == "__main__":
-    monthly_folders = [SCREENSHOT_FOLDER / folder for folder in os.listdir(SCREENSHOT_FOLDER) if os.path.isdir(SCREENSHOT_FOLDER / folder)] #check that each result is indeed a directory
-    
-    monthly_metadata = [extract_metadata(folder) for folder in monthly_folders]
-    metadata_df = pd.concat(monthly_metadata, ignore_index=True)
+def read_text_chunks(img_path: Path, stop_at: str | None = None) -> dict[str, str]:
+    """Read the text chunks of a PNG without decoding any image data.
+
+    :param img_path: location of the PNG
+    :param stop_at: keyword after which reading ends early
+    :return: keyword and text of each tEXt, zTXt, and iTXt chunk
+    """
+    chunks = {}
+    with open(img_path, "rb") as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError(f"{img_path} is not a PNG file")
+
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack(">I4s", header)
+
+            if chunk_type == b"IEND":
+                break
+            if chunk_type not in (b"tEXt", b"zTXt", b"iTXt"):
+                f.seek(length + 4, os.SEEK_CUR) # skip chunk data & crc
+                continue
+
+            data = f.read(length)
+            f.seek(4, os.SEEK_CUR)
+            keyword, _, body = data.partition(b"\x00")
+            keyword = keyword.decode("latin-1")
+            if chunk_type == b"tEXt":
+                chunks[keyword] = body.decode("latin-1")
+            elif chunk_type == b"zTXt":
+                chunks[keyword] = zlib.decompress(body[1:]).decode("latin-1")
+            else:
+                compressed = body[0] == 1
+                _, _, body = body[2:].partition(b"\x00") # language tag
+                _, _, body = body.partition(b"\x00") # translated keyword
+                chunks[keyword] = (zlib.decompress(body) if compressed else body).decode("utf-8")
 
-    # Output clean up
-    metadata_df = metadata_df.rename(columns={"photoshop:DateCreated": "timestamp"})
-    metadata_df = metadata_df[["filename","timestamp"]]
+            if keyword == stop_at:
+                break
+
+    return chunks
+
+def _field_pattern(field: str) -> re.Pattern:
+    """Match an XMP property written either as an element or as an attribute."""
+    name = re.escape(field)
+    return re.compile(rf"<{name}>\s*([^<]*?)\s*</{name}>|{name}=\"([^\"]*)\"")
+
+def extract_file_metadata(img_path: Path, fields: tuple[str] = DEFAULT_FIELDS, mtime: int | None = None) -> dict:
+    """Extract the requested XMP fields from a single screenshot without decoding its image data.
+
+    :param img_path: location of the screenshot
+    :param fields: XMP properties to retrieve in prefix:name form
+    :param mtime: modification time (ns) of the file when already known
+    :return: filename, modification time, and each requested field (None when absent)
+    """
+    start = time.perf_counter()
+    img_metadata = {"filename": img_path.name, "mtime": mtime if mtime is not None else img_path.stat().st_mtime_ns}
+    xmp_data = read_text_chunks(img_path, stop_at=XMP_KEY).get(XMP_KEY, "")
+    for field in fields:
+        match = _field_pattern(field).search(xmp_data) # compiled patterns are cached by re
+        img_metadata[field] = (match.group(1) if match.group(1) is not None else match.group(2)) if match else None
+    instrumentation.record_latency("metadata", time.perf_counter() - start)
+    return img_metadata
+
+def extract_metadata_fast(folder_path: Path, fields: tuple[str] = DEFAULT_FIELDS, known: dict[str, int] | None = None) -> pd.DataFrame:
+    """Extract only the requested XMP fields from each screenshot. Image data is never decoded.
+
+    :param folder_path: disc location of the screenshots
+    :param fields: XMP properties to retrieve in prefix:name form
+    :param known: modification time (ns) of each file already recorded. unchanged files are skipped
+    :return: filename, modification time, and each requested field for every new or changed screenshot
+    """
+    known = known or {}
+    all_metadata = []
 
-    metadata_df.to_csv(OUTPUT_FILE)
+    for img_path in folder_path.glob("*.png"):
+        mtime = img_path.stat().st_mtime_ns
+        if known.get(img_path.name) == mtime:
+            instrumentation.count("metadata.hits")
+            continue
+        instrumentation.count("metadata.misses")
+        all_metadata.append(extract_file_metadata(img_path, fields, mtime))
+
+    return pd.DataFrame(all_metadata, columns=["filename", "mtime", *fields])
+
+def update_metadata_file(folders: list[Path], output_file: Path = OUTPUT_FILE, workers: int | None = None) -> pd.DataFrame:
+    """Add screenshots that are new or changed since the last run to the metadata file. Folders are scanned in parallel.
+
+    Screenshots that are in none of the folders any more are dropped from the file.
+
+    :param folders: monthly screenshot folders. every folder whose screenshots should stay recorded
+    :param output_file: metadata file to update
+    :param workers: number of folders scanned at once
+    :return: the newly recorded rows
+    """
+    rewrite = False
+    if output_file.exists():
+        existing = read_table(output_file)
+        if "mtime" not in existing:
+            existing["mtime"] = pd.NA # files recorded before modification times were tracked are rescanned once
+            rewrite = True
+        existing["mtime"] = existing["mtime"].astype("Int64") # a missing value would otherwise turn every mtime into an inexact float
+        if pd.read_csv(output_file, nrows=0).columns[0].startswith("Unnamed"):
+            rewrite = True # earlier versions stored the index. appended rows would not line up with it
+    else:
+        existing = pd.DataFrame(columns=["filename", "timestamp", "mtime"])
+    known = {filename: int(mtime) for filename, mtime in zip(existing["filename"], existing["mtime"]) if pd.notna(mtime)}
+    present = {img_path.name for folder in folders for img_path in folder.glob("*.png")}
+    gone = ~existing["filename"].isin(present) # deleted or moved screenshots
+
+    with instrumentation.stage("extract_metadata"), ThreadPoolExecutor(max_workers=workers) as executor:
+        monthly_metadata = list(executor.map(lambda folder: extract_metadata_fast(folder, known=known), folders))
+    if monthly_metadata:
+        new_rows = pd.concat(monthly_metadata, ignore_index=True).rename(columns={"photoshop:DateCreated": "timestamp"})
+    else:
+        new_rows = pd.DataFrame(columns=["filename", "timestamp", "mtime"]) # no folders to scan
+    new_rows = new_rows[["filename", "timestamp", "mtime"]]
+    print(f"Metadata: {len(new_rows)} new or changed screenshots")
+
+    changed = existing["filename"].isin(new_rows["filename"])
+    if rewrite or changed.any() or gone.any():
+        # previously recorded entries are out of date. rewrite the file without them
+        updated = pd.concat([existing[~changed & ~gone], new_rows.astype({"mtime": "Int64"})], ignore_index=True)
+        updated.to_csv(output_file, index=False)
+    elif len(new_rows) > 0:
+        new_rows.to_csv(output_file, mode="a", header=not output_file.exists(), index=False)
+
+    return new_rows
+
+def append_metadata(new_rows: pd.DataFrame, output_file: Path = OUTPUT_FILE, recorded: set[str] | None = None) -> None:
+    """Add rows extracted outside update_metadata_file (ex: by ingest.py) to the metadata file.
+
+    :param new_rows: filename, timestamp, and modification time of each screenshot
+    :param output_file: metadata file to update
+    :param recorded: filenames already in the file, kept up to date by this function. read from the file when not given
+    """
+    if recorded is None:
+        recorded = set(pd.read_csv(output_file, usecols=["filename"])["filename"]) if output_file.exists() else set()
+    new_rows = new_rows[["filename", "timestamp", "mtime"]]
+    header = pd.read_csv(output_file, nrows=0).columns.tolist() if output_file.exists() else new_rows.columns.tolist()
+
+    # edited screenshots have their earlier rows replaced. files from earlier versions are rewritten in the current layout
+    if recorded.intersection(new_rows["filename"]) or header != new_rows.columns.tolist():
+        existing = read_table(output_file)
+        if "mtime" not in existing:
+            existing["mtime"] = pd.NA # rescanned once by update_metadata_file
+        existing = existing[~existing["filename"].isin(new_rows["filename"])][new_rows.columns].astype({"mtime": "Int64"})
+        pd.concat([existing, new_rows.astype({"mtime": "Int64"})], ignore_index=True).to_csv(output_file, index=False)
+    else:
+        new_rows.to_csv(output_file, mode="a", header=not output_file.exists(), index=False)
+    recorded.update(new_rows["filename"])
+
+if __name__ == "__main__":
+    monthly_folders = [SCREENSHOT_FOLDER / folder for folder in os.listdir(SCREENSHOT_FOLDER) if os.path.isdir(SCREENSHOT_FOLDER / folder)] #check that each result is indeed a directory
+    update_metadata_file(monthly_folders)
@@ -0,0 +1,80 @@
+import os, json, hashlib
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
+
+CACHE_FOLDER = Path(os.getcwd()) / "data" / "ocr_cache"
+
+ENGINE_CONFIG = {"backend": "onnx", "device": "cpu", "mode": "mobile"} # OpenOCR settings used by vision_ai.load_engine
+
+def model_version(engine_config: dict[str, str] = ENGINE_CONFIG) -> str:
+    """Identify the vision model in use. Results from a different model are never reused.
+
+    The backend & mode select the model files, so they are part of the version. The device does not change detections.
+
+    :param engine_config: settings the OpenOCR engine is created with
+    :return: package name and version of the installed OpenOCR release, followed by the model settings
+    """
+    try:
+        package = f"openocr-python=={version('openocr-python')}"
+    except PackageNotFoundError:
+        package = "openocr-python==unknown"
+    options = "".join(f";{name}={value}" for name, value in sorted(engine_config.items()) if name not in ("backend", "device", "mode"))
+    return f"{package}/{engine_config['backend']}-{engine_config['mode']}{options}"
+
+class OCRCache:
+    """
+    Persistent store of raw OpenOCR detections keyed by the content of each screenshot.
+
+    Each entry is a small JSON file named after the SHA-256 of the model version and the image bytes,
+    so renamed screenshots are still hits and edited screenshots are misses.
+    """
+
+    def __init__(self, cache_folder: Path = CACHE_FOLDER, model: str | None = None):
+        """Initialize the cache. The folder is created when missing.
+
+        :param cache_folder: disc location of the cache entries
+        :param model: model identifier mixed into each key (defaults to the installed OpenOCR version)
+        """
+        self.cache_folder = cache_folder
+        self.model = model or model_version()
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+
+    def key(self, img_path: Path) -> str:
+        """Hash a screenshot together with the model version.
+
+        :param img_path: location of the screenshot
+        :return: hex digest used as the cache key
+        """
+        digest = hashlib.sha256(self.model.encode("utf-8"))
+        digest.update(Path(img_path).read_bytes())
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_folder / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> str | None:
+        """Retrieve a cached detection.
+
+        :param key: cache key of the screenshot
+        :return: raw OpenOCR detection, or None on a miss
+        """
+        entry_path = self._entry_path(key)
+        if not entry_path.exists():
+            return None
+        with open(entry_path, encoding="utf-8") as f:
+            return json.load(f)["detection"]
+
+    def put(self, key: str, filename: str, detection: str, elapsed: float = 0.0) -> None:
+        """Store a detection. The write is atomic so an interrupted run never leaves a corrupt entry.
+
+        :param key: cache key of the screenshot
+        :param filename: name of the screenshot the detection came from
+        :param detection: raw OpenOCR detection
+        :param elapsed: inference time of the detection in seconds
+        """
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        temp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"filename": filename, "model": self.model, "detection": detection, "elapsed": elapsed}, f, ensure_ascii=False)
+        os.replace(temp_path, entry_path)
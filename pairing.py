@@ -0,0 +1,97 @@
+import os, argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from location_labels import MISSING_LABEL
+from dataset_schema import FULL_DATASET, PAIRS, table_path, read_table, write_table
+
+DATA_FOLDER = Path(os.getcwd()) / "data"
+SOURCE_DATA = table_path("full_dataset", DATA_FOLDER)
+OUTPUT_FILE = table_path("pairs", DATA_FOLDER)
+
+PAIR_WINDOW = pd.Timedelta(minutes=10) # longest gap between the angled and flat reading at a location
+ORIENTATIONS = np.array(["Angled", "Flat"]) # the angled reading is always recorded first
+READING_COLUMNS = ["measurement", "filename", "latitude", "longitude"] # differ between the two readings of a pair
+
+def label_orientation(data: pd.DataFrame, window: pd.Timedelta = PAIR_WINDOW, time_col: str = "timestamp", location_col: str = "location") -> pd.DataFrame:
+    """Decide which readings were taken angled and which flat, using recording order alone.
+
+    Readings are sorted by location and time once. A new session starts whenever the location changes or more than the window
+    passes between consecutive readings. Within a session readings alternate Angled, Flat, Angled, ... and each Angled/Flat
+    couple forms a pair. Readings left without a partner (the last of an odd session, or those without a location or time) are orphans.
+
+    :param data: readings with location & timestamp columns
+    :param window: longest gap between consecutive readings of one session
+    :param time_col: column name for time data
+    :param location_col: column name for location labels
+    :return: readings sorted by location & time with session, pair, orientation, and orphan columns added
+    """
+    located = (data[location_col].notna() & (data[location_col] != MISSING_LABEL) & data[time_col].notna()).to_numpy()
+    readings = data[located].sort_values([location_col, time_col], kind="stable").reset_index(drop=True)
+
+    locations = readings[location_col].to_numpy()
+    timestamps = readings[time_col].to_numpy()
+    starts = np.ones(len(readings), dtype=bool)
+    starts[1:] = (locations[1:] != locations[:-1]) | (np.diff(timestamps) > window.to_timedelta64())
+
+    session = np.cumsum(starts) - 1
+    index = np.arange(len(readings))
+    position = index - np.maximum.accumulate(np.where(starts, index, 0)) # cumcount within the session
+    session_size = np.bincount(session)[session] if len(readings) else np.zeros(0, dtype=int)
+
+    readings["session"] = session
+    readings["pair"] = position // 2
+    readings["orientation"] = ORIENTATIONS[position % 2]
+    readings["orphan"] = (position % 2 == 0) & (position == session_size - 1) # angled reading with no flat reading after it
+
+    unlocated = data[~located].assign(session=-1, pair=-1, orientation=None, orphan=True)
+    return pd.concat([readings, unlocated], ignore_index=True)
+
+def pair_readings(data: pd.DataFrame, window: pd.Timedelta = PAIR_WINDOW, time_col: str = "timestamp", location_col: str = "location") -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Match each angled reading with the flat reading taken right after it at the same location.
+
+    :param data: readings with location, timestamp, measurement, and filename columns
+    :param window: longest gap between the angled and flat reading
+    :param time_col: column name for time data
+    :param location_col: column name for location labels
+    :return: one row per pair with Angled & Flat columns (other columns are taken from the angled reading), and the orphaned readings
+    """
+    labeled = label_orientation(data, window, time_col, location_col)
+    paired = labeled[~labeled["orphan"]]
+    angled = paired[paired["orientation"] == "Angled"]
+    flat = paired[paired["orientation"] == "Flat"]
+
+    readings = [column for column in READING_COLUMNS if column in data]
+    wide = angled.drop(columns=["orientation", "orphan"]).rename(columns={column: f"angled_{column}" for column in readings})
+    flat = flat[["session", "pair", time_col, *readings]].rename(columns={time_col: "flat_timestamp", **{column: f"flat_{column}" for column in readings}})
+    wide = pd.merge(wide, flat, on=["session", "pair"], how="inner", validate="one_to_one")
+
+    wide = wide.rename(columns={"angled_measurement": "Angled", "flat_measurement": "Flat"})
+    wide["seconds_apart"] = (wide["flat_timestamp"] - wide[time_col]).dt.total_seconds()
+    wide = wide.drop(columns=["session", "pair", "flat_timestamp"])
+
+    orphans = labeled[labeled["orphan"]].drop(columns=["session", "pair", "orphan"]).reset_index(drop=True)
+    return wide.reset_index(drop=True), orphans
+
+def build_pairs(source_file: Path = SOURCE_DATA, output_file: Path = OUTPUT_FILE, window: pd.Timedelta = PAIR_WINDOW) -> pd.DataFrame:
+    """Pair the readings of the full dataset and record the wide table.
+
+    :param source_file: combined dataset
+    :param output_file: disc location of the pairs
+    :param window: longest gap between the angled and flat reading
+    :return: the orphaned readings
+    """
+    dataset = read_table(source_file, FULL_DATASET, memory_map=True)
+    pairs, orphans = pair_readings(dataset, window)
+    write_table(pairs, output_file, PAIRS)
+    print(f"{len(pairs)} pairs, {len(orphans)} orphaned readings")
+    return orphans
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pair angled & flat readings of the full dataset.")
+    parser.add_argument("--window", type=float, default=PAIR_WINDOW.total_seconds() / 60, help="minutes allowed between the angled and flat reading")
+    args = parser.parse_args()
+
+    orphans = build_pairs(window=pd.Timedelta(minutes=args.window))
+    if len(orphans) > 0:
+        print(orphans[["filename", "location", "timestamp"]].to_string(index=False))
@@ -0,0 +1,205 @@
+import os, json, time, hashlib, argparse, threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable
+from dataset_schema import table_path, partitions
+import instrumentation
+
+DATA_FOLDER = Path(os.getcwd()) / "data"
+SCREENSHOT_FOLDER = Path(os.getcwd()) / "screenshots"
+STATE_FILE = DATA_FOLDER / "pipeline_state.json"
+
+class Stage:
+    """
+    A single step of the pipeline with the files it reads and writes.
+
+    Inputs are resolved when the stage is about to run, so globs pick up files created by earlier stages.
+    """
+
+    def __init__(self, name: str, run: Callable[[], None], inputs: Callable[[], list[Path]], outputs: list[Path]):
+        """Declare the stage.
+
+        :param name: unique name of the stage
+        :param run: work performed by the stage
+        :param inputs: returns every file the stage reads
+        :param outputs: every file the stage writes
+        """
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+
+def hash_files(paths: list[Path]) -> str:
+    """Hash the names and contents of a set of files.
+
+    :param paths: files to hash. missing files are hashed by name only
+    :return: hex digest that changes whenever any file is added, removed, or edited
+    """
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(str(path).encode("utf-8") + b"\0")
+        if not path.exists():
+            digest.update(b"missing") # an empty file that appears still changes the hash
+            continue
+        contents = hashlib.sha256() # fixed length, so the boundary between files is unambiguous
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                contents.update(block)
+        digest.update(contents.digest())
+    return digest.hexdigest()
+
+class Pipeline:
+    """
+    Runs stages as a dependency graph. A stage depends on every stage that writes one of its inputs.
+
+    Stages whose inputs hash the same as on their last successful run are skipped, and stages that do not
+    depend on each other run concurrently.
+    """
+
+    def __init__(self, stages: list[Stage], state_file: Path = STATE_FILE, max_workers: int = 4):
+        """Build the dependency graph.
+
+        :param stages: every stage of the pipeline
+        :param state_file: disc location of the input hashes recorded after each successful stage
+        :param max_workers: number of stages run at once
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_file = state_file
+        self.max_workers = max_workers
+        self.state = json.loads(state_file.read_text()) if state_file.exists() else {}
+        self.state_lock = threading.Lock()
+
+        producers = {output: stage.name for stage in stages for output in stage.outputs}
+        self.dependencies = {
+            stage.name: {producers[path] for path in stage.inputs() if path in producers and producers[path] != stage.name}
+            for stage in stages
+        }
+
+    def _save_state(self) -> None:
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.state_file.write_text(json.dumps(self.state, indent=2))
+
+    def _run_stage(self, stage: Stage, force: bool) -> tuple[str, float]:
+        """Run a stage unless its inputs are unchanged and its outputs still exist.
+
+        :return: "ran" or "skipped", and the seconds spent
+        """
+        start = time.perf_counter()
+        input_hash = hash_files(stage.inputs())
+        outputs_exist = all(path.exists() for path in stage.outputs)
+        if not force and outputs_exist and self.state.get(stage.name) == input_hash:
+            return "skipped", time.perf_counter() - start
+
+        with instrumentation.stage(stage.name), instrumentation.profiled():
+            stage.run()
+        with self.state_lock:
+            self.state[stage.name] = input_hash
+            self._save_state()
+        return "ran", time.perf_counter() - start
+
+    def run(self, force: bool = False) -> dict[str, tuple[str, float]]:
+        """Run every stage once its dependencies have finished.
+
+        :param force: run every stage even when its inputs are unchanged
+        :return: outcome and seconds spent for each stage
+        """
+        results = {}
+        pending = dict(self.dependencies)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                ready = [name for name, deps in pending.items() if deps.issubset(results)]
+                if not ready and not running:
+                    raise ValueError(f"Stages {sorted(pending)} depend on each other and can never run")
+                for name in ready:
+                    del pending[name]
+                    running[executor.submit(self._run_stage, self.stages[name], force)] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result() # a failed stage stops the pipeline
+                    print(f"[{name}] {results[name][0]} in {results[name][1]:.2f}s")
+
+        return results
+
+def build_pipeline(months: list[str], max_workers: int = 4) -> tuple[Pipeline, "vision_ai.OCRRunner"]:
+    """Model the screenshot → dataset workflow as stages.
+
+    :param months: monthly screenshot folders to process
+    :param max_workers: number of stages run at once
+    :return: ready to run pipeline and the OCR runner its stages share. close the runner once finished
+    """
+    import enrich_data, metadata, pairing, quality_control, vision_ai # deferred so --help works without the vision model installed
+
+    runner = vision_ai.OCRRunner()
+    # screenshots are cropped to the SPARKvue widgets once regions have been learned (python preprocess.py)
+    preprocessor = vision_ai.Preprocessor(vision_ai.load_regions()) if vision_ai.REGIONS_FILE.exists() else None
+    screenshots = lambda month: lambda: sorted((SCREENSHOT_FOLDER / month).glob("*.png"))
+    all_screenshots = lambda: [path for month in months for path in screenshots(month)()]
+
+    stages = [
+        Stage(
+            name=f"ocr:{month}",
+            run=lambda month=month: vision_ai.process_month(month, runner, preprocessor=preprocessor),
+            inputs=lambda month=month: screenshots(month)() + ([vision_ai.REGIONS_FILE] if preprocessor else []),
+            outputs=[table_path(month, DATA_FOLDER), table_path(f"{month}_failures", DATA_FOLDER)]
+        )
+        for month in months
+    ]
+    stages.append(Stage(
+        name="metadata",
+        run=lambda: metadata.update_metadata_file([SCREENSHOT_FOLDER / month for month in months], metadata.OUTPUT_FILE),
+        inputs=all_screenshots,
+        outputs=[metadata.OUTPUT_FILE]
+    ))
+    stages.append(Stage(
+        name="enrich",
+        run=lambda: enrich_data.build_dataset(months, enrich_data.load_client(), enrich_data.FULL_DATASET_FILE),
+        inputs=lambda: [table_path(month, DATA_FOLDER) for month in months] + [enrich_data.METADATA_FILE, enrich_data.LOCATION_DATA, enrich_data.SKY_FILE],
+        outputs=[enrich_data.FULL_DATASET_FILE]
+    ))
+    stages.append(Stage(
+        name="pair",
+        run=lambda: pairing.build_pairs(enrich_data.FULL_DATASET_FILE, pairing.OUTPUT_FILE),
+        inputs=lambda: [enrich_data.FULL_DATASET_FILE, *partitions(enrich_data.FULL_DATASET_FOLDER)], # ingest.py appends partitions
+        outputs=[pairing.OUTPUT_FILE]
+    ))
+    stages.append(Stage(
+        name="qc",
+        run=lambda: quality_control.run_quality_control(enrich_data.FULL_DATASET_FILE),
+        inputs=lambda: [enrich_data.FULL_DATASET_FILE, *partitions(enrich_data.FULL_DATASET_FOLDER)], # ingest.py appends partitions
+        outputs=[quality_control.FLAGS_FILE, quality_control.REPORT_FILE]
+    ))
+
+    return Pipeline(stages, max_workers=max_workers), runner
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process screenshots into the full dataset, skipping stages whose inputs are unchanged.")
+    parser.add_argument("months", nargs="*", help="monthly screenshot folders to process (defaults to all)")
+    parser.add_argument("--force", action="store_true", help="run every stage even when its inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=4, help="number of stages run at once")
+    parser.add_argument("--report", type=Path, default=instrumentation.REPORT_FILE, help="disc location of the JSON run report (a CSV copy is written beside it)")
+    parser.add_argument("--profile", type=Path, help="save a cProfile dump of every stage here. stages run one at a time while profiling")
+    args = parser.parse_args()
+
+    if args.profile:
+        instrumentation.enable_profiling()
+    months = args.months or sorted(folder for folder in os.listdir(SCREENSHOT_FOLDER) if os.path.isdir(SCREENSHOT_FOLDER / folder))
+    pipeline, runner = build_pipeline(months, 1 if args.profile else args.workers)
+
+    start = time.perf_counter()
+    try:
+        results = pipeline.run(args.force)
+    finally:
+        runner.close() # before the report, as the peak memory of OCR workers is only known once they exit
+
+    print(f"\n{'stage':<24}{'status':<10}{'seconds':>10}")
+    for name, (status, elapsed) in results.items():
+        print(f"{name:<24}{status:<10}{elapsed:>10.2f}")
+    print(f"{'total':<34}{time.perf_counter() - start:>10.2f}")
+
+    print("\nRun report:", *instrumentation.write_report(args.report))
+    if args.profile:
+        print("Profile:", instrumentation.write_profile(args.profile))
@@ -0,0 +1,149 @@
+import os, sys, json, struct, hashlib
+import numpy as np
+import cv2
+from pathlib import Path
+from ocr_cache import OCRCache, model_version
+from transcription_parser import TranscriptionParser, FIELDS, parse_output
+
+DATA_FOLDER = Path(os.getcwd()) / "data"
+SCREENSHOT_FOLDER = Path(os.getcwd()) / "screenshots"
+REGIONS_FILE = DATA_FOLDER / "crop_regions.json"
+
+FIELD_LABELS = {"measurement": "Irradiance", "latitude": "Latitude", "longitude": "Longitude"} # widget titles kept in each crop
+SEPARATOR = 16 # blank pixels between crops so text detection never merges two widgets
+
+def png_size(img_path: Path) -> tuple[int, int]:
+    """Width & height of a PNG read from its header, without decoding the image."""
+    with open(img_path, "rb") as f:
+        header = f.read(24)
+    return struct.unpack(">II", header[16:24])
+
+class Preprocessor:
+    """
+    Reduces a SPARKvue screenshot to the widgets holding the irradiance and coordinates before OCR.
+
+    Each region is cropped, grayscaled, and downscaled, then the crops are stacked into one small image, so text detection
+    scans a fraction of the pixels and never sees the rest of the UI. Regions are fractions of the image size, so they
+    apply to any screenshot resolution of the same layout.
+    """
+
+    def __init__(self, regions: dict[str, tuple[float, float, float, float]], scale: float = 0.5, grayscale: bool = True):
+        """Configure the preprocessing.
+
+        :param regions: left, top, right, and bottom of each widget as fractions of the image size
+        :param scale: resize factor applied to each crop (1 keeps full resolution)
+        :param grayscale: drop color before recognition
+        """
+        self.regions = regions
+        self.scale = scale
+        self.grayscale = grayscale
+
+    @property
+    def id(self) -> str:
+        """Identifier of the configuration. Detections made under different settings are cached separately."""
+        config = json.dumps({"regions": self.regions, "scale": self.scale, "grayscale": self.grayscale}, sort_keys=True)
+        return hashlib.sha256(config.encode("utf-8")).hexdigest()[:12]
+
+    def cache(self, cache_folder: Path | None = None) -> OCRCache:
+        """Detection cache for images preprocessed with this configuration."""
+        model = f"{model_version()}/crop-{self.id}"
+        return OCRCache(model=model) if cache_folder is None else OCRCache(cache_folder, model)
+
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        """Build the composite image of every region.
+
+        :param img: BGR screenshot as read by cv2.imread
+        :return: BGR composite of the preprocessed crops
+        """
+        height, width = img.shape[:2]
+        crops = []
+        for left, top, right, bottom in self.regions.values():
+            crop = img[int(top * height):int(np.ceil(bottom * height)), int(left * width):int(np.ceil(right * width))]
+            if crop.size == 0:
+                continue
+            if self.grayscale:
+                crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+            if self.scale != 1:
+                crop = cv2.resize(crop, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            crops.append(crop)
+        if not crops:
+            return img
+
+        composite_width = max(crop.shape[1] for crop in crops)
+        rows = []
+        for crop in crops:
+            padding = [(0, SEPARATOR), (0, composite_width - crop.shape[1])] + ([(0, 0)] if crop.ndim == 3 else [])
+            rows.append(np.pad(crop, padding, constant_values=255))
+        composite = np.vstack(rows)
+        return cv2.cvtColor(composite, cv2.COLOR_GRAY2BGR) if composite.ndim == 2 else composite # OpenOCR expects 3 channels
+
+def learn_regions(img_paths: list[Path], cache: OCRCache | None = None, parser: TranscriptionParser | None = None,
+                  margin: float = 0.02, coverage: float = 0.98) -> dict[str, tuple[float, float, float, float]]:
+    """Find where each field appears in the SPARKvue layout from full-image detections already in the cache.
+
+    Text regions are assigned to a field when they hold its value or its widget title. Each field's region spans the
+    boxes of most screenshots (outliers beyond the coverage are ignored) plus a margin.
+
+    :param img_paths: screenshots with cached full-image detections
+    :param cache: detection cache (defaults to the cache in the data folder)
+    :param parser: transcription parser used to recognize field values
+    :param margin: padding added on every side, as a fraction of the image size
+    :param coverage: share of boxes each region must contain
+    :return: left, top, right, and bottom of each field as fractions of the image size
+    """
+    cache = cache or OCRCache()
+    parser = parser or TranscriptionParser()
+    boxes = {field: [] for field in FIELDS}
+
+    for img_path in img_paths:
+        detection = cache.get(cache.key(img_path))
+        if detection is None:
+            continue
+        width, height = png_size(img_path)
+        for region in parse_output(detection):
+            transcription = parser.cleanup_pattern.sub("", region["transcription"])
+            fields = {match.lastgroup for match in parser.field_pattern.finditer(transcription)}
+            fallback = parser.fallback_pattern.fullmatch(transcription)
+            fields |= {fallback.lastgroup} if fallback else set()
+            fields |= {field for field, label in FIELD_LABELS.items() if label.lower() in transcription.lower()}
+
+            points = np.asarray(region["points"], dtype=float)
+            box = (points[:, 0].min() / width, points[:, 1].min() / height, points[:, 0].max() / width, points[:, 1].max() / height)
+            for field in fields:
+                boxes[field].append(box)
+
+    regions = {}
+    tail = (1 - coverage) / 2 * 100
+    for field, field_boxes in boxes.items():
+        if not field_boxes:
+            continue
+        field_boxes = np.asarray(field_boxes)
+        regions[field] = (
+            max(0.0, np.percentile(field_boxes[:, 0], tail) - margin),
+            max(0.0, np.percentile(field_boxes[:, 1], tail) - margin),
+            min(1.0, np.percentile(field_boxes[:, 2], 100 - tail) + margin),
+            min(1.0, np.percentile(field_boxes[:, 3], 100 - tail) + margin)
+        )
+    return {field: tuple(float(value) for value in region) for field, region in regions.items()}
+
+def save_regions(regions: dict[str, tuple[float, float, float, float]], regions_file: Path = REGIONS_FILE) -> None:
+    regions_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(regions_file, "w", encoding="utf-8") as f:
+        json.dump(regions, f, indent=2)
+
+def load_regions(regions_file: Path = REGIONS_FILE) -> dict[str, tuple[float, float, float, float]]:
+    """Read crop regions written by save_regions, or configured by hand in the same format."""
+    with open(regions_file, encoding="utf-8") as f:
+        return {field: tuple(region) for field, region in json.load(f).items()}
+
+if __name__ == "__main__":
+    # learn the crop regions from months already processed on full images
+    months = sys.argv[1:] or ["September"]
+    img_paths = [img_path for month in months for img_path in sorted((SCREENSHOT_FOLDER / month).glob("*.png"))]
+    regions = learn_regions(img_paths)
+    missing = [field for field in FIELDS if field not in regions]
+    if missing:
+        print("No cached detections located these fields:", missing)
+    save_regions(regions)
+    print(json.dumps(regions, indent=2))
+    print("Saved to", REGIONS_FILE)
@@ -0,0 +1,164 @@
+import os, argparse
+import numpy as np
+import pandas as pd
+from enum import IntFlag
+from pathlib import Path
+from location_labels import EARTH_RADIUS, MISSING_LABEL
+from pairing import PAIR_WINDOW, label_orientation
+from dataset_schema import FULL_DATASET, QC_FLAGS, table_path, read_table, write_table
+
+DATA_FOLDER = Path(os.getcwd()) / "data"
+SOURCE_DATA = table_path("full_dataset", DATA_FOLDER)
+FLAGS_FILE = table_path("qc_flags", DATA_FOLDER)
+REPORT_FILE = DATA_FOLDER / "qc_report.csv"
+
+WALKING_SPEED = 2.0 # m/s. faster movement between readings means a misread coordinate
+GPS_NOISE = 30.0 # meters of movement always tolerated, whatever the time between readings
+RANGE_FACTOR = 1.25 # readings may exceed the expected irradiance by this factor (reflections, cloud edge brightening)
+RANGE_MARGIN = 50.0 # W/m² added to the expected irradiance before a reading is out of range
+INVERSION_MARGIN = 0.05 # share by which a flat reading must exceed its angled reading to count as an inversion
+
+class QCFlag(IntFlag):
+    """Problems found in a reading. A row's flags are combined into a single integer."""
+    MISSING_FIELD = 1 # a value failed extraction (-1) or is empty
+    OUT_OF_RANGE = 2 # negative, or well above clear sky and Visual Crossing irradiance
+    COORDINATE_JUMP = 4 # moved faster than walking speed since the previous reading
+    DUPLICATE_TIMESTAMP = 8 # another screenshot carries the same timestamp
+    INVERSION = 16 # flat reading above its angled reading while the sun favors the tilted sensor
+    UNLOCATED = 32 # no known location within range
+
+def check_missing(data: pd.DataFrame) -> np.ndarray:
+    values = data[["measurement", "latitude", "longitude"]].to_numpy(dtype=float)
+    return (np.isnan(values) | (values == -1)).any(axis=1)
+
+def check_range(data: pd.DataFrame) -> np.ndarray:
+    """Readings below zero or above the highest irradiance expected from any available model."""
+    measurement = data["measurement"].to_numpy(dtype=float)
+    measurement = np.where(measurement == -1, np.nan, measurement) # failed extractions are MISSING_FIELD only
+    expected = [data[column].to_numpy(dtype=float) for column in ("clearsky_flat", "clearsky_tilted", "solarradiation") if column in data]
+    if not expected:
+        return measurement < 0 # NaN compares False
+    with np.errstate(invalid="ignore"):
+        ceiling = np.fmax.reduce(expected) * RANGE_FACTOR + RANGE_MARGIN # fmax ignores models without a value for the row
+    return (measurement < 0) | (measurement > ceiling) # a missing ceiling compares False
+
+def check_jumps(data: pd.DataFrame, time_col: str = "timestamp", walking_speed: float = WALKING_SPEED) -> np.ndarray:
+    """Readings whose coordinates moved faster than walking speed since the previous reading in time."""
+    valid = ~check_missing(data) & data[time_col].notna().to_numpy()
+    order = np.flatnonzero(valid)[np.argsort(data[time_col].to_numpy()[valid], kind="stable")]
+
+    latitude = np.radians(data["latitude"].to_numpy(dtype=float)[order])
+    longitude = np.radians(data["longitude"].to_numpy(dtype=float)[order])
+    seconds = data[time_col].to_numpy()[order].astype("datetime64[ns]").astype("int64") / 1e9
+
+    # haversine distance between consecutive readings
+    a = np.sin(np.diff(latitude) / 2) ** 2 + np.cos(latitude[:-1]) * np.cos(latitude[1:]) * np.sin(np.diff(longitude) / 2) ** 2
+    distance = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    elapsed = np.diff(seconds)
+
+    jumps = np.zeros(len(data), dtype=bool)
+    jumps[order[1:]] = distance > GPS_NOISE + walking_speed * elapsed
+    return jumps
+
+def check_duplicates(data: pd.DataFrame, time_col: str = "timestamp") -> np.ndarray:
+    return (data[time_col].duplicated(keep=False) & data[time_col].notna()).to_numpy()
+
+def check_inversions(data: pd.DataFrame, window: pd.Timedelta = PAIR_WINDOW, time_col: str = "timestamp") -> np.ndarray:
+    """Both readings of each angled/flat pair where the flat reading is clearly higher.
+
+    When clear sky irradiance is available, pairs taken while the sun favors the flat sensor (high in the sky) are not flagged.
+    """
+    labeled = label_orientation(data.assign(_row=np.arange(len(data))), window, time_col)
+    labeled = labeled[~labeled["orphan"]]
+    angled = labeled[labeled["orientation"] == "Angled"].set_index(["session", "pair"])
+    flat = labeled[labeled["orientation"] == "Flat"].set_index(["session", "pair"]).reindex(angled.index)
+
+    flat_measurement = flat["measurement"].to_numpy(dtype=float)
+    angled_measurement = angled["measurement"].to_numpy(dtype=float)
+    # failed extractions are MISSING_FIELD only. NaN compares False, so their partner is not flagged either
+    flat_measurement = np.where(flat_measurement == -1, np.nan, flat_measurement)
+    angled_measurement = np.where(angled_measurement == -1, np.nan, angled_measurement)
+    inverted = flat_measurement > angled_measurement * (1 + INVERSION_MARGIN)
+    if "clearsky_tilted" in data and "clearsky_flat" in data:
+        inverted &= ~(angled["clearsky_flat"].to_numpy(dtype=float) > angled["clearsky_tilted"].to_numpy(dtype=float))
+
+    flags = np.zeros(len(data), dtype=bool)
+    flags[angled["_row"].to_numpy()[inverted]] = True
+    flags[flat["_row"].to_numpy()[inverted]] = True
+    return flags
+
+def evaluate(data: pd.DataFrame, time_col: str = "timestamp", walking_speed: float = WALKING_SPEED) -> np.ndarray:
+    """Run every rule over the whole dataset.
+
+    :param data: readings with measurement, latitude, longitude, timestamp, and location columns
+    :param time_col: column name for time data
+    :param walking_speed: fastest believable movement between consecutive readings in m/s
+    :return: QCFlag bitmask of each row (0 when the reading passed every rule)
+    """
+    flags = np.zeros(len(data), dtype=np.uint8)
+    flags |= np.where(check_missing(data), QCFlag.MISSING_FIELD, 0).astype(np.uint8)
+    flags |= np.where(check_range(data), QCFlag.OUT_OF_RANGE, 0).astype(np.uint8)
+    flags |= np.where(check_jumps(data, time_col, walking_speed), QCFlag.COORDINATE_JUMP, 0).astype(np.uint8)
+    flags |= np.where(check_duplicates(data, time_col), QCFlag.DUPLICATE_TIMESTAMP, 0).astype(np.uint8)
+    if "location" in data:
+        flags |= np.where(check_inversions(data, time_col=time_col), QCFlag.INVERSION, 0).astype(np.uint8)
+        flags |= np.where((data["location"] == MISSING_LABEL).to_numpy(), QCFlag.UNLOCATED, 0).astype(np.uint8)
+    return flags
+
+def flag_names(flags: np.ndarray) -> np.ndarray:
+    """Readable form of each bitmask, such as "OUT_OF_RANGE|DUPLICATE_TIMESTAMP" (empty when the reading passed)."""
+    names = np.full(len(flags), "", dtype=object)
+    for flag in QCFlag:
+        hit = (flags & flag) != 0
+        names[hit] = names[hit] + np.where(names[hit] == "", flag.name, "|" + flag.name)
+    return names
+
+def failure_report(data: pd.DataFrame, flags: np.ndarray, examples: int = 5) -> pd.DataFrame:
+    """Summarize how often each rule failed.
+
+    :param data: evaluated readings
+    :param flags: bitmask of each row
+    :param examples: number of screenshot names listed per rule
+    :return: one row per rule with the number & share of failing readings and a few example screenshots
+    """
+    filenames = data["filename"].astype(str).to_numpy() if "filename" in data else np.full(len(data), "")
+    rows = []
+    for flag in QCFlag:
+        hit = (flags & flag) != 0
+        rows.append({
+            "rule": flag.name,
+            "readings": int(hit.sum()),
+            "share": float(hit.mean()) if len(flags) else 0.0,
+            "examples": ", ".join(filenames[hit][:examples])
+        })
+    rows.append({"rule": "ANY", "readings": int((flags != 0).sum()), "share": float((flags != 0).mean()) if len(flags) else 0.0, "examples": ""})
+    return pd.DataFrame(rows)
+
+def run_quality_control(source_file: Path = SOURCE_DATA, flags_file: Path = FLAGS_FILE, report_file: Path = REPORT_FILE,
+                        walking_speed: float = WALKING_SPEED) -> pd.DataFrame:
+    """Flag every reading of the full dataset and record the flags & failure report.
+
+    :param source_file: combined dataset
+    :param flags_file: disc location of the flags of each reading
+    :param report_file: disc location of the failure report (CSV)
+    :param walking_speed: fastest believable movement between consecutive readings in m/s
+    :return: the failure report
+    """
+    dataset = read_table(source_file, FULL_DATASET, memory_map=True)
+    flags = evaluate(dataset, walking_speed=walking_speed)
+
+    flagged = dataset[["filename", "timestamp", "location"]].assign(qc_flags=flags, issues=flag_names(flags))
+    write_table(flagged, flags_file, QC_FLAGS)
+
+    report = failure_report(dataset, flags)
+    report.to_csv(report_file, index=False)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag suspicious readings of the full dataset.")
+    parser.add_argument("--walking-speed", type=float, default=WALKING_SPEED, help="fastest believable movement between readings in m/s")
+    args = parser.parse_args()
+
+    report = run_quality_control(walking_speed=args.walking_speed)
+    print(report.to_string(index=False))
+    print("Flags saved to", FLAGS_FILE)
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from study_site import SITE_LATITUDE, SITE_LONGITUDE # used for readings whose coordinates failed extraction
+
+TIMEZONE = "America/Chicago" # screenshots store local wall clock time
+
+SOLAR_CONSTANT = 1361.0 # W/m² at the top of the atmosphere
+SENSOR_TILT = 42.0 # degrees from horizontal of the angled readings
+SENSOR_AZIMUTH = 180.0 # degrees clockwise from north. angled readings face south
+ALBEDO = 0.2 # share of global irradiance reflected by the ground (grass & pavement)
+
+SOLAR_COLUMNS = ["solar_altitude", "solar_azimuth", "clearsky_flat", "clearsky_tilted"]
+
+def _julian_century(timestamps: pd.Series, timezone: str) -> tuple[np.ndarray, np.ndarray]:
+    """Julian century and UTC minutes past midnight of local wall clock timestamps."""
+    timestamps = pd.Series(timestamps)
+    if timestamps.dt.tz is None:
+        # readings are taken in daylight, so the repeated hour when clocks fall back is treated as standard time
+        timestamps = timestamps.dt.tz_localize(timezone, ambiguous=False, nonexistent="shift_forward")
+    seconds = timestamps.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(dtype="datetime64[s]").astype("int64").astype(float)
+    julian_day = seconds / 86400 + 2440587.5
+    return (julian_day - 2451545) / 36525, (seconds % 86400) / 60
+
+def solar_position(timestamps: pd.Series, latitude: np.ndarray, longitude: np.ndarray, timezone: str = TIMEZONE) -> tuple[np.ndarray, np.ndarray]:
+    """Sun altitude & azimuth for every reading at once, following NOAA's solar position equations (±0.1° until 2100).
+
+    :param timestamps: time of each reading. naive timestamps are local time in the given timezone
+    :param latitude: latitude of each reading in degrees
+    :param longitude: longitude of each reading in degrees (east positive)
+    :param timezone: timezone of naive timestamps
+    :return: altitude above the horizon (corrected for refraction) and azimuth clockwise from north, in degrees
+    """
+    century, utc_minutes = _julian_century(timestamps, timezone)
+    latitude = np.radians(np.asarray(latitude, dtype=float))
+    longitude = np.asarray(longitude, dtype=float)
+
+    mean_longitude = np.radians((280.46646 + century * (36000.76983 + century * 0.0003032)) % 360)
+    mean_anomaly = np.radians(357.52911 + century * (35999.05029 - 0.0001537 * century))
+    eccentricity = 0.016708634 - century * (0.000042037 + 0.0000001267 * century)
+    center = (
+        np.sin(mean_anomaly) * (1.914602 - century * (0.004817 + 0.000014 * century))
+        + np.sin(2 * mean_anomaly) * (0.019993 - 0.000101 * century)
+        + np.sin(3 * mean_anomaly) * 0.000289
+    )
+    omega = np.radians(125.04 - 1934.136 * century)
+    apparent_longitude = np.radians(np.degrees(mean_longitude) + center - 0.00569 - 0.00478 * np.sin(omega))
+    mean_obliquity = 23 + (26 + (21.448 - century * (46.815 + century * (0.00059 - century * 0.001813))) / 60) / 60
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_longitude))
+
+    y = np.tan(obliquity / 2) ** 2
+    equation_of_time = 4 * np.degrees( # minutes
+        y * np.sin(2 * mean_longitude)
+        - 2 * eccentricity * np.sin(mean_anomaly)
+        + 4 * eccentricity * y * np.sin(mean_anomaly) * np.cos(2 * mean_longitude)
+        - 0.5 * y * y * np.sin(4 * mean_longitude)
+        - 1.25 * eccentricity * eccentricity * np.sin(2 * mean_anomaly)
+    )
+    true_solar_time = (utc_minutes + equation_of_time + 4 * longitude) % 1440
+    hour_angle = np.radians(true_solar_time / 4 - 180)
+
+    cos_zenith = np.clip(np.sin(latitude) * np.sin(declination) + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle), -1, 1)
+    zenith = np.arccos(cos_zenith)
+    altitude = 90 - np.degrees(zenith)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_azimuth = np.clip((np.sin(latitude) * cos_zenith - np.sin(declination)) / (np.cos(latitude) * np.sin(zenith)), -1, 1)
+        azimuth = np.degrees(np.arccos(cos_azimuth))
+        azimuth = np.where(hour_angle > 0, (azimuth + 180) % 360, (540 - azimuth) % 360)
+
+        tan_altitude = np.tan(np.radians(altitude))
+        refraction = np.select(
+            [altitude > 85, altitude > 5, altitude > -0.575],
+            [0.0, 58.1 / tan_altitude - 0.07 / tan_altitude ** 3 + 0.000086 / tan_altitude ** 5, 1735 + altitude * (-518.2 + altitude * (103.4 + altitude * (-12.79 + altitude * 0.711)))],
+            -20.772 / tan_altitude
+        ) / 3600
+
+    return altitude + refraction, azimuth
+
+def clear_sky_irradiance(altitude: np.ndarray, azimuth: np.ndarray, day_of_year: np.ndarray, tilt: float = SENSOR_TILT,
+                         surface_azimuth: float = SENSOR_AZIMUTH, albedo: float = ALBEDO) -> tuple[np.ndarray, np.ndarray]:
+    """Expected irradiance under a cloudless sky on a flat and a tilted sensor.
+
+    Beam irradiance follows Meinel's air mass model with Kasten & Young's air mass. Diffuse light is taken as a fixed
+    share of the beam and spread isotropically over the sky, and the tilted sensor also sees light reflected by the ground.
+
+    :param altitude: sun altitude in degrees
+    :param azimuth: sun azimuth in degrees clockwise from north
+    :param day_of_year: day of year of each reading, for the varying Earth-Sun distance
+    :param tilt: sensor tilt from horizontal in degrees
+    :param surface_azimuth: direction the tilted sensor faces, in degrees clockwise from north
+    :param albedo: share of global irradiance reflected by the ground
+    :return: global irradiance on a flat sensor and on the tilted sensor, in W/m² (0 while the sun is down)
+    """
+    altitude = np.asarray(altitude, dtype=float)
+    zenith = 90 - altitude
+    up = altitude > 0
+
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        air_mass = 1 / (np.cos(np.radians(zenith)) + 0.50572 * (96.07995 - zenith) ** -1.6364)
+        extraterrestrial = SOLAR_CONSTANT * (1 + 0.033 * np.cos(2 * np.pi * np.asarray(day_of_year) / 365))
+        beam = np.where(up, extraterrestrial * 0.7 ** (air_mass ** 0.678), 0.0)
+    diffuse = 0.1 * beam
+    flat = beam * np.where(up, np.sin(np.radians(altitude)), 0.0) + diffuse
+
+    tilt = np.radians(tilt)
+    cos_incidence = (
+        np.cos(np.radians(zenith)) * np.cos(tilt)
+        + np.sin(np.radians(zenith)) * np.sin(tilt) * np.cos(np.radians(np.asarray(azimuth) - surface_azimuth))
+    )
+    tilted = beam * np.clip(cos_incidence, 0, None) + diffuse * (1 + np.cos(tilt)) / 2 + flat * albedo * (1 - np.cos(tilt)) / 2
+
+    return flat, tilted
+
+def add_solar_geometry(data: pd.DataFrame, time_col: str = "timestamp", timezone: str = TIMEZONE) -> pd.DataFrame:
+    """Add sun position and clear sky irradiance columns for every reading in one batched call.
+
+    Readings whose coordinates failed extraction (0, -1, or missing) use the study site's coordinates.
+
+    :param data: readings with timestamp, latitude, and longitude columns
+    :param time_col: column name for time data
+    :param timezone: timezone of naive timestamps
+    :return: data with solar_altitude, solar_azimuth, clearsky_flat, and clearsky_tilted columns added
+    """
+    latitude = data["latitude"].to_numpy(dtype=float)
+    longitude = data["longitude"].to_numpy(dtype=float)
+    invalid = ~np.isfinite(latitude) | ~np.isfinite(longitude) | (latitude == -1) | (longitude == -1) | ((latitude == 0) & (longitude == 0))
+    latitude = np.where(invalid, SITE_LATITUDE, latitude)
+    longitude = np.where(invalid, SITE_LONGITUDE, longitude)
+
+    timestamps = data[time_col]
+    altitude, azimuth = solar_position(timestamps, latitude, longitude, timezone)
+    flat, tilted = clear_sky_irradiance(altitude, azimuth, timestamps.dt.dayofyear.to_numpy())
+
+    output = data.copy()
+    output["solar_altitude"] = altitude
+    output["solar_azimuth"] = azimuth
+    output["clearsky_flat"] = flat
+    output["clearsky_tilted"] = tilted
+    output.loc[timestamps.isna().to_numpy(), SOLAR_COLUMNS] = np.nan
+    return output
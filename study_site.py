@@ -0,0 +1,3 @@
+# Location of the study site, Indiana University Northwest. Every script that needs the site's coordinates imports them from here.
+SITE_LATITUDE = 41.60
+SITE_LONGITUDE = -87.33
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from dataset_schema import METADATA, apply_schema, read_table, write_table
+
+# a collection season crossing the end of daylight saving time (Nov 3 2024 in Chicago)
+ACROSS_DST = ["2024-10-30T10:15:00-05:00", "2024-11-05T10:15:00-06:00", "2024-11-05T14:45:30-06:00"]
+WALL_CLOCK = pd.to_datetime(["2024-10-30 10:15:00", "2024-11-05 10:15:00", "2024-11-05 14:45:30"])
+
+def test_mixed_offsets_keep_wall_clock():
+    data = apply_schema(pd.DataFrame({"timestamp": ACROSS_DST}), METADATA)
+    assert data["timestamp"].dtype == "datetime64[ns]"
+    assert data["timestamp"].tolist() == WALL_CLOCK.tolist()
+
+def test_mixed_offsets_with_missing_values():
+    data = apply_schema(pd.DataFrame({"timestamp": [ACROSS_DST[0], None, ACROSS_DST[1]]}), METADATA)
+    assert data["timestamp"].isna().tolist() == [False, True, False]
+    assert data["timestamp"].iloc[2] == WALL_CLOCK[1]
+
+def test_timezone_aware_column_keeps_wall_clock():
+    aware = pd.Series(WALL_CLOCK).dt.tz_localize("America/Chicago")
+    data = apply_schema(pd.DataFrame({"timestamp": aware}), METADATA)
+    assert data["timestamp"].tolist() == WALL_CLOCK.tolist()
+
+def test_csv_round_trip_across_dst(tmp_path):
+    path = tmp_path / "metadata.csv"
+    pd.DataFrame({"filename": ["a.png", "b.png", "c.png"], "timestamp": ACROSS_DST, "mtime": [1, 2, 3]}).to_csv(path, index=False)
+    data = read_table(path, METADATA)
+    assert data["timestamp"].tolist() == WALL_CLOCK.tolist()
+
+    write_table(data, tmp_path / "metadata.parquet", METADATA)
+    pd.testing.assert_frame_equal(read_table(tmp_path / "metadata.parquet", METADATA), data)
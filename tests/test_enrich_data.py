@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import enrich_data
+from dataset_schema import FULL_DATASET, READINGS, apply_schema, read_file, read_table, partitions, write_table
+from test_visualcrossing import StandIn, make_client # noqa: F401 (fixture)
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    """Two months of readings whose file order differs from time order, with metadata, sky, and locations."""
+    rng = np.random.default_rng(0)
+    times = pd.Timestamp("2024-06-29 08:00") + pd.to_timedelta(rng.permutation(40) * 3, unit="h")
+    metadata = pd.DataFrame({"filename": [f"IMG_{i:04d}.png" for i in range(40)], "timestamp": times})
+    metadata.loc[5, "timestamp"] = pd.NaT # no time. dropped by both builds
+    for i, month in enumerate(["June", "July"]):
+        readings = metadata.iloc[i * 20:(i + 1) * 20]
+        write_table(pd.DataFrame({
+            "filename": readings["filename"],
+            "measurement": rng.uniform(0, 900, 20),
+            "latitude": 41.6 + rng.uniform(-1e-4, 1e-4, 20),
+            "longitude": -87.33 + rng.uniform(-1e-4, 1e-4, 20)
+        }), enrich_data.table_path(month, tmp_path), READINGS)
+    metadata.to_csv(tmp_path / "metadata.csv", index=False)
+    pd.DataFrame({"timestamp": pd.date_range("2024-06-29", "2024-07-07", freq="2h"), "sky": "Clear Skies"}).to_csv(tmp_path / "sky_data.csv", index=False)
+    pd.DataFrame({"name": ["Roof"], "latitude": [41.6], "longitude": [-87.33]}).to_csv(tmp_path / "locations.csv", index=False)
+
+    monkeypatch.setattr(enrich_data, "DATA_FOLDER", tmp_path)
+    monkeypatch.setattr(enrich_data, "METADATA_FILE", tmp_path / "metadata.csv")
+    monkeypatch.setattr(enrich_data, "SKY_FILE", tmp_path / "sky_data.csv")
+    monkeypatch.setattr(enrich_data, "LOCATION_DATA", tmp_path / "locations.csv")
+    return tmp_path
+
+def test_chunked_build_streams_in_time_order(data_folder, make_client):
+    with StandIn() as stand_in:
+        client = make_client(stand_in)
+        full = enrich_data.build_dataset(["June", "July"], client, data_folder / "full.parquet")
+        rows = enrich_data.build_dataset_chunked(["June", "July"], client, data_folder / "chunked.parquet", chunk_rows=7,
+                                                 csv_file=data_folder / "chunked.csv")
+
+    chunked = read_table(data_folder / "chunked.parquet", FULL_DATASET)
+    assert rows == len(full) == 39
+    assert [len(read_table(part)) for part in partitions(data_folder / "chunked")] == [7, 7, 7, 7, 7, 4]
+    assert chunked["timestamp"].is_monotonic_increasing # across months, unlike the file order
+    pd.testing.assert_frame_equal(chunked, full.sort_values("timestamp").reset_index(drop=True).pipe(apply_schema, FULL_DATASET))
+    pd.testing.assert_frame_equal(apply_schema(read_file(data_folder / "chunked.csv"), FULL_DATASET), chunked)
+    assert not any(path.name.startswith(".staging") for path in data_folder.iterdir()) # intermediate files are removed
+
+def test_staging_writes_one_file_per_day(data_folder, tmp_path_factory):
+    staging_folder = tmp_path_factory.mktemp("staging")
+    days = enrich_data.stage_readings_by_day(["June", "July"], staging_folder, chunk_rows=3)
+    staged = pd.concat([pd.read_parquet(day) for day in days], ignore_index=True)
+
+    assert [len(list(day.glob("*.parquet"))) for day in days] == [1] * len(days) # 14 batches, one file per day
+    assert [day.name for day in days] == sorted(f"day={date}" for date in staged["timestamp"].dt.strftime("%Y-%m-%d").unique())
+    assert len(staged) == 39
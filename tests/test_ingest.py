@@ -0,0 +1,152 @@
+import sys, types, queue, threading
+import pandas as pd
+
+import enrich_data
+from dataset_schema import FULL_DATASET, partitions, read_table, write_table
+from ingest import DatasetAppender, IngestDaemon, Ledger
+from synthetic import write_png
+from test_enrich_data import data_folder # noqa: F401 (fixture)
+from test_visualcrossing import StandIn, make_client # noqa: F401 (fixture)
+
+def rows(filenames: list[str], measurement: float = 500.0) -> pd.DataFrame:
+    """Combined dataset rows, one per screenshot."""
+    n = len(filenames)
+    data = {column: [0.0] * n for column in FULL_DATASET}
+    data.update({
+        "timestamp": pd.date_range("2024-07-01 12:00", periods=n, freq="min"),
+        "location": ["A"] * n,
+        "sky": ["Sunny"] * n,
+        "filename": filenames,
+        "measurement": [measurement] * n
+    })
+    return pd.DataFrame(data)
+
+def test_batches_are_written_as_partitions(tmp_path):
+    dataset_file = tmp_path / "full_dataset.parquet"
+    write_table(rows(["a.png", "b.png"]), dataset_file, FULL_DATASET)
+    base_mtime = dataset_file.stat().st_mtime_ns
+
+    appender = DatasetAppender(dataset_file)
+    appender.append(rows(["c.png"]))
+    appender.append(rows(["d.png", "e.png"]))
+
+    assert dataset_file.stat().st_mtime_ns == base_mtime # the existing dataset is never rewritten for new screenshots
+    assert [path.name for path in partitions(appender.folder)] == ["part-00000.parquet", "part-00001.parquet"]
+    assert read_table(dataset_file, FULL_DATASET)["filename"].tolist() == ["a.png", "b.png", "c.png", "d.png", "e.png"]
+
+def test_reprocessed_screenshots_replace_their_rows(tmp_path):
+    dataset_file = tmp_path / "full_dataset.parquet"
+    write_table(rows(["a.png", "b.png"]), dataset_file, FULL_DATASET)
+    DatasetAppender(dataset_file).append(rows(["c.png"]))
+
+    appender = DatasetAppender(dataset_file) # a restarted daemon indexes the file and the partitions
+    appender.append(rows(["a.png", "c.png"], measurement=900.0))
+
+    dataset = read_table(dataset_file, FULL_DATASET)
+    assert sorted(dataset["filename"]) == ["a.png", "b.png", "c.png"]
+    assert dataset.set_index("filename")["measurement"].to_dict() == {"a.png": 900.0, "b.png": 500.0, "c.png": 900.0}
+    assert len(partitions(appender.folder)) == 1 # the partition left empty by the replacement is removed
+
+def test_appending_without_a_dataset(tmp_path):
+    dataset_file = tmp_path / "full_dataset.parquet"
+    DatasetAppender(dataset_file).append(rows(["a.png"]))
+    assert not dataset_file.exists()
+    assert read_table(dataset_file, FULL_DATASET)["filename"].tolist() == ["a.png"]
+
+def test_ledger_survives_restart(tmp_path):
+    ledger = Ledger(tmp_path / "ledger.jsonl")
+    ledger.record([("September/a.png", 1, "appended"), ("September/b.png", 2, "failed")])
+    with open(tmp_path / "ledger.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"path": "September/c.png", "mti') # cut short by a crash
+
+    restarted = Ledger(tmp_path / "ledger.jsonl")
+    assert ("September/a.png", 1) in restarted
+    assert ("September/a.png", 3) not in restarted # edited since
+    assert ("September/c.png", 0) not in restarted
+
+def test_ledger_retries_with_backoff(tmp_path):
+    ledger = Ledger(tmp_path / "ledger.jsonl", max_attempts=3, retry_delay=0.0)
+    ledger.record([("September/a.png", 1, "error"), ("September/b.png", 1, "failed"), ("September/c.png", 1, "unmatched")])
+    assert ("September/a.png", 1) not in ledger # due for a retry
+    assert ("September/b.png", 1) in ledger # unreadable screenshots wait for a manual requeue
+    assert ("September/c.png", 1) not in ledger
+
+    ledger.record([("September/a.png", 1, "error"), ("September/a.png", 1, "error")])
+    assert ("September/a.png", 1) in ledger # out of attempts
+
+    waiting = Ledger(tmp_path / "ledger.jsonl", retry_delay=3600.0)
+    assert ("September/c.png", 1) in waiting # the next attempt is an hour away
+
+def test_ledger_requeue(tmp_path):
+    ledger = Ledger(tmp_path / "ledger.jsonl")
+    ledger.record([("September/a.png", 1, "appended"), ("September/b.png", 1, "failed")])
+    requeued = Ledger(tmp_path / "ledger.jsonl", requeue=True)
+    assert ("September/a.png", 1) in requeued
+    assert ("September/b.png", 1) not in requeued
+
+def test_worker_survives_unexpected_errors(tmp_path):
+    folder = tmp_path / "screenshots" / "September"
+    folder.mkdir(parents=True)
+    bad, good = folder / "bad.png", folder / "good.png"
+    bad.write_bytes(b"png")
+    good.write_bytes(b"png")
+
+    # only the attributes the worker uses. constructing the daemon loads the vision model
+    daemon = IngestDaemon.__new__(IngestDaemon)
+    daemon.screenshot_folder = tmp_path / "screenshots"
+    daemon.ledger = Ledger(tmp_path / "ledger.jsonl")
+    daemon.queue = queue.Queue()
+    daemon.pending = {bad, good}
+    daemon.pending_lock = threading.Lock()
+    daemon.stop_event = threading.Event()
+    daemon.batch_size = 1
+    daemon.settle_time = 0.01
+
+    processed = []
+    def process_batch(img_paths):
+        if img_paths == [bad]:
+            raise KeyError("timestamp")
+        processed.extend(img_paths)
+    daemon.process_batch = process_batch
+
+    worker = threading.Thread(target=daemon._work, daemon=True)
+    worker.start()
+    daemon.queue.put(bad)
+    daemon.queue.put(good)
+    daemon.queue.join()
+
+    assert worker.is_alive()
+    assert processed == [good]
+    assert daemon.ledger.status("September/bad.png") == "error"
+    assert daemon.pending == set()
+    daemon.stop_event.set()
+    worker.join()
+
+def test_rebuilding_keeps_ingested_screenshots(data_folder, make_client, monkeypatch):
+    folder = data_folder / "screenshots" / "July"
+    folder.mkdir(parents=True)
+    img_paths = [write_png(folder / f"IMG_{i}.png", pd.Timestamp(f"2024-07-02 {i - 90}:00"), width=8, height=8) for i in (100, 101)]
+
+    # the OCR step, which needs the vision model. every screenshot reads 123 W/m² at the site
+    def split_results(detections):
+        filenames = [filename for filename, _ in detections]
+        readings = pd.DataFrame({"filename": filenames, "measurement": 123.0, "longitude": -87.33, "latitude": 41.6})
+        return readings, pd.DataFrame(columns=["filename"])
+    vision_ai = types.SimpleNamespace(OCRRunner=lambda workers: None, split_results=split_results,
+                                      detect_screenshots=lambda img_paths, runner: [(img_path.name, "") for img_path in img_paths])
+    monkeypatch.setitem(sys.modules, "vision_ai", vision_ai)
+
+    dataset_file = data_folder / "full_dataset.parquet"
+    with StandIn() as stand_in:
+        client = make_client(stand_in)
+        enrich_data.build_dataset(["June", "July"], client, dataset_file)
+        daemon = IngestDaemon(client, data_folder / "screenshots", dataset_file, data_folder, Ledger(data_folder / "ledger.jsonl"), use_watchdog=False)
+        daemon.process_batch(img_paths)
+        ingested = read_table(dataset_file, FULL_DATASET)
+        rebuilt = enrich_data.build_dataset(["June", "July"], client, dataset_file)
+
+    assert len(ingested) == 41
+    assert partitions(data_folder / "full_dataset") == [] # folded into the rebuilt file
+    assert sorted(rebuilt["filename"]) == sorted(ingested["filename"])
+    assert rebuilt.set_index("filename").loc["IMG_100.png", "measurement"] == 123.0
+    assert pd.read_csv(data_folder / "metadata.csv")["filename"].tolist()[-2:] == ["IMG_100.png", "IMG_101.png"]
@@ -0,0 +1,25 @@
+import pandas as pd
+
+from intervals import snap_to_interval
+
+def snap(*timestamps: str, interval_hours: int = 2) -> list:
+    return snap_to_interval(pd.Series(pd.to_datetime(list(timestamps), format="ISO8601")), interval_hours).tolist()
+
+def test_rounding_at_the_boundary():
+    # hours on a mark round down, the hour before a mark rounds up
+    assert snap("2024-07-01 10:00", "2024-07-01 10:59:59", "2024-07-01 11:00", "2024-07-01 11:59:59") == \
+        [pd.Timestamp("2024-07-01 10:00")] * 2 + [pd.Timestamp("2024-07-01 12:00")] * 2
+
+def test_other_intervals():
+    assert snap("2024-07-01 10:30", "2024-07-01 12:00", interval_hours=3) == [pd.Timestamp("2024-07-01 12:00")] * 2
+    assert snap("2024-07-01 10:30", interval_hours=1) == [pd.Timestamp("2024-07-01 10:00")]
+
+def test_midnight_rollover():
+    assert snap("2024-07-01 23:30", "2024-12-31 23:00", "2024-07-02 00:45") == \
+        [pd.Timestamp("2024-07-02"), pd.Timestamp("2025-01-01"), pd.Timestamp("2024-07-02")]
+
+def test_missing_timestamps_stay_missing():
+    snapped = snap_to_interval(pd.Series(pd.to_datetime(["2024-07-01 09:15", None])))
+    assert snapped.dtype.kind == "M"
+    assert snapped.iloc[0] == pd.Timestamp("2024-07-01 10:00")
+    assert pd.isna(snapped.iloc[1])
@@ -0,0 +1,46 @@
+import matplotlib
+matplotlib.use("Agg") # no display while plotting
+
+import numpy as np
+import pandas as pd
+
+from location_labels import LocationLabeler, MISSING_LABEL, add_location_labels
+
+# two sites about 111 m apart
+LOCATIONS = pd.DataFrame({"name": ["North", "South"], "latitude": [41.601, 41.600], "longitude": [-87.33, -87.33]})
+
+def readings() -> pd.DataFrame:
+    return pd.DataFrame({
+        "filename": [f"IMG_{i}.png" for i in range(7)],
+        "latitude": [41.60099, 41.60002, 41.6006, 41.7, 0.0, -1.0, 41.6],
+        "longitude": [-87.33, -87.33001, -87.33, -87.33, 0.0, -87.33, -1.0]
+    })
+
+def test_nearest_site():
+    labels, distances = LocationLabeler(LOCATIONS).label([41.60099, 41.60002], [-87.33, -87.33001])
+    assert labels.tolist() == ["North", "South"]
+    assert distances[0] < 2 and distances[1] < 3
+
+def test_max_distance_cutoff():
+    # 41.6006 is about 44 m from North and 67 m from South
+    labels, distances = LocationLabeler(LOCATIONS, max_distance=50.0).label([41.6006, 41.7], [-87.33, -87.33])
+    assert labels.tolist() == ["North", MISSING_LABEL]
+    assert 40 < distances[0] < 50 and np.isnan(distances[1])
+
+    labels, distances = LocationLabeler(LOCATIONS, max_distance=40.0).label([41.6006], [-87.33])
+    assert labels.tolist() == [MISSING_LABEL] # farther sites are not matched instead
+    assert np.isnan(distances[0])
+
+def test_failed_extractions_are_missing():
+    labels, distances = LocationLabeler(LOCATIONS, max_distance=1e7).label([0.0, -1.0, 41.6, np.nan], [0.0, -87.33, -1.0, -87.33])
+    assert labels.tolist() == [MISSING_LABEL] * 4 # even with a cutoff covering the globe
+    assert np.isnan(distances).all()
+
+def test_labels_and_plot_are_deterministic(tmp_path):
+    first = add_location_labels(readings(), LOCATIONS, plot_file=tmp_path / "first.png")
+    second = add_location_labels(readings(), LOCATIONS, plot_file=tmp_path / "second.png")
+
+    assert first["location"].tolist() == ["North", "South", "North", *[MISSING_LABEL] * 4]
+    pd.testing.assert_frame_equal(first, second)
+    pd.testing.assert_frame_equal(first.drop(columns="location"), readings()) # the input is left as it was
+    assert (tmp_path / "first.png").read_bytes() == (tmp_path / "second.png").read_bytes()
@@ -0,0 +1,56 @@
+import pandas as pd
+
+from metadata import update_metadata_file
+from synthetic import write_png
+
+def screenshots(folder, names):
+    folder.mkdir(exist_ok=True)
+    for i, name in enumerate(names):
+        write_png(folder / name, pd.Timestamp("2024-06-01 12:00") + pd.Timedelta(minutes=i), width=8, height=8)
+    return folder
+
+def test_no_index_column_is_written(tmp_path):
+    output_file = tmp_path / "metadata.csv"
+    june = screenshots(tmp_path / "June", ["IMG_1.png", "IMG_2.png"])
+    update_metadata_file([june], output_file)
+    screenshots(tmp_path / "July", ["IMG_3.png"])
+    update_metadata_file([june, tmp_path / "July"], output_file) # appended
+    (june / "IMG_1.png").touch() # changed. the file is rewritten
+    update_metadata_file([june, tmp_path / "July"], output_file)
+
+    recorded = pd.read_csv(output_file)
+    assert recorded.columns.tolist() == ["filename", "timestamp", "mtime"]
+    assert sorted(recorded["filename"]) == ["IMG_1.png", "IMG_2.png", "IMG_3.png"]
+
+def test_files_with_an_index_column_are_rewritten(tmp_path):
+    output_file = tmp_path / "metadata.csv"
+    june = screenshots(tmp_path / "June", ["IMG_1.png"])
+    update_metadata_file([june], output_file)
+    pd.read_csv(output_file).to_csv(output_file) # as earlier versions wrote it
+    screenshots(tmp_path / "July", ["IMG_2.png"])
+
+    new_rows = update_metadata_file([june, tmp_path / "July"], output_file)
+    recorded = pd.read_csv(output_file)
+    assert new_rows["filename"].tolist() == ["IMG_2.png"]
+    assert recorded.columns.tolist() == ["filename", "timestamp", "mtime"]
+    assert recorded["filename"].tolist() == ["IMG_1.png", "IMG_2.png"]
+
+def test_no_folders(tmp_path):
+    output_file = tmp_path / "metadata.csv"
+    assert len(update_metadata_file([], output_file)) == 0
+    assert not output_file.exists()
+
+def test_removed_screenshots_are_dropped(tmp_path):
+    output_file = tmp_path / "metadata.csv"
+    june = screenshots(tmp_path / "June", ["IMG_1.png", "IMG_2.png", "IMG_3.png"])
+    pd.DataFrame({"filename": ["IMG_1.png", "IMG_2.png", "IMG_3.png"], "timestamp": "2024-06-01T12:00:00"}).to_csv(output_file, index=False) # no mtime yet
+    (june / "IMG_3.png").unlink()
+
+    assert len(update_metadata_file([june], output_file)) == 2 # rescanned once to record their mtime
+    assert len(update_metadata_file([june], output_file)) == 0
+    assert len(update_metadata_file([june], output_file)) == 0
+
+    recorded = pd.read_csv(output_file).sort_values("filename")
+    assert recorded["filename"].tolist() == ["IMG_1.png", "IMG_2.png"]
+    assert recorded["mtime"].dtype == "int64"
+    assert recorded["mtime"].tolist() == [(june / name).stat().st_mtime_ns for name in ["IMG_1.png", "IMG_2.png"]]
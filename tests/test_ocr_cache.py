@@ -0,0 +1,16 @@
+from ocr_cache import OCRCache, ENGINE_CONFIG, model_version
+
+def test_model_version_follows_the_engine_config():
+    assert model_version().endswith("/onnx-mobile") # same keys as caches written before the config was tracked
+    assert model_version({**ENGINE_CONFIG, "device": "cuda"}) == model_version()
+    assert model_version({**ENGINE_CONFIG, "mode": "server"}).endswith("/onnx-server")
+    assert model_version({**ENGINE_CONFIG, "onnx_rec_model_path": "rec.onnx"}).endswith("/onnx-mobile;onnx_rec_model_path=rec.onnx")
+
+def test_keys_differ_between_models(tmp_path):
+    img_path = tmp_path / "IMG_1.png"
+    img_path.write_bytes(b"screenshot")
+    mobile = OCRCache(tmp_path / "cache")
+    server = OCRCache(tmp_path / "cache", model_version({**ENGINE_CONFIG, "mode": "server"}))
+    mobile.put(mobile.key(img_path), img_path.name, "IMG_1.png\t[]", 0.5)
+    assert mobile.get(mobile.key(img_path)) == "IMG_1.png\t[]"
+    assert server.get(server.key(img_path)) is None
@@ -0,0 +1,55 @@
+import pandas as pd
+
+from dataset_schema import PAIRS
+from location_labels import MISSING_LABEL
+from pairing import label_orientation, pair_readings
+
+START = pd.Timestamp("2024-07-01 10:00")
+
+def readings(visits: list[tuple[str, list[int]]]) -> pd.DataFrame:
+    """Readings taken at each location, minutes after START."""
+    rows = [(location, START + pd.Timedelta(minutes=minute)) for location, minutes in visits for minute in minutes]
+    return pd.DataFrame({
+        "location": [location for location, _ in rows],
+        "timestamp": [timestamp for _, timestamp in rows],
+        "measurement": [100.0 + i for i in range(len(rows))],
+        "filename": [f"IMG_{i}.png" for i in range(len(rows))],
+        "latitude": 41.6,
+        "longitude": -87.33,
+        "sky": "Clear Skies"
+    })
+
+def test_orientation_alternates_within_a_session():
+    labeled = label_orientation(readings([("Roof", [0, 1, 2, 3])]))
+    assert labeled["orientation"].tolist() == ["Angled", "Flat", "Angled", "Flat"]
+    assert labeled["pair"].tolist() == [0, 0, 1, 1]
+    assert not labeled["orphan"].any()
+
+def test_sessions_split_on_a_time_gap():
+    # the third reading comes 30 minutes later, so it starts over as an angled reading
+    labeled = label_orientation(readings([("Roof", [0, 1, 31, 32])]))
+    assert labeled["session"].tolist() == [0, 0, 1, 1]
+    assert labeled["orientation"].tolist() == ["Angled", "Flat", "Angled", "Flat"]
+
+    labeled = label_orientation(readings([("Roof", [0, 1, 31, 32])]), window=pd.Timedelta(hours=1))
+    assert labeled["session"].tolist() == [0, 0, 0, 0]
+
+def test_last_reading_of_an_odd_session_is_an_orphan():
+    data = readings([("Garden", [0, 1, 2]), ("Roof", [5, 6])])
+    data.loc[len(data)] = data.loc[0].copy()
+    data.loc[len(data) - 1, ["location", "filename"]] = [MISSING_LABEL, "IMG_far.png"] # away from every location
+
+    pairs, orphans = pair_readings(data)
+    assert orphans["filename"].tolist() == ["IMG_2.png", "IMG_far.png"]
+    assert pairs["angled_filename"].tolist() == ["IMG_0.png", "IMG_3.png"]
+    assert pairs["flat_filename"].tolist() == ["IMG_1.png", "IMG_4.png"]
+
+def test_paired_table_columns():
+    pairs, orphans = pair_readings(readings([("Roof", [0, 2])]))
+    assert sorted(pairs.columns) == sorted(["location", "timestamp", "sky", "Angled", "Flat", "seconds_apart",
+                                            *[f"{orientation}_{column}" for orientation in ("angled", "flat")
+                                              for column in ("filename", "latitude", "longitude")]])
+    assert set(pairs.columns) <= set(PAIRS)
+    assert pairs.loc[0, ["Angled", "Flat", "seconds_apart"]].tolist() == [100.0, 101.0, 120.0]
+    assert pairs.loc[0, "timestamp"] == START # time of the angled reading
+    assert orphans.empty
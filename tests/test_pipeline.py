@@ -0,0 +1,75 @@
+import pytest
+
+from pipeline import Pipeline, Stage, hash_files
+
+def copy_stage(name: str, source, target, calls: list[str]) -> Stage:
+    """Stage copying one file to another, recording each run."""
+    def run():
+        calls.append(name)
+        target.write_text(source.read_text())
+    return Stage(name, run, lambda: [source], [target])
+
+def test_hash_files(tmp_path):
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    a.write_text("one")
+    missing = hash_files([a, b]) # b is hashed by name
+    assert hash_files([b, a]) == missing # order does not matter
+
+    b.write_text("")
+    empty = hash_files([a, b])
+    assert empty != missing
+
+    a.write_text("two")
+    edited = hash_files([a, b])
+    assert edited != empty
+
+    a.write_text("tw") # the same bytes split differently between the files
+    b.write_text("o")
+    assert hash_files([a, b]) != edited
+
+def test_unchanged_inputs_are_skipped(tmp_path):
+    source, target, calls = tmp_path / "source.txt", tmp_path / "target.txt", []
+    source.write_text("reading")
+    stages = [copy_stage("copy", source, target, calls)]
+
+    assert Pipeline(stages, tmp_path / "state.json").run()["copy"][0] == "ran"
+    assert Pipeline(stages, tmp_path / "state.json").run()["copy"][0] == "skipped" # the hash survives a restart
+    assert Pipeline(stages, tmp_path / "state.json").run(force=True)["copy"][0] == "ran"
+    assert calls == ["copy", "copy"]
+
+def test_changed_inputs_and_missing_outputs_rerun(tmp_path):
+    source, target, calls = tmp_path / "source.txt", tmp_path / "target.txt", []
+    source.write_text("reading")
+    pipeline = Pipeline([copy_stage("copy", source, target, calls)], tmp_path / "state.json")
+    pipeline.run()
+
+    source.write_text("edited")
+    assert pipeline.run()["copy"][0] == "ran"
+    assert target.read_text() == "edited"
+
+    target.unlink()
+    assert pipeline.run()["copy"][0] == "ran"
+    assert pipeline.run()["copy"][0] == "skipped"
+    assert calls == ["copy"] * 3
+
+def test_stages_run_after_their_dependencies(tmp_path):
+    raw, clean, report, calls = tmp_path / "raw.txt", tmp_path / "clean.txt", tmp_path / "report.txt", []
+    raw.write_text("reading")
+    # declared out of order. report reads what clean writes
+    pipeline = Pipeline([copy_stage("report", clean, report, calls), copy_stage("clean", raw, clean, calls)], tmp_path / "state.json")
+
+    assert pipeline.dependencies == {"report": {"clean"}, "clean": set()}
+    pipeline.run()
+    assert calls == ["clean", "report"]
+    assert report.read_text() == "reading"
+
+    raw.write_text("edited") # both rerun, since clean rewrites the input of report
+    assert {name: status for name, (status, _) in pipeline.run().items()} == {"clean": "ran", "report": "ran"}
+    assert calls == ["clean", "report", "clean", "report"]
+
+def test_cycles_are_rejected(tmp_path):
+    a, b, calls = tmp_path / "a.txt", tmp_path / "b.txt", []
+    pipeline = Pipeline([copy_stage("forward", a, b, calls), copy_stage("back", b, a, calls)], tmp_path / "state.json")
+    with pytest.raises(ValueError, match="depend on each other"):
+        pipeline.run()
+    assert calls == []
@@ -0,0 +1,37 @@
+import numpy as np
+
+from preprocess import Preprocessor, SEPARATOR
+
+REGIONS = {"measurement": (0.1, 0.2, 0.5, 0.4), "latitude": (0.5, 0.5, 1.0, 0.7)}
+
+def screenshot() -> np.ndarray:
+    """200x100 BGR image. Each region is filled with its own shade so crops can be traced back to where they came from."""
+    img = np.full((100, 200, 3), 200, dtype=np.uint8)
+    img[20:40, 20:100] = 0 # measurement
+    img[50:70, 100:200] = 100 # latitude
+    return img
+
+def test_composite_size():
+    composite = Preprocessor(REGIONS)(screenshot())
+    # crops are 80x20 & 100x20, halved to 40x10 & 50x10, and stacked with a separator under each
+    assert composite.shape == (2 * (10 + SEPARATOR), 50, 3)
+    assert composite.dtype == np.uint8
+
+def test_crop_geometry():
+    composite = Preprocessor(REGIONS)(screenshot())[:, :, 0]
+    assert (composite[:10, :40] == 0).all() # measurement crop holds nothing but its region
+    assert (composite[:10, 40:] == 255).all() # padded to the widest crop
+    assert (composite[10:10 + SEPARATOR] == 255).all()
+    assert (composite[10 + SEPARATOR:20 + SEPARATOR] == 100).all() # latitude crop
+    assert (composite[20 + SEPARATOR:] == 255).all()
+
+def test_full_scale_keeps_color():
+    img = screenshot()
+    img[20:40, 20:100] = (255, 0, 0)
+    composite = Preprocessor(REGIONS, scale=1, grayscale=False)(img)
+    assert composite.shape == (2 * (20 + SEPARATOR), 100, 3)
+    assert (composite[:20, :80] == (255, 0, 0)).all()
+
+def test_regions_outside_the_image_are_skipped():
+    img = screenshot()
+    assert Preprocessor({"measurement": (0.1, 1.0, 0.5, 1.0)})(img) is img # nothing to crop. the full image is used
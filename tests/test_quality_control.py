@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import quality_control as qc
+from quality_control import QCFlag
+
+START = pd.Timestamp("2024-07-01 12:00")
+
+def readings(**columns) -> pd.DataFrame:
+    """Clean readings one minute apart at the same spot. Columns given as keyword arguments replace the defaults."""
+    n = len(next(iter(columns.values()))) if columns else 2
+    data = pd.DataFrame({
+        "timestamp": [START + pd.Timedelta(minutes=i) for i in range(n)],
+        "location": ["A"] * n,
+        "measurement": [500.0] * n,
+        "latitude": [41.6] * n,
+        "longitude": [-87.33] * n,
+        "filename": [f"IMG_{i}.png" for i in range(n)]
+    })
+    for column, values in columns.items():
+        data[column] = values
+    return data
+
+def test_clean_readings_pass():
+    assert qc.evaluate(readings()).tolist() == [0, 0]
+
+def test_missing_field():
+    data = readings(measurement=[-1.0, 500.0, 500.0], latitude=[41.6, np.nan, 41.6], longitude=[-87.33, -87.33, -1])
+    assert qc.check_missing(data).tolist() == [True, True, True]
+    assert qc.check_missing(readings()).tolist() == [False, False]
+
+def test_range_uses_the_highest_available_model():
+    data = readings(
+        measurement=[-5.0, -1.0, 900.0, 950.0, 2000.0],
+        clearsky_tilted=[700.0, 700.0, 700.0, np.nan, np.nan],
+        solarradiation=[100.0, 100.0, 100.0, 700.0, np.nan]
+    )
+    # ceilings: 700 * 1.25 + 50 = 925 for the first four. the last has no model, so only negatives fail
+    assert qc.check_range(data).tolist() == [True, False, False, True, False]
+
+def test_range_without_models_flags_negatives_only():
+    assert qc.check_range(readings(measurement=[-5.0, 5000.0, -1.0])).tolist() == [True, False, False]
+
+def test_coordinate_jump():
+    # 0.001° of latitude is ~111 m. one minute allows 30 m + 2 m/s * 60 s = 150 m
+    data = readings(latitude=[41.600, 41.601, 41.611, 41.611], longitude=[-87.33] * 4)
+    assert qc.check_jumps(data).tolist() == [False, False, True, False]
+
+def test_coordinate_jump_follows_time_order_and_skips_failed_coordinates():
+    data = readings(latitude=[41.611, -1.0, 41.600], longitude=[-87.33] * 3)
+    data["timestamp"] = [START + pd.Timedelta(minutes=2), START + pd.Timedelta(minutes=1), START]
+    assert qc.check_jumps(data).tolist() == [True, False, False]
+    assert qc.check_jumps(data, walking_speed=20).tolist() == [False, False, False]
+
+def test_duplicate_timestamp():
+    data = readings(measurement=[1.0, 2.0, 3.0])
+    data.loc[2, "timestamp"] = data.loc[0, "timestamp"]
+    data.loc[1, "timestamp"] = pd.NaT
+    assert qc.check_duplicates(data).tolist() == [True, False, True]
+
+def test_inversion_flags_both_readings_of_the_pair():
+    data = readings(measurement=[500.0, 600.0, 500.0, 510.0])
+    assert qc.check_inversions(data).tolist() == [True, True, False, False] # 510 is within the 5% margin
+
+def test_inversion_ignores_failed_extractions():
+    data = readings(measurement=[-1.0, 300.0])
+    assert qc.check_inversions(data).tolist() == [False, False]
+    assert qc.evaluate(data).tolist() == [QCFlag.MISSING_FIELD, 0]
+
+def test_inversion_allowed_while_the_sun_favors_the_flat_sensor():
+    data = readings(measurement=[500.0, 600.0, 500.0, 600.0], clearsky_flat=[900.0, 900.0, 700.0, 700.0], clearsky_tilted=[850.0, 850.0, 800.0, 800.0])
+    assert qc.check_inversions(data).tolist() == [False, False, True, True]
+
+def test_unlocated():
+    data = readings(location=["A", qc.MISSING_LABEL])
+    assert qc.evaluate(data).tolist() == [0, QCFlag.UNLOCATED]
+
+def test_evaluate_combines_rules():
+    data = readings(measurement=[-5.0, 500.0], latitude=[41.6, 41.7])
+    data.loc[1, "timestamp"] = data.loc[0, "timestamp"]
+    flags = qc.evaluate(data)
+    assert flags.dtype == np.uint8
+    assert flags.tolist() == [ # the flat reading also exceeds the negative angled one
+        QCFlag.OUT_OF_RANGE | QCFlag.DUPLICATE_TIMESTAMP | QCFlag.INVERSION,
+        QCFlag.COORDINATE_JUMP | QCFlag.DUPLICATE_TIMESTAMP | QCFlag.INVERSION
+    ]
+
+def test_flag_names_round_trip():
+    values = np.arange(2 ** len(QCFlag), dtype=np.uint8) # every combination of flags
+    for value, name in zip(values, qc.flag_names(values)):
+        decoded = QCFlag(0)
+        for part in filter(None, name.split("|")):
+            decoded |= QCFlag[part]
+        assert decoded == value, name
+
+def test_failure_report():
+    data = readings(measurement=[-5.0, 500.0, 500.0])
+    flags = qc.evaluate(data)
+    report = qc.failure_report(data, flags).set_index("rule")
+    assert report.loc["OUT_OF_RANGE", "readings"] == 1
+    assert report.loc["OUT_OF_RANGE", "examples"] == "IMG_0.png"
+    assert report.loc["ANY", "readings"] == (flags != 0).sum()
+    assert report.loc["INVERSION", "share"] == pytest.approx(2 / 3) # -5 is the angled reading of the first pair
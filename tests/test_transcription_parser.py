@@ -0,0 +1,20 @@
+import pytest
+from bench_transcription_parser import load_corpus, check_corpus
+from synthetic import generate_readings, make_detection
+from transcription_parser import TranscriptionParser
+
+CORPUS = load_corpus()
+
+@pytest.mark.parametrize("entry", CORPUS, ids=[entry["description"] for entry in CORPUS])
+def test_corpus(entry):
+    assert check_corpus(TranscriptionParser(), [entry]) == []
+
+def test_prefixes_recover_unlabeled_coordinates():
+    # unlabeled coordinates of synthetic readings, taken around the site in study_site.py
+    readings = generate_readings(200)
+    readings = readings[readings["latitude"] != -1]
+    for row in readings.head(20).itertuples():
+        detection = make_detection(row.filename, row.measurement, row.latitude, row.longitude).replace("Latitude ", "").replace("Longitude ", "")
+        result = TranscriptionParser(latitude_prefix="41.").parse(row.filename, detection)
+        assert result["latitude"] == pytest.approx(row.latitude, abs=1e-6)
+        assert result["longitude"] == pytest.approx(row.longitude, abs=1e-6)
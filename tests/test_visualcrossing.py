@@ -0,0 +1,165 @@
+import json, time, datetime, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+import pytest
+
+from visualcrossing import VisualCrossingClient
+
+DATA_TYPES = ["cloudcover", "solarradiation"]
+
+class StandIn:
+    """Local stand-in for the Visual Crossing timeline endpoint. Records every request it receives."""
+
+    def __init__(self, delay: float = 0.0, throttle: int = 0, retry_after: int = 1):
+        """
+        :param delay: seconds each response is held, so concurrent requests overlap
+        :param throttle: number of initial requests answered with 429
+        :param retry_after: Retry-After header of throttled responses, in seconds
+        """
+        self.delay = delay
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.requests = [] # (path, time answered, status)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        stand_in = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/timeline"
+
+    @property
+    def ranges(self) -> list[tuple[str, str]]:
+        """First & last day of each request that was answered with data."""
+        parts = [urlparse(path).path.split("/")[3:] for path, _, status in self.requests if status == 200]
+        return sorted((days[0], days[-1]) for days in parts)
+
+    def handle(self, request: BaseHTTPRequestHandler) -> None:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            throttled = self.throttle > 0
+            self.throttle -= throttled
+        try:
+            time.sleep(self.delay)
+            if throttled:
+                status, body, headers = 429, b"Too Many Requests", {"Retry-After": str(self.retry_after)}
+            else:
+                status, body, headers = 200, json.dumps(self.timeline(request.path)).encode("utf-8"), {"Content-Type": "application/json"}
+            with self.lock:
+                self.requests.append((request.path, time.monotonic(), status))
+            request.send_response(status)
+            for name, value in headers.items():
+                request.send_header(name, value)
+            request.send_header("Content-Length", str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def timeline(path: str) -> dict:
+        """Hourly data for every day of the requested range, shaped like a timeline response."""
+        url = urlparse(path)
+        days = url.path.split("/")[3:] # /timeline/<zipcode>/<start>[/<end>]
+        assert parse_qs(url.query)["elements"] == ["datetimeEpoch," + ",".join(DATA_TYPES)]
+        start, end = datetime.date.fromisoformat(days[0]), datetime.date.fromisoformat(days[-1])
+        response = {"days": []}
+        for offset in range((end - start).days + 1):
+            day = start + datetime.timedelta(days=offset)
+            hours = [datetime.datetime.combine(day, datetime.time(hour)) for hour in range(24)]
+            response["days"].append({"hours": [
+                {"datetimeEpoch": int(hour.timestamp()), "cloudcover": 10.0 * (hour.hour % 10), "solarradiation": 50.0 * hour.hour}
+                for hour in hours
+            ]})
+        return response
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def make_client(tmp_path):
+    clients = []
+    def make(stand_in: StandIn, **kwargs) -> VisualCrossingClient:
+        client = VisualCrossingClient("test-key", "46408", DATA_TYPES, tmp_path / "archive.sqlite", base_address=stand_in.address, **kwargs)
+        clients.append(client)
+        return client
+    yield make
+    for client in clients:
+        client.archive.close()
+
+def test_group_days_splits_on_gaps_and_range_limit(make_client):
+    with StandIn() as stand_in:
+        client = make_client(stand_in, max_days_per_request=3)
+        days = ["2024-06-03", "2024-06-01", "2024-06-02", "2024-06-04", "2024-06-10", "2024-06-02"]
+        assert client.group_days(days) == [("2024-06-01", "2024-06-03"), ("2024-06-04", "2024-06-04"), ("2024-06-10", "2024-06-10")]
+    assert stand_in.requests == [] # grouping makes no request
+
+def test_one_request_per_contiguous_run(make_client):
+    with StandIn() as stand_in:
+        client = make_client(stand_in)
+        data = client.retrieve_days(["2024-06-01", "2024-06-02", "2024-06-03", "2024-06-07", "2024-06-20", "2024-06-21"])
+
+    assert stand_in.ranges == [("2024-06-01", "2024-06-03"), ("2024-06-07", "2024-06-07"), ("2024-06-20", "2024-06-21")]
+    assert len(data) == 6 * 24
+    assert data["timestamp"].dt.normalize().nunique() == 6
+
+def test_retry_waits_for_retry_after(make_client):
+    with StandIn(throttle=1, retry_after=1) as stand_in:
+        client = make_client(stand_in, backoff_factor=0)
+        data = client.retrieve_range("2024-06-01", "2024-06-01")
+
+    statuses = [status for _, _, status in stand_in.requests]
+    assert statuses == [429, 200]
+    waited = stand_in.requests[1][1] - stand_in.requests[0][1]
+    assert waited >= 0.9 # Retry-After: 1, with no exponential backoff configured
+    assert len(data) == 24
+
+def test_concurrency_is_bounded(make_client):
+    with StandIn(delay=0.2) as stand_in:
+        client = make_client(stand_in, max_concurrency=2)
+        days = [f"2024-06-{day:02d}" for day in range(1, 20, 2)] # 10 separate ranges
+        client.retrieve_days(days)
+
+    assert len(stand_in.requests) == 10
+    assert stand_in.max_in_flight == 2
+
+def test_enrichment_end_to_end(make_client):
+    readings = pd.DataFrame({
+        "timestamp": pd.to_datetime(["2024-06-01 09:10", "2024-06-01 12:40", "2024-06-02 13:05", "2024-06-05 23:30", None]),
+        "measurement": [300.0, 800.0, 750.0, 5.0, 100.0]
+    })
+    with StandIn() as stand_in:
+        client = make_client(stand_in)
+        enriched = client.enrich(readings)
+        first_run = len(stand_in.requests)
+        again = client.enrich(readings)
+
+    # 23:30 snaps to midnight of the next day, so June 6 is requested instead of June 5
+    assert first_run == 2
+    assert stand_in.ranges == [("2024-06-01", "2024-06-02"), ("2024-06-06", "2024-06-06")]
+    assert len(stand_in.requests) == first_run # the second run is served from the archive
+
+    assert enriched["measurement"].tolist() == [300.0, 800.0, 750.0, 5.0] # the reading without a time is dropped
+    assert enriched["solarradiation"].tolist() == [500.0, 600.0, 700.0, 0.0] # 10:00, 12:00, 14:00, and midnight
+    assert enriched["cloudcover"].tolist() == [0.0, 20.0, 40.0, 0.0]
+    pd.testing.assert_frame_equal(enriched, again)
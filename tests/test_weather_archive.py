@@ -0,0 +1,84 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from weather_archive import WeatherArchive
+
+HOURS = pd.date_range("2024-06-01", periods=4, freq="h")
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = WeatherArchive(tmp_path / "archive.sqlite")
+    yield archive
+    archive.close()
+
+def test_text_elements_are_stored_as_text(archive):
+    archive.append(pd.DataFrame({
+        "timestamp": HOURS[:2],
+        "cloudcover": [20.0, 35.5],
+        "conditions": ["Partially cloudy", "Rain, Overcast"],
+        "icon": ["partly-cloudy-day", None],
+        "preciptype": [None, ["rain", "snow"]]
+    }))
+
+    data = archive.read()
+    assert data["cloudcover"].tolist() == [20.0, 35.5]
+    assert data["conditions"].tolist() == ["Partially cloudy", "Rain, Overcast"]
+    assert data["icon"].iloc[0] == "partly-cloudy-day" and pd.isna(data["icon"].iloc[1])
+    assert pd.isna(data["preciptype"].iloc[0]) and data["preciptype"].iloc[1] == '["rain", "snow"]'
+
+    types = dict(row[1:3] for row in archive.connection.execute(f"PRAGMA table_info({archive.TABLE})"))
+    assert types["cloudcover"] == "REAL"
+    assert types["conditions"] == types["icon"] == types["preciptype"] == "TEXT"
+
+def test_api_nulls_are_not_missing(archive):
+    archive.append(pd.DataFrame({"timestamp": HOURS[:3], "solarradiation": [np.nan, 120.0, None]}))
+    assert archive.missing(HOURS, ["solarradiation"]).tolist() == [HOURS[3]]
+
+def test_newly_requested_types_make_older_rows_missing(archive):
+    archive.append(pd.DataFrame({"timestamp": HOURS[:2], "cloudcover": [10.0, 20.0]}))
+    archive.append(pd.DataFrame({"timestamp": HOURS[2:], "cloudcover": [30.0, 40.0], "solarradiation": [5.0, np.nan]}))
+
+    assert archive.missing(HOURS, ["cloudcover"]).tolist() == []
+    assert archive.missing(HOURS, ["cloudcover", "solarradiation"]).tolist() == list(HOURS[:2])
+
+def test_partial_appends_keep_what_was_retrieved(archive):
+    archive.append(pd.DataFrame({"timestamp": HOURS[:2], "cloudcover": [10.0, 20.0]}))
+    archive.append(pd.DataFrame({"timestamp": HOURS[1:3], "solarradiation": [np.nan, 300.0]}))
+
+    assert archive.missing(HOURS, ["cloudcover"]).tolist() == [HOURS[2], HOURS[3]]
+    assert archive.missing(HOURS, ["solarradiation"]).tolist() == [HOURS[0], HOURS[3]]
+    assert archive.missing(HOURS, ["cloudcover", "solarradiation"]).tolist() == [HOURS[0], HOURS[2], HOURS[3]]
+
+    data = archive.read(timestamps=HOURS[1:2])
+    assert data["cloudcover"].tolist() == [20.0]
+    assert pd.isna(data["solarradiation"].iloc[0])
+
+def test_columns_are_cached(archive):
+    archive.append(pd.DataFrame({"timestamp": HOURS[:1], "cloudcover": [10.0]}))
+    statements = []
+    archive.connection.set_trace_callback(statements.append)
+    archive.missing(HOURS, ["cloudcover"])
+    archive.read(["cloudcover"])
+    assert archive.columns == ["cloudcover"]
+    assert not any("PRAGMA" in statement for statement in statements)
+
+    archive.append(pd.DataFrame({"timestamp": HOURS[:1], "humidity": [80.0]}))
+    assert archive.columns == ["cloudcover", "humidity"]
+
+def test_archives_without_retrieval_tracking_keep_their_rows(tmp_path):
+    path = tmp_path / "archive.sqlite"
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE weather (timestamp INTEGER PRIMARY KEY, cloudcover REAL)")
+    connection.executemany("INSERT INTO weather VALUES (?, ?)", [(int(hour.timestamp()), None) for hour in HOURS[:2]])
+    connection.commit()
+    connection.close()
+
+    archive = WeatherArchive(path)
+    try:
+        assert archive.columns == ["cloudcover"]
+        assert archive.missing(HOURS, ["cloudcover"]).tolist() == list(HOURS[2:])
+    finally:
+        archive.close()
@@ -0,0 +1,109 @@
+import ast, json, re
+import pandas as pd
+import pyarrow as pa
+
+FIELDS = ("measurement", "longitude", "latitude")
+MEASUREMENT = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+" # thousands separators & a leading decimal point are accepted
+COORDINATE_VALUE = r"[-+]?(?:\d+(?:\.\d+)?|\.\d+)"
+COORDINATE = rf"{COORDINATE_VALUE}(?![\d,])" # a comma inside a coordinate is a misread, never a separator
+COORDINATE_END = r"(?:[^\d,]|$)" # the same check without a lookahead, which pyarrow's regex engine lacks
+
+def parse_output(detection: str) -> list[dict]:
+    """Decode the raw output of OpenOCR without evaluating it as code.
+
+    :param detection: OpenOCR's result for a screenshot ("<filename>\\t<json list>")
+    :return: one dictionary per detected text region
+    """
+    payload = detection[detection.index("\t") + 1:]
+    try:
+        return json.loads(payload)
+    except json.JSONDecodeError: # older OpenOCR releases wrote python literals instead of json
+        return ast.literal_eval(payload)
+
+class TranscriptionParser:
+    """
+    Extracts solar irradiance, latitude, and longitude from OpenOCR transcriptions using precompiled patterns.
+
+    Every transcription is scanned once with a single combined pattern. Each value must start right after its label
+    (or at the start of the transcription for an unlabeled irradiance), and a region holding several fields yields all of them.
+    Coordinates whose label was detected separately are recovered by their expected prefix.
+    """
+
+    def __init__(self, latitude_prefix: str = "42.", longitude_prefix: str = "-87."):
+        """Compile the patterns used for extraction.
+
+        :param latitude_prefix: leading digits of every latitude at the study site
+        :param longitude_prefix: leading digits of every longitude at the study site
+        """
+        self.cleanup_pattern = re.compile(r"[_ ]") # spaces are occasionally interpreted as underscores
+        self.field_pattern = re.compile(
+            rf"(?:^|Solar[Il]rradiance:?)(?P<measurement>{MEASUREMENT})W/m[2²]"
+            rf"|Latitude:?(?P<latitude>{COORDINATE})°?"
+            rf"|Longitude:?(?P<longitude>{COORDINATE})°?"
+        )
+        self.fallback_pattern = re.compile(
+            rf"(?P<latitude>{re.escape(latitude_prefix)}\d*)°?"
+            rf"|(?P<longitude>{re.escape(longitude_prefix)}\d*)°?"
+        )
+        # one pattern per field for parse_many. the greedy lead-in makes each find the last labeled value of a region, as parse does
+        self.labeled_patterns = [
+            rf"^(?:.*Solar[Il]rradiance:?)?(?P<measurement>{MEASUREMENT})W/m[2²]",
+            rf"^.*Latitude:?(?P<latitude>{COORDINATE_VALUE}){COORDINATE_END}",
+            rf"^.*Longitude:?(?P<longitude>{COORDINATE_VALUE}){COORDINATE_END}"
+        ]
+        self.prefix_patterns = [
+            rf"^(?P<latitude>{re.escape(latitude_prefix)}\d*)°?$",
+            rf"^(?P<longitude>{re.escape(longitude_prefix)}\d*)°?$"
+        ]
+
+    def parse(self, filename: str, detection: str) -> dict:
+        """Extract the fields of a single screenshot.
+
+        :param filename: name of the screenshot
+        :param detection: OpenOCR's result for the screenshot
+        :return: extracted values. fields that could not be found are left at -1
+        """
+        results = {"filename": filename, "measurement": -1, "longitude": -1, "latitude": -1}
+        fallbacks = {}
+
+        for region in parse_output(detection):
+            transcription = self.cleanup_pattern.sub("", region["transcription"])
+            for match in self.field_pattern.finditer(transcription):
+                field = match.lastgroup
+                results[field] = float(match.group(field).replace(",", ""))
+
+            fallback = self.fallback_pattern.fullmatch(transcription)
+            if fallback:
+                fallbacks.setdefault(fallback.lastgroup, float(fallback.group(fallback.lastgroup)))
+
+        # last ditch effort to find match in the event coordinate and label detection were split
+        for field, value in fallbacks.items():
+            if results[field] == -1:
+                results[field] = value
+
+        return results
+
+    def parse_many(self, filenames: list[str], detections: list[str]) -> pd.DataFrame:
+        """Extract the fields of a whole set of screenshots, such as every entry of the OCR cache.
+
+        The detections are exploded into one row per text region, and each field is extracted from every region at once
+        with Series.str.extract, which runs in pyarrow's regex engine. The results match parse: the last labeled value of a
+        field wins, and a coordinate found by its prefix alone is only used when no labeled one was.
+
+        :param filenames: name of each screenshot
+        :param detections: OpenOCR's result for each screenshot
+        :return: one row per screenshot with the extracted values. fields that could not be found are left at -1
+        """
+        regions = [(i, region["transcription"]) for i, detection in enumerate(detections) for region in parse_output(detection)]
+        screenshots, transcriptions = zip(*regions) if regions else ((), ())
+        transcriptions = pd.Series(transcriptions, index=screenshots, dtype=pd.ArrowDtype(pa.string())) # one row per text region
+        transcriptions = transcriptions.str.replace(self.cleanup_pattern.pattern, "", regex=True)
+
+        labeled = pd.concat([transcriptions.str.extract(pattern) for pattern in self.labeled_patterns], axis=1)
+        labeled["measurement"] = labeled["measurement"].str.replace(",", "", regex=False)
+        prefixed = pd.concat([transcriptions.str.extract(pattern) for pattern in self.prefix_patterns], axis=1)
+        values = labeled.astype(float).groupby(level=0).last().combine_first(prefixed.astype(float).groupby(level=0).first())
+
+        values = values.reindex(index=range(len(detections)), columns=list(FIELDS)).fillna(-1)
+        values.insert(0, "filename", list(filenames))
+        return values
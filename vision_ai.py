@@ -1,130 +1,329 @@
 from openocr import OpenOCR
 from pathlib import Path
 from os import getcwd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os, json, time, argparse, threading
+import cv2
 import pandas as pd
 import onnxruntime as ort
 from typing import Dict, Optional
+from ocr_cache import OCRCache, ENGINE_CONFIG
+import instrumentation
+from dataset_schema import READINGS, FAILURES, table_path, write_table, clear_partitions, partition_folder
+from transcription_parser import TranscriptionParser, FIELDS, parse_output
+from preprocess import Preprocessor, REGIONS_FILE, load_regions
 
 SCREENSHOT_FOLDER = Path(getcwd()) / "screenshots"
 OUTPUT_FOLDER = Path(getcwd()) / "data"
 
-def process_screenshots(archive_path: Path) -> pd.DataFrame:
+_engine = None # vision model shared by every call made from this process
+_engine_lock = threading.Lock()
+
+def load_engine(intra_op_threads: int | None = None, inter_op_threads: int = 1) -> OpenOCR:
+    """Initialize the vision model with a bounded number of ONNX threads.
+
+    :param intra_op_threads: threads used inside a single ONNX operator (None lets onnxruntime decide)
+    :param inter_op_threads: threads used to run independent ONNX operators
+    :return: ready to use vision model
+    """
+    options = ort.SessionOptions()
+    options.log_severity_level = 3
+    options.inter_op_num_threads = inter_op_threads
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+
+    # OpenOCR builds its ONNX sessions without options. Inject ours while the engine is constructed.
+    session_factory = ort.InferenceSession
+    ort.InferenceSession = partial(session_factory, sess_options=options)
+    try:
+        return OpenOCR(**ENGINE_CONFIG) # the same settings identify cached detections (see ocr_cache.model_version)
+    finally:
+        ort.InferenceSession = session_factory
+
+def _get_engine() -> OpenOCR:
+    """Retrieve the vision model for this process, loading it on first use."""
+    global _engine
+    if _engine is None:
+        _engine = load_engine()
+    return _engine
+
+def _init_worker(intra_op_threads: int) -> None:
+    """Load the vision model once when a worker process starts."""
+    global _engine
+    _engine = load_engine(intra_op_threads)
+
+def _detect_batch(img_paths: list[str], rec_batch_num: int = 6, preprocessor: Preprocessor | None = None) -> list[tuple[str, str, float | None]]:
+    """Run the vision model over a batch of screenshots in a single call.
+
+    :param img_paths: screenshot locations
+    :param rec_batch_num: number of text regions handed to the recognition session at once
+    :param preprocessor: crops the screenshots to the relevant widgets first (full images when not given)
+    :return: filename, raw detection (OpenOCR's "<filename>\\t<json>" format), and inference time for each screenshot.
+        unreadable screenshots get an empty detection and no inference time, so they are not cached
+    """
+    images = [cv2.imread(img_path) for img_path in img_paths]
+    readable = [i for i, img in enumerate(images) if img is not None]
+    if preprocessor is not None:
+        images = [preprocessor(img) if img is not None else None for img in images]
+
+    results, time_dicts = [], []
+    if readable:
+        results, time_dicts = _get_engine()(img_numpy=[images[i] for i in readable], rec_batch_num=rec_batch_num)
+
+    output = [(Path(img_path).name, f"{Path(img_path).name}\t[]", None) for img_path in img_paths]
+    for i, res, time_dict in zip(readable, results, time_dicts):
+        filename = Path(img_paths[i]).name
+        output[i] = (filename, f"{filename}\t{json.dumps(res, ensure_ascii=False)}", time_dict.get("time_cost", 0.0))
+    return output
+
+class OCRRunner:
+    """
+    Spreads screenshots across a pool of worker processes, each holding its own warm copy of the vision model.
+
+    Threads are split between workers so the ONNX sessions do not compete for the same cores.
+    """
+
+    def __init__(self, workers: int | None = None, batch_size: int = 8, rec_batch_num: int = 16, intra_op_threads: int | None = None):
+        """Configure the runner. The pool is started on first use.
+
+        :param workers: number of worker processes (defaults to one per core)
+        :param batch_size: screenshots handed to a worker per task
+        :param rec_batch_num: text regions passed to the recognition session at once
+        :param intra_op_threads: ONNX threads per worker (defaults to an even share of the cores)
+        """
+        cores = os.cpu_count() or 1
+        self.workers = workers or cores
+        self.batch_size = batch_size
+        self.rec_batch_num = rec_batch_num
+        self.intra_op_threads = intra_op_threads or max(1, cores // self.workers)
+        self.pool = None
+        self.pool_lock = threading.Lock() # runs may be started from several threads
+        self.last_throughput = 0.0 # images per second of the latest run
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+    def run(self, img_paths: list[Path], preprocessor: Preprocessor | None = None) -> list[tuple[str, str, float | None]]:
+        """Run the vision model over every screenshot.
+
+        :param img_paths: screenshot locations
+        :param preprocessor: crops the screenshots to the relevant widgets first (full images when not given)
+        :return: filename, raw detection, and inference time for each screenshot, in input order. None for unreadable screenshots
+        """
+        img_paths = [str(img_path) for img_path in img_paths] # OpenOCR's backend does not handle Path object
+        batches = [img_paths[i:i + self.batch_size] for i in range(0, len(img_paths), self.batch_size)]
+        detect = partial(_detect_batch, rec_batch_num=self.rec_batch_num, preprocessor=preprocessor)
+
+        start = time.perf_counter()
+        if self.workers == 1:
+            with _engine_lock: # the in-process engine is not safe to share between threads
+                batch_results = [detect(batch) for batch in batches]
+        else:
+            with self.pool_lock:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.intra_op_threads,))
+            batch_results = list(self.pool.map(detect, batches))
+        elapsed = time.perf_counter() - start
+
+        output = [result for batch in batch_results for result in batch]
+        self.last_throughput = len(output) / elapsed if elapsed > 0 else 0.0
+        print(f"OCR processed {len(output)} images in {elapsed:.1f}s ({self.last_throughput:.2f} images/sec)")
+        return output
+
+def parse_detection(filename: str, detection: str, parser: TranscriptionParser | None = None) -> dict:
+    """Extract solar irradiance, longitude, and latitude from the raw output of the vision model.
+
+    :param filename: name of the screenshot
+    :param detection: OpenOCR's result for the screenshot
+    :param parser: transcription parser (defaults to the study site's coordinate prefixes)
+    :return: extracted values. fields that could not be found are left at -1
+    """
+    return (parser or TranscriptionParser()).parse(filename, detection)
+
+def detect_screenshots(img_paths: list[Path], runner: OCRRunner | None = None, cache: OCRCache | None = None,
+                       preprocessor: Preprocessor | None = None) -> list[tuple[str, str]]:
+    """Retrieve the raw vision model output for each screenshot. Only screenshots missing from the cache are processed.
+
+    :param img_paths: screenshot locations
+    :param runner: OCR runner to reuse between calls. a temporary one is created when needed
+    :param cache: detection cache (defaults to the cache in the data folder, or the preprocessor's cache)
+    :param preprocessor: crops the screenshots to the relevant widgets first (full images when not given)
+    :return: filename and raw detection for each screenshot, in input order
+    """
+    cache = cache or (preprocessor.cache() if preprocessor else OCRCache())
+    keys = [cache.key(img_path) for img_path in img_paths]
+    detections = [cache.get(key) for key in keys]
+    misses = [i for i, detection in enumerate(detections) if detection is None]
+    print(f"OCR cache: {len(img_paths) - len(misses)} hits, {len(misses)} misses")
+    instrumentation.count("ocr_cache.hits", len(img_paths) - len(misses))
+    instrumentation.count("ocr_cache.misses", len(misses))
+
+    if misses:
+        if runner is None and len(misses) == 1:
+            with _engine_lock:
+                new_detections = _detect_batch([str(img_paths[misses[0]])], preprocessor=preprocessor)
+        elif runner is None:
+            with OCRRunner() as temp_runner:
+                new_detections = temp_runner.run([img_paths[i] for i in misses], preprocessor)
+        else:
+            new_detections = runner.run([img_paths[i] for i in misses], preprocessor)
+
+        for i, (filename, detection, elapsed) in zip(misses, new_detections):
+            detections[i] = detection
+            if elapsed is None: # a partially written file may be readable on the next run
+                print(f"Could not read {filename}. Not cached.")
+                continue
+            cache.put(keys[i], filename, detection, elapsed)
+            instrumentation.record_latency("ocr", elapsed)
+
+    return [(Path(img_path).name, detection) for img_path, detection in zip(img_paths, detections)]
+
+def split_results(detections: list[tuple[str, str]], parser: TranscriptionParser | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Parse every detection and separate complete records from those missing a field.
+
+    :param detections: filename and raw detection for each screenshot
+    :param parser: transcription parser (defaults to the study site's coordinate prefixes)
+    :return: the data gathered for each image split into two categories: success & failure
+    """
+    filenames = [filename for filename, _ in detections]
+    raw_detections = [detection for _, detection in detections]
+    results = (parser or TranscriptionParser()).parse_many(filenames, raw_detections)
+
+    ### Missed Data Tracking ###
+    missing = (results[list(FIELDS)] == -1).any(axis=1) # default value for results is -1
+    failures = results[missing].copy()
+    failures["detection"] = [detection[detection.index("\t") + 1:] for detection, miss in zip(raw_detections, missing) if miss]
+
+    return results[~missing].reset_index(drop=True), failures.reset_index(drop=True)
+
+def process_screenshots(archive_path: Path, runner: OCRRunner | None = None, cache: OCRCache | None = None, parser: TranscriptionParser | None = None,
+                        preprocessor: Preprocessor | None = None) -> pd.DataFrame:
     """"Utilize OpenOCR vision model to extract solar irradiance, longitude, and latitude from SPARKvue screenshots.
 
     :param archive_path: disc location of the screenshots
+    :param runner: OCR runner to reuse between calls. a temporary one is created when needed
+    :param cache: detection cache for full images (defaults to the cache in the data folder)
+    :param parser: transcription parser (defaults to the study site's coordinate prefixes)
+    :param preprocessor: crops the screenshots to the relevant widgets first. screenshots whose crops fail to parse are retried on the full image
     :return: the data gathered for each image split into two categories: success & failure
     """
-    data = []
-    failures = []
+    img_paths = sorted(archive_path.glob("*.png")) #retrieves the paths to all screenshots
+    with instrumentation.stage("process_screenshots", items=len(img_paths)):
+        if preprocessor is None:
+            return split_results(detect_screenshots(img_paths, runner, cache), parser)
 
-    onnx_engine = OpenOCR(backend="onnx", device="cpu") #initialize vision model
-    options = ort.SessionOptions()
-    options.log_severity_level = 3
+        data, failures = split_results(detect_screenshots(img_paths, runner, preprocessor=preprocessor), parser)
+        if len(failures) == 0:
+            return data, failures
 
-    for img_path in archive_path.glob("*.png") : #retrieves the paths to all screenshots
-        detections, elapsed = onnx_engine(str(img_path))  # OpenOCR's backend does not handle Path object. Convert to a string first
-        r_obj = eval(detections[0][detections[0].index("\t") + 1:])  # OpenOCR's result is a list of results encoded as a list with a label
-
-        results = {
-            "filename": img_path.name,
-            "measurement": -1,
-            "longitude": -1,
-            "latitude": -1
-        }
-
-        for detection in r_obj:
-            transcription = detection["transcription"]
-            transcription = transcription.replace("_", "") # spaces are occasionally interpreted as underscores
-            transcription = transcription.replace(" ", "") # reduces the number of possibilities that need to be tested
-
-            ### Irradiance Processing ###
-            for unit_variation in ("W/m2", "W/m²"):
-                if unit_variation in transcription and transcription != unit_variation:
-                    l_index = 0
-                    r_index = transcription.rindex(unit_variation)
-                    for name_variation in ("SolarIrradiance", 'Solarlrradiance'):
-                        if name_variation in transcription:
-                            l_index = transcription.index(name_variation) + len(name_variation)
-                    try:
-                        results["measurement"] = float(transcription[l_index:r_index])
-                    except Exception as e:
-                        print("Results:", results)
-                        print("Transcription:", transcription)
-                        for d2 in r_obj:
-                            print("\t", d2)
-
-            ### Location Processing ###
-            for name in ("Latitude", "Longitude"):
-                l_index = 0
-                r_index = len(transcription)
-                if name in transcription:
-                    l_index = transcription.index(name) + len(name)
-                    if "°" in transcription:
-                        r_index = transcription.rindex("°")
-                        try:
-                            results[name.lower()] = float(transcription[l_index:r_index])
-                        except Exception as e:
-                            print("Results:", results)
-                            print("Transcription:", transcription)
-                            for d2 in r_obj:
-                                print("\t", d2)
-                    elif not transcription.isalpha(): #scenario where degree sign is missing
-                        try:
-                            results[name.lower()] = float(transcription[l_index:r_index])
-                        except Exception as e:
-                            print("Results:", results)
-                            print("Transcription:", transcription)
-                            for d2 in r_obj:
-                                print("\t", d2)
-
-        # last ditch effort to find match in the event coordinate and label detection were split
-        if results["latitude"] == -1:
-            for detection in r_obj:
-                transcription = detection["transcription"]
-                if transcription.startswith("42."):
-                    transcription = transcription.replace("°", "")
-                    results["latitude"] = float(transcription)
-
-        if results["longitude"] == -1:
-            for detection in r_obj:
-                transcription = detection["transcription"]
-                if transcription.startswith("-87."):
-                    transcription = transcription.replace("°", "")
-                    results["longitude"] = float(transcription)
-
-        ### Missed Data Tracking ###
-        for data_type in results:
-            if results[data_type] == -1: # default value for results is -1
-                results["detection"] = detections[0][detections[0].index("\t") + 1:]
-                failures.append(results)
-                break
+        print(f"{len(failures)} cropped screenshots failed to parse. Retrying on the full image.")
+        instrumentation.count("crop_fallbacks", len(failures))
+        failed = set(failures["filename"])
+        retry = [img_path for img_path in img_paths if img_path.name in failed]
+        full_data, failures = split_results(detect_screenshots(retry, runner, cache), parser)
+        data = pd.concat([data, full_data], ignore_index=True).sort_values("filename", kind="stable")
+        return data.reset_index(drop=True), failures
+
+def _cached_detections(img_paths: list[Path], cache: OCRCache) -> tuple[list[tuple[str, str]], list[Path]]:
+    """Split screenshots into those with a cached detection (filename & detection) and those without."""
+    detections, missing = [], []
+    for img_path in img_paths:
+        detection = cache.get(cache.key(img_path))
+        if detection is None:
+            missing.append(img_path)
         else:
-            data.append(results)
+            detections.append((img_path.name, detection))
+    return detections, missing
+
+def reparse_screenshots(archive_path: Path, cache: OCRCache | None = None, parser: TranscriptionParser | None = None,
+                        preprocessor: Preprocessor | None = None) -> pd.DataFrame:
+    """Re-run the parsing step over cached detections only. The vision model is never loaded.
+
+    :param archive_path: disc location of the screenshots
+    :param cache: detection cache for full images (defaults to the cache in the data folder)
+    :param parser: transcription parser (defaults to the study site's coordinate prefixes)
+    :param preprocessor: parse the detections of the cropped screenshots, as process_screenshots does. screenshots whose
+        crops fail to parse or were never detected fall back to their cached full image detection
+    :return: the data gathered for each cached image split into two categories: success & failure
+    """
+    cache = cache or OCRCache()
+    img_paths = sorted(archive_path.glob("*.png"))
+    if preprocessor is None:
+        detections, missing = _cached_detections(img_paths, cache)
+        data, failures = split_results(detections, parser)
+    else:
+        detections, missing = _cached_detections(img_paths, preprocessor.cache())
+        data, failures = split_results(detections, parser)
+        crop_failed = set(failures["filename"])
+        retry = crop_failed | {img_path.name for img_path in missing}
+        full_detections, missing = _cached_detections([img_path for img_path in img_paths if img_path.name in retry], cache)
+        full_data, full_failures = split_results(full_detections, parser)
+        missing = [img_path for img_path in missing if img_path.name not in crop_failed] # crop failures stay failures
+        retried = {filename for filename, _ in full_detections}
+        failures = pd.concat([failures[~failures["filename"].isin(retried)], full_failures], ignore_index=True)
+        data = pd.concat([data, full_data], ignore_index=True).sort_values("filename", kind="stable").reset_index(drop=True)
+        failures = failures.sort_values("filename", kind="stable").reset_index(drop=True)
 
-    return pd.DataFrame(data), pd.DataFrame(failures)
+    for img_path in missing:
+        print(f"No cached detection for {img_path.name}. Skipping.")
+    return data, failures
 
-def get_detection_for_image(image_path: Path) -> list[dict]:
+def get_detection_for_image(image_path: Path, cache: OCRCache | None = None, preprocessor: Preprocessor | None = None) -> list[dict]:
     """Extract detection data for a single image file.
-    
+
     :param image_path: location of image file to process
+    :param cache: detection cache (defaults to the cache in the data folder, or the preprocessor's cache)
+    :param preprocessor: crops the screenshot to the relevant widgets first. points are then positions in the composite image
     :return: output from the model constructed into a workable object
     """
-    onnx_engine = OpenOCR(backend="onnx", device="cpu")
-    options = ort.SessionOptions()
-    options.log_severity_level = 3
+    cache = cache or (preprocessor.cache() if preprocessor else OCRCache())
+    key = cache.key(image_path)
+    detection = cache.get(key)
+    if detection is None:
+        with _engine_lock:
+            filename, detection, elapsed = _detect_batch([str(image_path)], preprocessor=preprocessor)[0]
+        if elapsed is not None: # unreadable images are tried again next time
+            cache.put(key, filename, detection, elapsed)
+    return parse_output(detection)
 
-    detections, _ = onnx_engine(str(image_path))
-    r_obj = eval(detections[0][detections[0].index("\t") + 1:])
-        
-    return r_obj
+def process_month(month: str, runner: OCRRunner | None = None, cache: OCRCache | None = None, preprocessor: Preprocessor | None = None) -> tuple[Path, Path]:
+    """Process one monthly screenshot folder and record the results in the data folder.
+
+    :param month: name of the folder within the screenshot folder
+    :param runner: OCR runner to reuse between calls. a temporary one is created when needed
+    :param cache: detection cache (defaults to the cache in the data folder)
+    :param preprocessor: crops the screenshots to the relevant widgets first (full images when not given)
+    :return: disc locations of the data and failure records
+    """
+    data, failures = process_screenshots(SCREENSHOT_FOLDER / month, runner, cache, preprocessor=preprocessor)
+    if len(failures) > 0:
+        print("Failures:", failures["filename"].tolist())
+
+    data_output_location = table_path(month, OUTPUT_FOLDER)
+    failure_record_location = table_path(f"{month}_failures", OUTPUT_FOLDER)
+    write_table(data, data_output_location, READINGS)
+    clear_partitions(partition_folder(data_output_location)) # readings appended by ingest.py are in the new table
+    write_table(failures, failure_record_location, FAILURES)
+    return data_output_location, failure_record_location
 
 if __name__ == "__main__":
-    month = "September"
-    archive_path = SCREENSHOT_FOLDER / month
-    data, failures = process_screenshots(archive_path)
-    print("Failures:", failures["filename"])
-
-    data_output_location = OUTPUT_FOLDER / f"{month}.csv"
-    failure_record_location = OUTPUT_FOLDER / f"{month}_failures.csv"
-    data.to_csv(data_output_location)
-    failures.to_csv(failure_record_location)
+    parser = argparse.ArgumentParser(description="Extract irradiance & coordinates from SPARKvue screenshots.")
+    parser.add_argument("months", nargs="*", default=["September"], help="monthly screenshot folders to process")
+    parser.add_argument("--crop", action="store_true", help=f"recognize only the widgets in {REGIONS_FILE.name} (see preprocess.py)")
+    args = parser.parse_args()
+
+    preprocessor = Preprocessor(load_regions()) if args.crop else None
+    with OCRRunner() as runner:
+        for month in args.months:
+            process_month(month, runner, preprocessor=preprocessor)
@@ -1,7 +1,13 @@
-import os, requests, datetime
+import os, time, requests, datetime
 import pandas as pd
 from pathlib import Path
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from weather_archive import WeatherArchive, migrate_csv
+from intervals import snap_to_interval # also imported from here by earlier scripts
+import instrumentation
 
 class VisualCrossingClient:
     """
@@ -11,30 +17,54 @@ class VisualCrossingClient:
     """
     BASE_ADDRESS = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
     
-    def __init__(self, api_key: str, zipcode: str, data_types: list[str], archive_location: Path | None =None):
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_key: str, zipcode: str, data_types: list[str], archive_location: Path | None =None,
+                 max_concurrency: int = 4, max_days_per_request: int = 31, max_retries: int = 5, backoff_factor: float = 1.0,
+                 base_address: str | None = None, interval_hours: int = 2):
         """Initialize the client. Load archived data.
 
         :param api_key: Visual Crossing API key
         :param zipcode: ZIP code of the location where whether data is needed
         :param data_types: Comma-separated weather data types (if None, will try to load from .env)
+        :param archive_location: disc location of the SQLite archive. a .csv path is migrated to a .sqlite file beside it
+        :param max_concurrency: number of requests in flight at once
+        :param max_days_per_request: longest range of days retrieved by a single timeline request
+        :param max_retries: attempts made after a failed request before giving up
+        :param backoff_factor: base delay in seconds for exponential backoff between attempts. Retry-After headers take precedence
+        :param base_address: timeline endpoint (defaults to Visual Crossing. point this at a local server for testing)
+        :param interval_hours: hours between the marks that readings are matched to
         """
         self.zipcode = zipcode
         self.api_key = api_key
         self.data_types = ",".join(data_types) #For additional types visit: https://www.visualcrossing.com/weather-query-builder/
-        
-        if archive_location: 
-            self.archive_path = archive_location
-            self.archive = pd.read_csv(archive_location)
-            self.archive["timestamp"] = pd.to_datetime(self.archive["timestamp"])
-            self.archive = self.archive.drop(columns="Unnamed: 0")
-
-        else: 
-            empty_df = {col_name:[] for col_name in data_types}
-            empty_df["timestamp"] = []
-
-            self.archive_path = Path(os.getcwd()) / "Data/api_archive.csv"
-            self.archive = pd.DataFrame(empty_df)
-            self.archive.to_csv(self.archive_location)
+        self.data_type_list = list(data_types)
+        self.base_address = base_address or self.BASE_ADDRESS
+        self.max_concurrency = max_concurrency
+        self.max_days_per_request = max_days_per_request
+        self.interval_hours = interval_hours
+
+        # a single pooled session is shared by every request. failed requests are retried with exponential backoff
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=["GET"],
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # archives are kept in SQLite. a CSV archive from earlier versions is migrated on first use
+        archive_location = archive_location or Path(os.getcwd()) / "data/api_archive.sqlite"
+        legacy_location = archive_location.with_suffix(".csv")
+        self.archive_path = archive_location.with_suffix(".sqlite")
+        if not self.archive_path.exists() and legacy_location.exists():
+            print(f"Migrating {legacy_location} to {self.archive_path}...")
+            migrate_csv(legacy_location, self.archive_path).close()
+        self.archive = WeatherArchive(self.archive_path)
     
     @staticmethod
     def nearest_interval(dt_obj: datetime.datetime) -> datetime.datetime:
@@ -44,9 +74,9 @@ class VisualCrossingClient:
          return: a new datetime object at nearest 2 hour mark
         """
         if dt_obj.hour % 2 == 0:  # round down if even
-            return dt_obj.replace(minute=0, second=0)
-        else:  # round up if odd
-            return dt_obj.replace(hour=dt_obj.hour+1, minute=0, second=0)
+            return dt_obj.replace(minute=0, second=0, microsecond=0)
+        else:  # round up if odd. timedelta carries 23:00 over to the next day
+            return dt_obj.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
 
     def retrieve_daily_data(self, day: str) -> pd.DataFrame:
         """Interface with Visual Crossing API to retrieve data for a single day.
@@ -55,7 +85,17 @@ class VisualCrossingClient:
         :return: weather data from VisualCrossing
         :raises requests.RequestException: if API request fails
         """
-        full_address = f"{self.BASE_ADDRESS}/{self.zipcode}/{day}"
+        return self.retrieve_range(day, day)
+
+    def retrieve_range(self, start: str, end: str) -> pd.DataFrame:
+        """Interface with Visual Crossing API to retrieve every hour between two days in a single timeline request.
+
+        :param start: first day in YYYY-MM-DD format
+        :param end: last day in YYYY-MM-DD format (inclusive)
+        :return: weather data from VisualCrossing
+        :raises requests.RequestException: if API request fails after all retries
+        """
+        full_address = f"{self.base_address}/{self.zipcode}/{start}" if start == end else f"{self.base_address}/{self.zipcode}/{start}/{end}"
 
         params = {
             "key": self.api_key,
@@ -64,29 +104,87 @@ class VisualCrossingClient:
         }
 
         try:
-            response = requests.get(url=full_address, params=params)
+            start_time = time.perf_counter()
+            instrumentation.count("weather_api.calls")
+            response = self.session.get(url=full_address, params=params)
             response.raise_for_status()
+            instrumentation.record_latency("weather_api", time.perf_counter() - start_time)
 
-            df = pd.DataFrame(response.json()["days"][0]["hours"])
+            df = pd.DataFrame([hour for day in response.json()["days"] for hour in day["hours"]])
             df = df.rename(columns={"datetimeEpoch":"timestamp"})
             df["timestamp"] = df["timestamp"].apply(datetime.datetime.fromtimestamp) #convert unix time to dt_obj
 
             return df
 
         except requests.RequestException as e:
-            print(f"Error retrieving data from Visual Crossing server for {day}: {e}")
+            print(f"Error retrieving data from Visual Crossing server for {start} to {end}: {e}")
             raise
 
+    def group_days(self, days: list[str]) -> list[tuple[str, str]]:
+        """Combine consecutive days into ranges so each range needs a single request.
+
+        :param days: days in YYYY-MM-DD format
+        :return: first and last day of each range
+        """
+        dates = sorted({datetime.date.fromisoformat(day) for day in days})
+        ranges = []
+        for date in dates:
+            if ranges and (date - ranges[-1][1]).days == 1 and (date - ranges[-1][0]).days < self.max_days_per_request:
+                ranges[-1][1] = date
+            else:
+                ranges.append([date, date])
+        return [(start.isoformat(), end.isoformat()) for start, end in ranges]
+
+    def retrieve_days(self, days: list[str]) -> pd.DataFrame:
+        """Retrieve data for many days. Consecutive days are requested together and ranges are fetched concurrently.
+
+        :param days: days in YYYY-MM-DD format
+        :return: weather data from VisualCrossing
+        :raises requests.RequestException: if any request fails after all retries
+        """
+        ranges = self.group_days(days)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            results = list(executor.map(lambda day_range: self.retrieve_range(*day_range), ranges))
+        return pd.concat(results, ignore_index=True)
+
+    def _missing_days(self, intervals: pd.Series) -> np.ndarray[str]:
+        new_intervals = self.archive.missing(intervals.dropna(), self.data_type_list)
+        return new_intervals.dt.strftime("%Y-%m-%d").unique()
+
+    def _join_archive(self, user_data: pd.DataFrame, intervals: pd.Series, keep_interval: bool = False) -> pd.DataFrame:
+        """Pair each reading with the archived data of its interval in a single sorted join.
+
+        :param user_data: manual retrieved data
+        :param intervals: interval of each reading
+        :param keep_interval: keep the interval column in the output
+        :return: readings that have archived data, with the data types added
+        """
+        has_time = intervals.notna().to_numpy() # readings without a time can never be matched
+        readings = user_data[has_time].assign(interval=intervals[has_time].to_numpy())
+        readings = readings.reset_index(drop=True).rename_axis("_row").reset_index()
+        readings = readings.sort_values("interval", kind="stable")
+
+        if len(readings) == 0:
+            archived = pd.DataFrame(columns=["interval", *self.data_type_list])
+        else:
+            archived = self.archive.read(columns=self.data_type_list, start=readings["interval"].iloc[0], end=readings["interval"].iloc[-1])
+            archived = archived.rename(columns={"timestamp": "interval"})
+        archived["_archived"] = True
+        archived["interval"] = archived["interval"].astype(readings["interval"].dtype)
+
+        # exact matches only. a zero tolerance makes the as-of join behave as an inner join on the interval
+        enriched = pd.merge_asof(readings, archived, on="interval", direction="backward", tolerance=pd.Timedelta(0))
+        enriched = enriched[enriched["_archived"].notna()].sort_values("_row")
+        enriched = enriched.drop(columns=["_row", "_archived"] + ([] if keep_interval else ["interval"]))
+        return enriched.reset_index(drop=True)
+
     def determine_data_needs(self, user_timestamps: pd.Series) -> np.ndarray[str]:
         """Determine days lacking an entry in cached data from Visual Crossing.
 
         :param user_timestamps: timestamps present in latest collection of data
         :return: the days lacking data in visual crossing cache
         """
-        nearest_timestamps = user_timestamps.apply(self.nearest_interval)
-        new_intervals = nearest_timestamps[~nearest_timestamps.isin(self.archive["timestamp"])]
-        new_days = new_intervals.dt.strftime("%Y-%m-%d").unique()
-        return new_days
+        return self._missing_days(snap_to_interval(user_timestamps, self.interval_hours))
 
     def utilize_existing_cache(self, user_data: pd.DataFrame, time_col: str = "timestamp") -> pd.DataFrame:
         """Access and pair archived data.
@@ -95,47 +193,32 @@ class VisualCrossingClient:
         :param time_col: column name for time data
         :return: dataframe enriched with cached visual crossing data & missing datatypes
         """
-        user_data["interval"] = user_data[time_col].apply(self.nearest_interval)
-        enriched = pd.merge(user_data, self.archive, left_on="interval", right_on=time_col)
-
-        enriched = enriched.rename(columns={f"{time_col}_x":time_col})
-        enriched = enriched.drop(columns=["interval", f"{time_col}_y"])
-
-        return enriched
+        return self._join_archive(user_data, snap_to_interval(user_data[time_col], self.interval_hours))
 
-    def enrich(self, user_data: pd.DataFrame, time_col: str = "timestamp") -> pd.DataFrame:
+    def enrich(self, user_data: pd.DataFrame, time_col: str = "timestamp", keep_interval: bool = False) -> pd.DataFrame:
         """Pair manual data with data retrieved from Visual Crossing.
         
         :param user_data: most recent data collection
         :param time_col: column name for time data
-        :param data_types: weather elements to be retrieved from Visual Crossing. more options available at https://www.visualcrossing.com/resources/documentation/weather-api/timeline-weather-api/
+        :param keep_interval: keep the interval each reading was matched on as an "interval" column
         :return: user data with added data points from api service
         """
-        #Add cached data to current data set
-        old_data_enriched = self.utilize_existing_cache(user_data)
-
-        #Retrieve new Visual Crossing data
-        new_days = self.determine_data_needs(user_data[time_col])
-        if len(new_days) == 0: # end processing early when there is no new data 
-            return old_data_enriched
-
-        new_data =  pd.concat([self.retrieve_daily_data(day) for day in new_days], ignore_index=True)
-        self.update_archive(new_data)
+        with instrumentation.stage("enrich", items=len(user_data)):
+            intervals = snap_to_interval(user_data[time_col], self.interval_hours) # computed once and reused below
 
-        #Match new manual data to Visual Crossing Data
-        user_data["interval"] = user_data[time_col].apply(self.nearest_interval)
-        new_data_enriched = pd.merge(user_data, new_data, left_on="interval", right_on=time_col)
-        new_data_enriched = new_data_enriched.rename(columns={f"{time_col}_x":time_col})
-        new_data_enriched = new_data_enriched.drop(columns=["interval", f"{time_col}_y"])
+            #Retrieve new Visual Crossing data
+            new_days = self._missing_days(intervals)
+            instrumentation.count("weather_archive.hits", intervals.dropna().dt.normalize().nunique() - len(new_days))
+            instrumentation.count("weather_archive.misses", len(new_days))
+            if len(new_days) > 0:
+                self.update_archive(self.retrieve_days(new_days))
 
-        #Combine new and old
-        enriched_data = pd.concat([old_data_enriched, new_data_enriched], ignore_index=True)
-        return enriched_data
+            #Match manual data to Visual Crossing Data
+            return self._join_archive(user_data, intervals, keep_interval)
 
     def update_archive(self, new_data: pd.DataFrame) -> None:
         """Adds new data to the archive (reduces costs).
         
         :param new_data: new data
         """
-        self.archive = pd.concat([self.archive, new_data], ignore_index=True)
-        self.archive.to_csv(self.archive_path)
\ No newline at end of file
+        self.archive.append(new_data)
\ No newline at end of file
@@ -0,0 +1,167 @@
+import json, sqlite3
+import pandas as pd
+from pathlib import Path
+
+class WeatherArchive:
+    """
+    SQLite store of Visual Crossing data keyed by timestamp, with one column per weather data type.
+
+    Timestamps are stored as integer seconds in the table's primary key, so lookups only touch the rows
+    being asked about and new data is written without rewriting what is already archived. Numeric data types are
+    REAL columns and the others (conditions, icon, preciptype) are TEXT. Each row also records which data types were
+    retrieved for it, so a null returned by the API is never mistaken for data that was not requested.
+    """
+    TABLE = "weather"
+    RETRIEVED = "_retrieved" # comma separated data types requested when the row was written
+    BATCH_SIZE = 900 # stays under SQLite's limit on bound parameters per statement
+    NUMERIC_TYPES = ("floating", "integer", "mixed-integer-float", "decimal", "boolean", "empty") # pandas inferred types stored as REAL
+
+    def __init__(self, archive_path: Path):
+        """Open the archive, creating it when missing.
+
+        :param archive_path: disc location of the SQLite database
+        """
+        self.archive_path = archive_path
+        self.connection = sqlite3.connect(archive_path, check_same_thread=False)
+        self.connection.create_function("merge_retrieved", 2, self._merge_retrieved, deterministic=True)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} (timestamp INTEGER PRIMARY KEY, {self.RETRIEVED} TEXT)")
+        table_columns = [row[1] for row in self.connection.execute(f"PRAGMA table_info({self.TABLE})") if row[1] != "timestamp"]
+        self._columns = [column for column in table_columns if column != self.RETRIEVED] # read once. updated as columns are added
+        if self.RETRIEVED not in table_columns: # archives from before retrieval was tracked hold every type they have a column for
+            self.connection.execute(f"ALTER TABLE {self.TABLE} ADD COLUMN {self.RETRIEVED} TEXT")
+            self.connection.execute(f"UPDATE {self.TABLE} SET {self.RETRIEVED} = ?", (",".join(self._columns),))
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @property
+    def columns(self) -> list[str]:
+        """Weather data types stored in the archive."""
+        return list(self._columns)
+
+    @staticmethod
+    def _to_keys(timestamps: pd.Series) -> list[int]:
+        return pd.to_datetime(pd.Series(timestamps)).astype("datetime64[s]").astype("int64").tolist()
+
+    @classmethod
+    def _is_numeric(cls, values: pd.Series) -> bool:
+        return pd.api.types.infer_dtype(values, skipna=True) in cls.NUMERIC_TYPES
+
+    @classmethod
+    def _to_values(cls, values: pd.Series) -> list:
+        """Convert a column to values SQLite can store. Missing values become NULL and lists (preciptype) become JSON."""
+        if cls._is_numeric(values):
+            return [None if pd.isna(value) else float(value) for value in values]
+        return [
+            json.dumps(list(value)) if pd.api.types.is_list_like(value) else None if pd.isna(value) else str(value)
+            for value in values
+        ]
+
+    @staticmethod
+    def _merge_retrieved(existing: str | None, new: str) -> str:
+        """Combine the data types retrieved for a row earlier with those just written (SQL function merge_retrieved)."""
+        return ",".join(sorted((set((existing or "").split(",")) | set(new.split(","))) - {""}))
+
+    def _ensure_columns(self, new_data: pd.DataFrame, columns: list[str]) -> None:
+        for column in columns:
+            if column not in self._columns:
+                column_type = "REAL" if self._is_numeric(new_data[column]) else "TEXT"
+                self.connection.execute(f'ALTER TABLE {self.TABLE} ADD COLUMN "{column}" {column_type}')
+                self._columns.append(column)
+
+    def append(self, new_data: pd.DataFrame) -> None:
+        """Write new data. Rows for timestamps already archived are updated in place, keeping the data types not in new_data.
+
+        :param new_data: weather data with a timestamp column and one column per data type
+        """
+        columns = [column for column in new_data.columns if column not in ("timestamp", self.RETRIEVED)]
+        self._ensure_columns(new_data, columns)
+
+        retrieved = [",".join(sorted(columns))] * len(new_data)
+        rows = zip(self._to_keys(new_data["timestamp"]), retrieved, *(self._to_values(new_data[column]) for column in columns))
+        column_list = ", ".join(["timestamp", self.RETRIEVED, *(f'"{column}"' for column in columns)])
+        placeholders = ", ".join("?" * (len(columns) + 2))
+        # types written earlier keep their values, so they stay retrieved
+        updates = ", ".join([f"{self.RETRIEVED} = merge_retrieved({self.RETRIEVED}, excluded.{self.RETRIEVED})",
+                             *(f'"{column}" = excluded."{column}"' for column in columns)])
+        conflict = f"ON CONFLICT(timestamp) DO UPDATE SET {updates}"
+
+        with self.connection:
+            self.connection.executemany(f"INSERT INTO {self.TABLE} ({column_list}) VALUES ({placeholders}) {conflict}", rows)
+
+    def _select(self, columns: list[str], keys: list[int] | None, start: int | None, end: int | None) -> list[tuple]:
+        column_list = ", ".join(["timestamp", *(f'"{column}"' for column in columns)])
+        query = f"SELECT {column_list} FROM {self.TABLE} WHERE 1 = 1"
+        params = []
+        if start is not None:
+            query += " AND timestamp >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND timestamp <= ?"
+            params.append(end)
+        if keys is None:
+            return self.connection.execute(query + " ORDER BY timestamp", params).fetchall()
+
+        rows = []
+        for i in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[i:i + self.BATCH_SIZE]
+            batch_query = query + f" AND timestamp IN ({', '.join('?' * len(batch))})"
+            rows.extend(self.connection.execute(batch_query, params + batch).fetchall())
+        return sorted(rows)
+
+    def read(self, columns: list[str] | None = None, timestamps: pd.Series | None = None,
+             start: pd.Timestamp | None = None, end: pd.Timestamp | None = None) -> pd.DataFrame:
+        """Read archived data. Only the requested columns and rows are loaded.
+
+        :param columns: data types to read (defaults to all)
+        :param timestamps: exact timestamps to read (defaults to all)
+        :param start: earliest timestamp to read
+        :param end: latest timestamp to read
+        :return: weather data sorted by timestamp
+        """
+        columns = self.columns if columns is None else [column for column in columns if column in self.columns]
+        keys = None if timestamps is None else sorted(set(self._to_keys(timestamps)))
+        start_key = None if start is None else self._to_keys([start])[0]
+        end_key = None if end is None else self._to_keys([end])[0]
+
+        data = pd.DataFrame(self._select(columns, keys, start_key, end_key), columns=["timestamp", *columns])
+        data["timestamp"] = pd.to_datetime(data["timestamp"].astype("int64"), unit="s")
+        return data
+
+    def missing(self, timestamps: pd.Series, columns: list[str] | None = None) -> pd.Series:
+        """Find timestamps lacking an entry in the archive.
+
+        A timestamp counts as archived when its row exists and every requested data type was retrieved for it, even if
+        the API returned null for some of them.
+
+        :param timestamps: timestamps that need data
+        :param columns: data types that must have been retrieved for a timestamp to count as archived
+        :return: unique timestamps that have no archived data
+        """
+        timestamps = pd.Series(pd.to_datetime(pd.Series(timestamps)).unique())
+        columns = columns or []
+        if any(column not in self._columns for column in columns):
+            return timestamps # a requested data type has never been retrieved
+
+        needed = set(columns)
+        rows = self._select([self.RETRIEVED], sorted(set(self._to_keys(timestamps))), None, None)
+        found = [key for key, retrieved in rows if needed.issubset((retrieved or "").split(","))]
+        return timestamps[~timestamps.isin(pd.to_datetime(found, unit="s"))].reset_index(drop=True)
+
+def migrate_csv(csv_path: Path, archive_path: Path | None = None) -> WeatherArchive:
+    """Load an api_archive.csv written by earlier versions into a SQLite archive.
+
+    :param csv_path: disc location of the CSV archive
+    :param archive_path: disc location of the new archive (defaults to the CSV path with a .sqlite suffix)
+    :return: the populated archive
+    """
+    archive = WeatherArchive(archive_path or csv_path.with_suffix(".sqlite"))
+    legacy = pd.read_csv(csv_path)
+    legacy = legacy.drop(columns="Unnamed: 0", errors="ignore")
+    legacy["timestamp"] = pd.to_datetime(legacy["timestamp"])
+    archive.append(legacy)
+    return archive